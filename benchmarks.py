@@ -0,0 +1,266 @@
+'''
+Benchmarks for Coloring Squares.
+
+Times the busiest parts of the game at a few grid sizes, without opening a
+window: drawing goes through the counting stand-ins of StandInArcade. Drawing
+only ever draws the cells in view, so it is timed once, at the view size.
+
+    python benchmarks.py                            prints the results
+    python benchmarks.py --save baseline.json       also keeps them in a file
+    python benchmarks.py --compare baseline.json    fails if anything is slower
+
+The results are the seconds one call takes (the best of a few tries), so
+smaller is better. A comparison fails when a benchmark takes more than
+--tolerance longer than in the baseline.
+'''
+
+import argparse, json, platform, sys, timeit
+import numpy
+from csquares_src import StandInArcade, compile_type, _validate_type
+import csquares
+from csquares import (World, INITIAL_WORLD, BOX_WIDTH,
+                      make_grid_color, draw_grid, update_world, handle_mouse,
+                      ChunkRenderer, History)
+
+SIZES = [25, 250, 2500]
+# The same as the World, but with the grid as a plain list of lists, which is
+# what _validate_type has to go through cell by cell
+LIST_WORLD = dict(World, grid=[[str]])
+
+def make_world(size: int, grid: [[str]] = None) -> dict:
+    '''
+    Makes a fresh world for the game, with a grid of the given size.
+
+    Args:
+        size (int): The number of cells in each row and column.
+        grid ([[str]]): The grid to use, instead of a new ChunkedGrid.
+    Returns:
+        dict: The world.
+    '''
+    world = dict(INITIAL_WORLD, grid=grid, history=History(), stroke=[])
+    if grid is None:
+        world['grid'] = make_grid_color(size, size, 'white', chunked=True)
+        world['history'].attach(world['grid'])
+    return world
+
+def scatter(world: dict, count: int, seed: int = 0):
+    '''
+    Paints some random cells in view, so drawing has something to show.
+
+    Args:
+        world (dict): The world.
+        count (int): How many cells to paint.
+        seed (int): The random seed.
+    '''
+    rng = numpy.random.default_rng(seed)
+    grid = world['grid']
+    width, height = len(grid[0]), len(grid)
+    xs = rng.integers(0, min(width, 100), count)
+    ys = rng.integers(0, min(height, 100), count)
+    grid.paint_cells(xs, ys, 'blue')
+
+def bench_make_grid_color(size: int):
+    return lambda: make_grid_color(size, size, 'white')
+
+# The drawing benchmarks draw the view, which is the same size however big
+# the grid is (draw_grid skips the chunks outside it)
+def bench_draw_grid(size: int):
+    # One frame of drawing after a short stroke, the usual case
+    world = make_world(size)
+    scatter(world, 500)
+    grid = world['grid']
+    draw_grid(grid)
+    xs = numpy.arange(20)
+    colors = ['red', 'green']
+    def run():
+        grid.paint_cells(xs, xs, colors[grid.generation % 2])
+        draw_grid(grid)
+    return run
+
+def bench_draw_grid_first(size: int):
+    # Drawing the view from scratch, the way a newly loaded canvas is drawn
+    world = make_world(size)
+    scatter(world, 500)
+    def run():
+        csquares.CHUNK_RENDERER = ChunkRenderer()
+        draw_grid(world['grid'])
+    return run
+
+def bench_validate_type(size: int):
+    world = make_world(size, make_grid_color(size, size, 'white'))
+    return lambda: _validate_type(world, LIST_WORLD)
+
+def bench_compiled_check(size: int):
+    world = make_world(size, make_grid_color(size, size, 'white'))
+    check = compile_type(LIST_WORLD)
+    return lambda: check(world)
+
+def bench_handle_mouse(size: int):
+    # Clicks on every color of the palette bar, and on the canvas
+    world = make_world(size)
+    clicks = [(BOX_WIDTH * (index + 0.5), 470) for index in range(8)]
+    clicks += [(250, 250), (100, 300)]
+    def run():
+        for x, y in clicks:
+            handle_mouse(world, x, y, 'left')
+    return run
+
+def bench_stroke(size: int):
+    # A stroke across the whole grid and back, painted by one update
+    world = make_world(size)
+    points = [[0, 0], [size - 1, size - 1], [0, size - 1], [size - 1, 0]]
+    colors = ['red', 'green']
+    def run():
+        world['color'] = colors[world['grid'].generation % 2]
+        world['stroke'] = [list(point) for point in points]
+        world['last stroke x'] = world['last stroke y'] = None
+        update_world(world)
+    return run
+
+def bench_brush_stroke(size: int):
+    # One update of a 64 square wide round brush dragged quickly: 200 squares
+    # of the stroke in a single frame
+    world = make_world(size)
+    world['brush'], world['brush size'] = 'circle', 64
+    colors = ['red', 'green']
+    def run():
+        start = world['grid'].generation % max(size - 200, 1)
+        world['color'] = colors[world['grid'].generation % 2]
+        world['stroke'] = [[start, size // 2], [start + 200, size // 2 + 50]]
+        world['last stroke x'] = world['last stroke y'] = None
+        update_world(world)
+    return run
+
+def bench_snapshot(size: int):
+    # What autosaving costs a frame: a snapshot, then the first stroke after
+    # it, which has to copy the chunks it paints in
+    world = make_world(size)
+    scatter(world, 500)
+    grid = world['grid']
+    xs = numpy.arange(20)
+    def run():
+        grid.snapshot()
+        grid.paint_cells(xs, xs, 'red' if grid.generation % 2 else 'green')
+    return run
+
+def bench_stats(size: int):
+    # Polling the canvas stats every frame, with a short stroke in between
+    world = make_world(size)
+    scatter(world, 500)
+    grid = world['grid']
+    stats = csquares.canvas_stats(grid)
+    xs = numpy.arange(20)
+    def run():
+        grid.paint_cells(xs, xs, 'red' if grid.generation % 2 else 'green')
+        stats.report()
+    return run
+
+BENCHMARKS = [
+    ('make_grid_color', bench_make_grid_color),
+    ('_validate_type', bench_validate_type),
+    ('compiled check', bench_compiled_check),
+    ('handle_mouse', bench_handle_mouse),
+    ('stroke', bench_stroke),
+    ('brush stroke', bench_brush_stroke),
+    ('autosave snapshot', bench_snapshot),
+    ('canvas stats', bench_stats),
+]
+# The benchmarks only timed once, on the biggest grid, named like 'draw_grid[view]'
+VIEW_BENCHMARKS = [
+    ('draw_grid', bench_draw_grid),
+    ('draw_grid first', bench_draw_grid_first),
+]
+
+def measure(run, repeat: int) -> float:
+    '''
+    Times a function, calling it enough times in a row to get past the
+    clock's resolution.
+
+    Args:
+        run (->None): The function to time.
+        repeat (int): How many tries to take the best of.
+    Returns:
+        float: The seconds one call takes.
+    '''
+    timer = timeit.Timer(run)
+    number, seconds = timer.autorange()
+    tries = [seconds] + timer.repeat(repeat - 1, number)
+    return min(tries) / number
+
+def run_benchmarks(sizes: [int], repeat: int = 3, only: str = None) -> {str: float}:
+    '''
+    Runs every benchmark at every size, and the drawing benchmarks once.
+
+    Args:
+        sizes ([int]): The grid sizes.
+        repeat (int): How many tries to take the best of.
+        only (str): If given, only the benchmarks with this in their name.
+    Returns:
+        {str: float}: The seconds per call, by names like 'stroke[250]'.
+    '''
+    runs = [(name, setup, size, size) for name, setup in BENCHMARKS for size in sizes]
+    runs += [(name, setup, max(sizes), 'view') for name, setup in VIEW_BENCHMARKS]
+    results = {}
+    # 'draw_grid first' swaps in new renderers, the game's own is put back after
+    renderer = csquares.CHUNK_RENDERER
+    try:
+        with StandInArcade():
+            for name, setup, size, label in runs:
+                if only and only not in name:
+                    continue
+                key = '{}[{}]'.format(name, label)
+                results[key] = measure(setup(size), repeat)
+                print('{:<28}{:>14.6f} ms'.format(key, results[key] * 1000), flush=True)
+    finally:
+        csquares.CHUNK_RENDERER = renderer
+    return results
+
+def compare(results: {str: float}, baseline: {str: float}, tolerance: float) -> [str]:
+    '''
+    Finds the benchmarks that got slower than the baseline allows.
+
+    Args:
+        results ({str: float}): The new results.
+        baseline ({str: float}): The old results.
+        tolerance (float): How much slower is still fine (0.25 is 25%).
+    Returns:
+        [str]: A line describing each benchmark that got too slow.
+    '''
+    slower = []
+    for key, seconds in results.items():
+        if key in baseline and seconds > baseline[key] * (1 + tolerance):
+            slower.append('{}: {:.6f} ms, was {:.6f} ms ({:+.0%})'.format(
+                key, seconds * 1000, baseline[key] * 1000, seconds / baseline[key] - 1))
+    return slower
+
+def main(arguments: [str]) -> int:
+    parser = argparse.ArgumentParser(description='Coloring Squares benchmarks')
+    parser.add_argument('--sizes', type=int, nargs='+', default=SIZES,
+                        help='the grid sizes to run at')
+    parser.add_argument('--repeat', type=int, default=3,
+                        help='how many tries to take the best of')
+    parser.add_argument('--only', help='only run the benchmarks with this in their name')
+    parser.add_argument('--save', metavar='FILE', help='write the results to FILE')
+    parser.add_argument('--compare', metavar='FILE',
+                        help='fail if anything is slower than the results in FILE')
+    parser.add_argument('--tolerance', type=float, default=0.25,
+                        help='how much slower than the baseline is still fine')
+    arguments = parser.parse_args(arguments)
+    results = run_benchmarks(arguments.sizes, arguments.repeat, arguments.only)
+    if arguments.save:
+        with open(arguments.save, 'w') as baseline_file:
+            json.dump({'python': platform.python_version(), 'machine': platform.machine(),
+                       'results': results}, baseline_file, indent=2, sort_keys=True)
+    if arguments.compare:
+        with open(arguments.compare) as baseline_file:
+            baseline = json.load(baseline_file)['results']
+        slower = compare(results, baseline, arguments.tolerance)
+        for line in slower:
+            print('SLOWER', line)
+        if slower:
+            return 1
+        print('No benchmark is more than {:.0%} slower than the baseline'.format(arguments.tolerance))
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -7,16 +7,39 @@ Change log:
 '''
 __VERSION__ = '0.0.2'
 
-import arcade, math, random
-from csquares_src import Cisc108Game
+import arcade, math, random, numpy, time, sys, argparse, os, itertools, threading
+from collections.abc import Mapping
+from csquares_src import Cisc108Game, HeadlessRunner, FrameTimer, EventRecorder, make_scribble
+from csquares_grid import (Grid, PaletteGrid, ChunkedGrid, TrackedGrid, PALETTE,
+                           PALETTE_INDEX, COLOR_VALUES, PALETTE_VALUES, CHUNK_SIZE, BRUSHES,
+                           SHAPES, shape_points, shape_cells,
+                           color_index, custom_color, make_grid_color, screen_to_grid,
+                           palette_indexes, palette_region, stroke_cells, brush_cells,
+                           flood_cells, canvas_stats)
+from csquares_io import save_grid, load_grid
+from csquares_export import export_png
+from csquares_import import picture_indexes
+from csquares_history import History, step_cells
+from csquares_share import SharedCanvas
+from csquares_autosave import Autosaver, restore
 
 '''
 COLORING SQUARES - CONTROLS
 
-# Left click on a color in the palette to use that color on the drawing grid. (Press the 'a' or 'b' keys to access extra colors.)
+# Left click on a color in the palette to use that color on the drawing grid. (Press the 'a' or 'b' keys to access extra colors, or 'c' for a random color of your own.)
 # Right click to toggle "drawing mode" on and off.
 # Left click on the trash icon to reset the grid back to white.
 # Left click on the eraser to use the eraser.
+# Press 's' to save the drawing, and 'l' to load it back.
+# Press 'e' to export the painted part of the canvas as a PNG picture.
+# Press 'i' to bring in the picture in picture.png, over the part of the canvas in view.
+# Press '1', '2' or '3' for a square, round or spray brush, and '[' or ']' to make it smaller or bigger.
+# Press 'n', 'r' or 'o' to draw lines, rectangles or ellipses: click once to start the shape and again to finish it.
+# Press 'z' to undo, and 'y' to redo.
+# Press 'h' to show (or hide) how much of the canvas is painted, in the palette bar.
+# Left click on the paint bucket to switch between filling and drawing. While
+# filling, left click on the grid to fill that area with the current color.
+# Use the arrow keys to move around the canvas, and '=' and '-' to zoom in and out.
 '''
 ################################################################################
 ## Game Constants
@@ -26,77 +49,210 @@ WINDOW_HEIGHT = 500
 BACKGROUND_COLOR = arcade.color.WHITE
 GAME_TITLE = "Coloring Squares"
 
-# The amount of squares in the grid, horizontally and vertically.
+# The amount of squares that fit in the window, horizontally and vertically,
+# when it isn't zoomed in or out.
 GRID_WIDTH = 25
 GRID_HEIGHT = 25
+# The amount of squares in the whole canvas, horizontally and vertically.
+CANVAS_WIDTH = 10000
+CANVAS_HEIGHT = 10000
 # Size of one square on the grid.
 SQUARE_SIZE = 20
+# How far the view can be zoomed out and in (1 shows GRID_WIDTH squares)
+MIN_ZOOM = 0.25
+MAX_ZOOM = 4
+# How many chunks of squares are kept ready to draw, besides those in view
+CHUNK_LAYERS_KEPT = 64
 # Size of boxes for color pallete
 BOX_WIDTH = 62.5
 # For the color palette
 WINDOW_CENTER_X = int(WINDOW_WIDTH/2)
+# Where the drawing is saved to and loaded from
+SAVE_FILE = 'canvas.csq'
+# Where the drawing is exported to as a picture, and how many pixels wide
+# and high each square is in it
+EXPORT_FILE = 'canvas.png'
+EXPORT_SCALE = 2
+# The picture that can be brought into the drawing
+IMPORT_FILE = 'picture.png'
+# How many straight pieces the preview of an ellipse is drawn with
+PREVIEW_SEGMENTS = 64
+# The brush sizes '[' and ']' step through
+BRUSH_SIZES = [1, 2, 4, 8, 16, 32, 64]
+# Where the canvas stats are written in the palette bar, between the tool
+# icons, and how big
+STATS_X = 155
+STATS_Y = 35
+STATS_FONT_SIZE = 10
+# Where the drawing is autosaved to, at most how many seconds apart, and
+# after how many changes it is saved sooner
+AUTOSAVE_FILE = 'canvas.autosave.csq'
+AUTOSAVE_SECONDS = 30
+AUTOSAVE_CHANGES = 1000
 
-# The different colors that will be accessible on the palette.
-RED = arcade.make_soft_square_texture(SQUARE_SIZE, arcade.color.RED, 255, 255)
-ORANGE = arcade.make_soft_square_texture(SQUARE_SIZE, arcade.color.ORANGE, 255, 255)
-YELLOW = arcade.make_soft_square_texture(SQUARE_SIZE, arcade.color.YELLOW, 255, 255)
-GREEN = arcade.make_soft_square_texture(SQUARE_SIZE, arcade.color.GREEN, 255, 255)
-BLUE = arcade.make_soft_square_texture(SQUARE_SIZE, arcade.color.BLUE, 255, 255)
-PURPLE = arcade.make_soft_square_texture(SQUARE_SIZE, arcade.color.PURPLE, 255, 255)
-MAGENTA = arcade.make_soft_square_texture(SQUARE_SIZE, arcade.color.MAGENTA, 255, 255)
-BLACK = arcade.make_soft_square_texture(SQUARE_SIZE, arcade.color.BLACK, 255, 255)
-WHITE = arcade.make_soft_square_texture(SQUARE_SIZE, arcade.color.WHITE, 255, 255)
-APRICOT = arcade.make_soft_square_texture(SQUARE_SIZE, arcade.color.APRICOT, 255, 255)
-BROWN = arcade.make_soft_square_texture(SQUARE_SIZE, arcade.color.BROWN, 255, 255)
+class TextureCache:
+    '''
+    Loads every image file only once, so drawing never has to read or decode
+    a file. It also keeps count of how often that saved us the work.
+    
+    The plain colored squares are kept here too. Each one is only made the
+    first time it is asked for, instead of all of them when the game starts.
+    The grid renderers tint a single white square to any color, so only a
+    few squares are ever made and they are all kept.
+    
+    Attributes:
+        textures ({str: arcade.Texture}): The loaded textures by file name.
+        squares ({str: arcade.Texture}): The squares by color.
+        hits (int): How many times a texture was already loaded.
+        misses (int): How many times a texture had to be loaded.
+        load_time (float): The total number of seconds spent loading.
+    '''
+    def __init__(self):
+        self.textures = {}
+        self.squares = {}
+        self.hits = 0
+        self.misses = 0
+        self.load_time = 0.0
+    
+    def preload(self, filenames: [str]):
+        '''
+        Loads the given image files now, before they are needed.
+        
+        Args:
+            filenames ([str]): The image files to load.
+        '''
+        for filename in filenames:
+            if filename not in self.textures:
+                self._load(filename)
+    
+    def get(self, filename: str) -> arcade.Texture:
+        '''
+        Gives back the texture for an image file, loading it only if this is
+        the first time it is asked for.
+        
+        Args:
+            filename (str): The image file to get.
+        Returns:
+            arcade.Texture: The texture of the image.
+        '''
+        texture = self.textures.get(filename)
+        if texture is None:
+            self.misses += 1
+            return self._load(filename)
+        self.hits += 1
+        return texture
+    
+    def square(self, color: str) -> arcade.Texture:
+        '''
+        Gives back a square of a single color, SQUARE_SIZE wide, making it
+        only if it isn't kept already.
+        
+        Args:
+            color (str): The color of the square (a PALETTE color or '#rrggbb').
+        Returns:
+            arcade.Texture: The texture of the square.
+        '''
+        texture = self.squares.get(color)
+        if texture is None:
+            self.misses += 1
+            start = time.perf_counter()
+            value = PALETTE_VALUES[color_index(color)]
+            texture = arcade.make_soft_square_texture(SQUARE_SIZE, value, 255, 255)
+            self.load_time += time.perf_counter() - start
+            self.squares[color] = texture
+            return texture
+        self.hits += 1
+        return texture
+    
+    def _load(self, filename: str) -> arcade.Texture:
+        start = time.perf_counter()
+        texture = arcade.load_texture(filename)
+        self.load_time += time.perf_counter() - start
+        self.textures[filename] = texture
+        return texture
+    
+    def report(self) -> {str: float}:
+        '''
+        Sums up how the cache has been doing.
+        
+        Returns:
+            {str: float}: The hits, misses, number of loaded textures and
+            seconds spent loading.
+        '''
+        return {'hits': self.hits, 'misses': self.misses,
+                'loaded': len(self.textures) + len(self.squares),
+                'load time': self.load_time}
+
+# Every image file and colored square the game draws goes through this cache
+TEXTURES = TextureCache()
+
+class ColorSquares(Mapping):
+    '''
+    The square of each of the palette colors the game started with, by name,
+    like COLORS['red']. The squares come from TEXTURES, so each one is only
+    made the first time it is looked up.
+    '''
+    NAMES = ['red', 'orange', 'yellow', 'green', 'blue', 'purple', 'magenta',
+             'black', 'white', 'apricot', 'brown']
+    
+    def __getitem__(self, color: str) -> arcade.Texture:
+        if color not in self.NAMES:
+            raise KeyError(color)
+        return TEXTURES.square(color)
+    
+    def __iter__(self):
+        return iter(self.NAMES)
+    
+    def __len__(self) -> int:
+        return len(self.NAMES)
 
 # All colors in a dictionary
-COLORS = {
-    'red': RED,
-    'orange': ORANGE,
-    'yellow': YELLOW,
-    'green': GREEN,
-    'blue': BLUE,
-    'purple': PURPLE,
-    'magenta': MAGENTA,
-    'black': BLACK,
-    'white': WHITE,
-    'apricot': APRICOT,
-    'brown': BROWN
-}
-####################################################################
- ##Helper functions
-def make_grid_color(width: int, height: int, color: str) -> [[str]]:
+COLORS = ColorSquares()
+
+def __getattr__(name: str) -> arcade.Texture:
     '''
-    Make a 2D list (list of lists) of the given width and height,
-    where every cell has the given color.
+    Gives the squares the module used to make when it was imported (RED,
+    ORANGE and so on up to BROWN), making them only when they are asked for.
     
     Args:
-        width (int): The number of elements in each row.
-        height (int): The number of rows.
-        color (str): The color string to put in each cell.
+        name (str): The name looked up on the module.
     Returns:
-        
+        arcade.Texture: The square of that color.
+    Raises:
+        AttributeError: If the name isn't one of the colors.
     '''
-    grid = []
-    # y will be 0..height
-    for y in range(height):
-        row = []
-        # x will be 0..width
-        for x in range(width):
-            # Add this cell to the row
-            row.append(color)
-        # Add this row to the grid
-        grid.append(row)
-    return grid
+    if name.isupper() and name.lower() in COLORS:
+        return COLORS[name.lower()]
+    raise AttributeError("module {!r} has no attribute {!r}".format(__name__, name))
+# The icons of the palette bar: the image file and the x-coordinate of the
+# center of each. They all sit at the bottom of the window.
+TOOL_ICONS = [('garbage.png', 40), ('bucket.png', 120), ('eraser.png', 460)]
+ICON_WIDTH = 59.5
+ICON_HEIGHT = 62.5
+ICON_Y = 40
+# The icons for the palette bar, loaded before the window opens
+ICON_FILES = [filename for filename, center_x in TOOL_ICONS]
+####################################################################
+ ##Helper functions
+# make_grid_color and screen_to_grid are in csquares_grid, so that tools and
+# tests can use them without loading arcade.
 ################################################################################
 ## Record definitions
 
 World = {
-    # A list of lists of strings representing a 2D grid of colors
-    'grid': [[str]],
+    # A 2D grid of colors, stored as one palette index per cell in chunks
+    # that are only made once something is painted in them
+    'grid': ChunkedGrid,
     # These keep track of the latest mouse position within the grid.
     'current mouse x': int,
     'current mouse y': int,
+    # The grid positions ([x, y]) the mouse moved through while drawing,
+    # waiting to be painted by the next update.
+    'stroke': [[int]],
+    # The grid position the stroke was last painted up to, so the next
+    # update can carry on from there.
+    'last stroke x': int,
+    'last stroke y': int,
     # The current list we are displaying to the player.
     'values': [int],
     # The index that the player should click
@@ -106,19 +262,57 @@ World = {
     # Indicates whether drawing mode is on or off
     'draw': bool,
     # Indicates the current color being used on the grid
-    'color': str
+    'color': str,
+    # The changes to the grid that can be undone and redone
+    'history': History,
+    # What left clicking on the grid does: 'pen', 'fill' or one of the SHAPES
+    'tool': str,
+    # Where the shape being drawn starts and (for now) ends, as [x, y] grid
+    # positions. Both are empty while no shape is started.
+    'shape start': [int],
+    'shape end': [int],
+    # The shape of the pen (one of BRUSHES) and how many squares wide it is
+    'brush': str,
+    'brush size': int,
+    # The grid position at the bottom left corner of the window
+    'view x': float,
+    'view y': float,
+    # How much bigger the squares are drawn than SQUARE_SIZE
+    'zoom': float,
+    # The connection to the canvas server when painting together (or None)
+    'share': SharedCanvas,
+    # Keeps a copy of the drawing in AUTOSAVE_FILE (or None)
+    'autosave': Autosaver,
+    # Whether the palette bar shows how much of the canvas is painted
+    'show stats': bool
 }
 
 INITIAL_WORLD = {
-    'grid': make_grid_color(GRID_WIDTH, GRID_HEIGHT, 'white'),
+    'grid': make_grid_color(CANVAS_WIDTH, CANVAS_HEIGHT, 'white', chunked=True),
     'current mouse x': None,
     'current mouse y': None,
+    'stroke': [],
+    'last stroke x': None,
+    'last stroke y': None,
     'values': [1],
     'target': 0,
     'hovering': None,
     'draw': False,
-    'color': 'red'
+    'color': 'red',
+    'history': History(),
+    'tool': 'pen',
+    'shape start': [],
+    'shape end': [],
+    'brush': 'square',
+    'brush size': 1,
+    'view x': 0.0,
+    'view y': 0.0,
+    'zoom': 1.0,
+    'share': None,
+    'autosave': None,
+    'show stats': False
 }
+INITIAL_WORLD['history'].attach(INITIAL_WORLD['grid'])
 ################################################################################
 # Drawing functions
 def make_grid_white(world: World):
@@ -128,7 +322,14 @@ def make_grid_white(world: World):
     Args:
         world (World): The current world to draw.
     '''
-    world['grid'] = make_grid_color(GRID_WIDTH, GRID_HEIGHT, 'white')
+    grid = world['grid']
+    if isinstance(grid, TrackedGrid):
+        # Clearing in place lets the drawing code know every cell changed
+        grid.fill('white')
+        if world.get('share') is not None:
+            world['share'].send_clear('white')
+    else:
+        world['grid'] = make_grid_color(CANVAS_WIDTH, CANVAS_HEIGHT, 'white', chunked=True)
 
 def draw_world(world: World):
     """
@@ -137,31 +338,310 @@ def draw_world(world: World):
     Args:
         world (World): The current world to draw
     """
-    draw_grid(world['grid'])
-    draw_boxes(world['values'], world['hovering'])
-def draw_grid(grid: [[str]]):
+    draw_grid(world['grid'], world['view x'], world['view y'], world['zoom'])
+    if world['shape start']:
+        draw_shape_preview(world)
+    draw_boxes(world['values'], world['hovering'], world['tool'])
+    if world.get('show stats'):
+        draw_stats(world)
+def draw_grid(grid: [[str]], view_x: float = 0.0, view_y: float = 0.0, zoom: float = 1.0):
     '''
     Draw the 2D list of colors horizontally and vertically, turning
     the string colors into the actual colored squares.
     
+    The squares are kept in a GridRenderer (or a ChunkRenderer for a
+    ChunkedGrid) between frames, so they are drawn with batched calls.
+    Moving and zooming the view only changes what part of the drawing the
+    window shows, the squares themselves stay where they are.
+    
+    Args:
+        grid ([[str]]): The list of lists (a 2-Dimensional list) of colors.
+        view_x (float): The grid position at the left side of the window.
+        view_y (float): The grid position at the bottom of the window.
+        zoom (float): How much bigger the squares are drawn than SQUARE_SIZE.
+    '''
+    left, bottom = view_x * SQUARE_SIZE, view_y * SQUARE_SIZE
+    arcade.set_viewport(left, left + WINDOW_WIDTH/zoom, bottom, bottom + WINDOW_HEIGHT/zoom)
+    if isinstance(grid, ChunkedGrid):
+        CHUNK_RENDERER.draw(grid, *view_cells(view_x, view_y, zoom))
+    else:
+        get_grid_renderer(grid).draw(grid)
+    # The palette bar is drawn over the window as usual
+    arcade.set_viewport(0, WINDOW_WIDTH, 0, WINDOW_HEIGHT)
+
+def draw_shape_preview(world: World):
+    '''
+    Draws the shape being made on top of the grid, as a plain line strip
+    through the middle of its squares. The grid isn't touched until the
+    shape is finished, and the preview costs the same however big it is.
+    
+    Args:
+        world (World): The current world to draw.
+    '''
+    (x0, y0), (x1, y1) = world['shape start'], world['shape end']
+    points = [(x*SQUARE_SIZE + SQUARE_SIZE/2, y*SQUARE_SIZE + SQUARE_SIZE/2)
+              for x, y in shape_points(world['tool'], x0, y0, x1, y1, PREVIEW_SEGMENTS)]
+    zoom = world['zoom']
+    left, bottom = world['view x'] * SQUARE_SIZE, world['view y'] * SQUARE_SIZE
+    arcade.set_viewport(left, left + WINDOW_WIDTH/zoom, bottom, bottom + WINDOW_HEIGHT/zoom)
+    arcade.draw_line_strip(points, PALETTE_VALUES[color_index(world['color'])],
+                           SQUARE_SIZE * world['brush size'])
+    arcade.set_viewport(0, WINDOW_WIDTH, 0, WINDOW_HEIGHT)
+
+def draw_stats(world: World):
+    '''
+    Writes how much of the canvas is painted, with how many colors and over
+    how big an area, in the palette bar. The grid keeps the counts up to
+    date as it changes, so this costs the same however big the canvas is.
+    
+    Args:
+        world (World): The current world to draw.
+    '''
+    arcade.draw_text(stats_text(world['grid']), STATS_X, STATS_Y,
+                     arcade.color.BLACK, STATS_FONT_SIZE)
+
+def stats_text(grid: [[str]]) -> str:
+    '''
+    Describes the canvas stats in a few words.
+    
     Args:
         grid ([[str]]): The list of lists (a 2-Dimensional list) of colors.
-        world: The current world
-    '''
-    # We need to know the x and y to draw at.
-    # We could have also used the built-in enumerate function to get
-    # the x/y indexes of each cell.
-    # But instead, we'll use the counting pattern to calculate the x and y.
-    y = 0
-    for row in grid:
-        x = 0
-        for cell_color in row:
-            square_image = COLORS[cell_color]
-            arcade.draw_xywh_rectangle_textured(x*SQUARE_SIZE, y*SQUARE_SIZE,
-                                                SQUARE_SIZE, SQUARE_SIZE,
-                                                square_image)
-            x += 1
-        y += 1
+    Returns:
+        str: Something like '2.5% painted, 3 colors, 40x12'.
+    '''
+    stats = canvas_stats(grid)
+    bounds = stats.bounds()
+    area = '{}x{}'.format(bounds[2] - bounds[0], bounds[3] - bounds[1]) if bounds else 'empty'
+    return '{:.1f}% painted, {} colors, {}'.format(stats.coverage(), len(stats.color_counts()), area)
+
+def view_cells(view_x: float, view_y: float, zoom: float) -> (int, int, int, int):
+    '''
+    Finds the rectangle of grid positions that can be seen in the window.
+    
+    Args:
+        view_x (float): The grid position at the left side of the window.
+        view_y (float): The grid position at the bottom of the window.
+        zoom (float): How much bigger the squares are drawn than SQUARE_SIZE.
+    Returns:
+        int: The first column that can be seen.
+        int: The first row that can be seen.
+        int: The column after the last one that can be seen.
+        int: The row after the last one that can be seen.
+    '''
+    return (math.floor(view_x), math.floor(view_y),
+            math.ceil(view_x + GRID_WIDTH/zoom), math.ceil(view_y + GRID_HEIGHT/zoom))
+
+class GridRenderer:
+    '''
+    Keeps one sprite for every cell of the grid inside a single SpriteList.
+    The sprites are made once, and afterwards only the cells whose color
+    changed get updated before the whole list is drawn in one call.
+    
+    Args:
+        grid ([[str]]): The list of lists (a 2-Dimensional list) of colors.
+    
+    Attributes:
+        width (int): The number of cells in each row.
+        height (int): The number of rows.
+        sprites (arcade.SpriteList): One sprite per cell, row by row.
+        shown (numpy.ndarray): The palette indexes the sprites currently show.
+        drawn_grid (TrackedGrid): The tracked grid drawn last, if there was one.
+    '''
+    def __init__(self, grid: [[str]]):
+        self.drawn_grid = None
+        self.height = len(grid)
+        self.width = len(grid[0]) if grid else 0
+        self.sprites = arcade.SpriteList()
+        # Two bytes per cell, so custom colors fit without making a new array
+        self.shown = palette_indexes(grid).astype(numpy.uint16)
+        for y, row in enumerate(self.shown.tolist()):
+            for x, index in enumerate(row):
+                square = arcade.Sprite(center_x=x*SQUARE_SIZE + SQUARE_SIZE/2,
+                                       center_y=y*SQUARE_SIZE + SQUARE_SIZE/2)
+                # Every square shares the white texture and is tinted instead,
+                # so changing a color only touches that sprite's entry.
+                square.texture = TEXTURES.square('white')
+                square.color = PALETTE_VALUES[index]
+                self.sprites.append(square)
+    
+    def fits(self, grid: [[str]]) -> bool:
+        '''
+        Checks whether this renderer was made for a grid of the same size.
+        
+        Args:
+            grid ([[str]]): The list of lists (a 2-Dimensional list) of colors.
+        Returns:
+            bool: Whether the renderer can draw the given grid.
+        '''
+        return (len(grid) == self.height and
+                (len(grid[0]) if grid else 0) == self.width)
+    
+    def recolor(self, x: int, y: int, index: int):
+        '''
+        Changes the color one sprite shows.
+        
+        Args:
+            x (int): The column of the cell.
+            y (int): The row of the cell.
+            index (int): The palette index of the new color.
+        '''
+        self.sprites[y*self.width + x].color = PALETTE_VALUES[index]
+        self.shown[y, x] = index
+    
+    def update(self, grid: [[str]]):
+        '''
+        Recolors the sprites of the cells that changed since the last update.
+        A tracked grid tells us which cells those are, any other grid is
+        compared against the colors drawn last time.
+        
+        Args:
+            grid ([[str]]): The list of lists (a 2-Dimensional list) of colors.
+        '''
+        if isinstance(grid, TrackedGrid):
+            all_dirty, dirty = grid.take_dirty()
+            if grid is self.drawn_grid and not all_dirty:
+                for x, y in dirty:
+                    self.recolor(x, y, color_index(grid[y][x]))
+                return
+            self.drawn_grid = grid
+        else:
+            self.drawn_grid = None
+        indexes = palette_indexes(grid)
+        # Comparing the whole arrays at once finds the few changed cells quickly
+        for y, x in numpy.argwhere(indexes != self.shown).tolist():
+            self.recolor(x, y, indexes[y, x])
+    
+    def draw(self, grid: [[str]]):
+        '''
+        Brings the sprites up to date with the grid and draws all of them.
+        
+        Args:
+            grid ([[str]]): The list of lists (a 2-Dimensional list) of colors.
+        '''
+        self.update(grid)
+        self.sprites.draw()
+
+# The renderer used by draw_grid, made the first time the grid is drawn.
+_grid_renderer = None
+
+def get_grid_renderer(grid: [[str]]) -> GridRenderer:
+    '''
+    Gives back the GridRenderer for the grid, making a new one only when there
+    is none yet or the grid changed size.
+    
+    Args:
+        grid ([[str]]): The list of lists (a 2-Dimensional list) of colors.
+    Returns:
+        GridRenderer: The renderer to draw the grid with.
+    '''
+    global _grid_renderer
+    if _grid_renderer is None or not _grid_renderer.fits(grid):
+        _grid_renderer = GridRenderer(grid)
+    return _grid_renderer
+
+class ChunkRenderer:
+    '''
+    Draws a ChunkedGrid a chunk at a time, and only the chunks that can be
+    seen. Every chunk that has been made gets its own SpriteList of squares
+    (like a small GridRenderer) the first time it comes into view. Chunks
+    that were never painted get no sprites at all: a single rectangle of the
+    background color is drawn under everything instead.
+    
+    Attributes:
+        layers ({(int, int): (arcade.SpriteList, int)}): For each chunk with
+            sprites, the sprites (row by row) and how many there are per row.
+        drawn_grid (ChunkedGrid): The grid drawn last.
+    '''
+    def __init__(self):
+        self.layers = {}
+        self.drawn_grid = None
+    
+    def build(self, grid: ChunkedGrid, chunk_x: int, chunk_y: int) -> (arcade.SpriteList, int):
+        '''
+        Makes the sprites for the squares of one chunk.
+        
+        Args:
+            grid (ChunkedGrid): The grid.
+            chunk_x (int): The column of the chunk.
+            chunk_y (int): The row of the chunk.
+        Returns:
+            arcade.SpriteList: The sprites, row by row.
+            int: How many sprites there are in each row.
+        '''
+        left, bottom = chunk_x * CHUNK_SIZE, chunk_y * CHUNK_SIZE
+        indexes = grid.region(left, bottom, left + CHUNK_SIZE, bottom + CHUNK_SIZE)
+        sprites = arcade.SpriteList()
+        for y, row in enumerate(indexes.tolist(), bottom):
+            for x, index in enumerate(row, left):
+                square = arcade.Sprite(center_x=x*SQUARE_SIZE + SQUARE_SIZE/2,
+                                       center_y=y*SQUARE_SIZE + SQUARE_SIZE/2)
+                square.texture = TEXTURES.square('white')
+                square.color = PALETTE_VALUES[index]
+                sprites.append(square)
+        return sprites, indexes.shape[1]
+    
+    def update(self, grid: ChunkedGrid):
+        '''
+        Recolors the sprites of the cells that changed since the last update.
+        Cells in chunks without sprites are skipped, their sprites will be
+        made with the right colors when they come into view.
+        
+        Args:
+            grid (ChunkedGrid): The grid.
+        '''
+        all_dirty, dirty = grid.take_dirty()
+        if grid is not self.drawn_grid or all_dirty:
+            self.layers = {}
+            self.drawn_grid = grid
+            return
+        if not dirty:
+            return
+        # Working a chunk at a time means a big brush stroke only looks up
+        # each chunk and its colors once, instead of once per cell
+        cells = numpy.fromiter(itertools.chain.from_iterable(dirty), dtype=int, count=2 * len(dirty))
+        xs, ys = cells[0::2], cells[1::2]
+        for key, part in grid.chunk_parts(xs, ys):
+            layer = self.layers.get(key)
+            if layer is None:
+                continue
+            sprites, width = layer
+            positions = (ys[part] % CHUNK_SIZE) * width + xs[part] % CHUNK_SIZE
+            # Only reading, so a missing chunk isn't made and a snapshot's
+            # read-only chunk isn't copied
+            chunk = grid.chunks.get(key)
+            if chunk is None:
+                indexes = numpy.full(len(positions), grid.background)
+            else:
+                indexes = chunk[ys[part] % CHUNK_SIZE, xs[part] % CHUNK_SIZE]
+            for position, index in zip(positions.tolist(), indexes.tolist()):
+                sprites[position].color = PALETTE_VALUES[index]
+    
+    def draw(self, grid: ChunkedGrid, left: int, bottom: int, right: int, top: int):
+        '''
+        Brings the sprites up to date with the grid and draws the part of it
+        that can be seen.
+        
+        Args:
+            grid (ChunkedGrid): The grid.
+            left (int): The first column that can be seen.
+            bottom (int): The first row that can be seen.
+            right (int): The column after the last one that can be seen.
+            top (int): The row after the last one that can be seen.
+        '''
+        self.update(grid)
+        arcade.draw_lrtb_rectangle_filled(0, grid.width*SQUARE_SIZE, grid.height*SQUARE_SIZE, 0,
+                                          PALETTE_VALUES[grid.background])
+        visible = [key for key in grid.chunks_in(left, bottom, right, top) if key in grid.chunks]
+        for key in visible:
+            if key not in self.layers:
+                self.layers[key] = self.build(grid, *key)
+            self.layers[key][0].draw()
+        # Forget the sprites of chunks far away once there are too many
+        if len(self.layers) > CHUNK_LAYERS_KEPT + len(visible):
+            self.layers = {key: self.layers[key] for key in visible}
+
+# The renderer draw_grid uses for a ChunkedGrid
+CHUNK_RENDERER = ChunkRenderer()
 
 ################################################################################
 # World manipulating functions
@@ -173,13 +653,75 @@ def update_world(world: World):
     Args:
         world (World): The current world to update.
     """
-    # We get the current mouse position
-    grid_x = world['current mouse x']
-    grid_y = world['current mouse y']
-    # Is the mouse on a grid cell?
-    if grid_x != None and grid_y != None:
-        advance_grid_cell_color(world['grid'], grid_x, grid_y, world)
-        
+    if world.get('share') is not None:
+        receive_shared_changes(world)
+    # We get the positions the mouse went through since the last update
+    stroke = world['stroke']
+    # Did the mouse move while drawing?
+    if stroke:
+        # Carry on from where the last update stopped, so that fast strokes
+        # become straight lines instead of a few scattered squares.
+        if world['last stroke x'] != None and world['last stroke y'] != None:
+            stroke = [[world['last stroke x'], world['last stroke y']]] + stroke
+        grid = world['grid']
+        grid_xs, grid_ys = brush_cells(stroke, len(grid[0]), len(grid),
+                                       world.get('brush', 'square'), world.get('brush size', 1))
+        paint_grid_cells(grid, grid_xs, grid_ys, world)
+        world['last stroke x'], world['last stroke y'] = stroke[-1]
+        world['stroke'] = []
+    if world.get('autosave') is not None:
+        world['autosave'].update(world['grid'])
+
+def paint_grid_cells(grid: [[str]], grid_xs: numpy.ndarray, grid_ys: numpy.ndarray, world: World):
+    '''
+    Paints a batch of cells with the current color. Tracked grids do it all
+    at once, any other grid one cell at a time.
+    
+    Args:
+        grid ([[str]]): The list of lists (a 2-Dimensional list) of colors.
+        grid_xs (numpy.ndarray): The horizontal values of the cells.
+        grid_ys (numpy.ndarray): The vertical values of the cells.
+        world: (World): The current world to update.
+    '''
+    if isinstance(grid, TrackedGrid):
+        grid.paint_cells(grid_xs, grid_ys, world['color'])
+        if world.get('share') is not None:
+            world['share'].send_cells(grid, grid_xs, grid_ys)
+    else:
+        for grid_x, grid_y in zip(grid_xs.tolist(), grid_ys.tolist()):
+            advance_grid_cell_color(grid, grid_x, grid_y, world)
+
+def receive_shared_changes(world: World):
+    '''
+    Brings in what the other players painted since the last update. When the
+    server sent the whole canvas (right after joining), it becomes our grid.
+    
+    Args:
+        world (World): The current world to update.
+    '''
+    grid = world['share'].receive(world['grid'])
+    if grid is not world['grid']:
+        world['grid'] = grid
+        world['history'].attach(grid)
+
+def share_history_step(world: World, step: list):
+    '''
+    Tells the canvas server about the cells an undo or redo changed.
+    
+    Args:
+        world (World): Current state of the world.
+        step (list): The step that was undone or redone.
+    '''
+    if world.get('share') is None:
+        return
+    cells = step_cells(step)
+    grid = world['grid']
+    if cells is None:
+        world['share'].send_grid(grid)
+    else:
+        grid_ys, grid_xs = numpy.divmod(cells.astype(numpy.int64), grid.width)
+        world['share'].send_cells(grid, grid_xs, grid_ys)
+
 def advance_grid_cell_color(grid: [[str]], grid_x: int, grid_y: int, world: World):
     '''
     Determines which color to switch to when initiated by the user.
@@ -194,8 +736,34 @@ def advance_grid_cell_color(grid: [[str]], grid_x: int, grid_y: int, world: Worl
     old_color = grid[grid_y][grid_x]
     # Advance that color in the sequence
     new_color = world['color']
+    # Nothing to do if the mouse is still over a square of this color
+    if old_color == new_color:
+        return
     # Mutate the grid by updating the list of list's value with the new color.
-    grid[grid_y][grid_x] = new_color
+    if isinstance(grid, TrackedGrid):
+        grid.set_color(grid_x, grid_y, new_color)
+    else:
+        grid[grid_y][grid_x] = new_color
+def fill_grid_region(grid: [[str]], grid_x: int, grid_y: int, world: World):
+    '''
+    Fills the area around a cell (all the cells of the same color connected
+    to it) with the current color, as a single change. The fill stops at the
+    edges of the window, so a huge canvas never has to be searched.
+    
+    Args:
+        grid ([[str]]): The list of lists (a 2-Dimensional list) of colors.
+        grid_x (int): The horizontal value of the cell.
+        grid_y (int): The vertical value of the cell.
+        world: (World): The current world to update.
+    '''
+    if grid[grid_y][grid_x] == world['color']:
+        return
+    left, bottom, right, top = view_cells(world['view x'], world['view y'], world['zoom'])
+    left, bottom = max(left, 0), max(bottom, 0)
+    cells = palette_region(grid, left, bottom, right, top)
+    grid_xs, grid_ys = flood_cells(cells, grid_x - left, grid_y - bottom)
+    paint_grid_cells(grid, grid_xs + left, grid_ys + bottom, world)
+
 def handle_key(world: World, key: int):
     """
     Describe how the game responds to keyboard input.
@@ -209,6 +777,196 @@ def handle_key(world: World, key: int):
         world['color'] = 'apricot'
     elif key == ord('b'):
         world['color'] = 'brown'
+    elif key == ord('c'):
+        world['color'] = random_color(world)
+    elif key in SHAPE_KEYS:
+        # Pressing the key of the selected shape again goes back to the pen
+        world['tool'] = 'pen' if world['tool'] == SHAPE_KEYS[key] else SHAPE_KEYS[key]
+        world['shape start'] = []
+        world['shape end'] = []
+        forget_stroke(world)
+    elif key in BRUSH_KEYS:
+        world['brush'] = BRUSH_KEYS[key]
+    elif key == ord('[') or key == ord(']'):
+        position = BRUSH_SIZES.index(world['brush size']) if world['brush size'] in BRUSH_SIZES else 0
+        position += 1 if key == ord(']') else -1
+        world['brush size'] = BRUSH_SIZES[min(max(position, 0), len(BRUSH_SIZES) - 1)]
+    elif key == ord('h'):
+        world['show stats'] = not world.get('show stats')
+    elif key == ord('s'):
+        save_grid(world['grid'], SAVE_FILE)
+    elif key == ord('l'):
+        if os.path.exists(SAVE_FILE):
+            world['grid'] = load_grid(SAVE_FILE, chunked=True)
+            world['history'].attach(world['grid'])
+            move_view(world, 0, 0)
+            if world.get('share') is not None:
+                world['share'].send_grid(world['grid'])
+    elif key == ord('e'):
+        export_canvas(world)
+    elif key == ord('i'):
+        if os.path.exists(IMPORT_FILE):
+            import_picture_into_view(world, IMPORT_FILE)
+    elif key == ord('z'):
+        if world['history'].undo():
+            share_history_step(world, world['history'].redo_steps[-1])
+    elif key == ord('y'):
+        if world['history'].redo():
+            share_history_step(world, world['history'].undo_steps[-1])
+    elif key in PAN_KEYS:
+        # Move a quarter of the window at a time
+        step_x, step_y = PAN_KEYS[key]
+        move_view(world, step_x * GRID_WIDTH / 4 / world['zoom'],
+                  step_y * GRID_HEIGHT / 4 / world['zoom'])
+    elif key == ord('=') or key == ord('+'):
+        zoom_view(world, 2)
+    elif key == ord('-'):
+        zoom_view(world, 1/2)
+
+# The thread writing the last export, so a new one isn't started until it's done
+EXPORT_THREAD = None
+
+def export_canvas(world: World, path: str = EXPORT_FILE) -> threading.Thread:
+    '''
+    Saves the painted part of the canvas (or the part in view, if nothing is
+    painted) as a PNG picture. A snapshot of the grid is written by a thread
+    of its own, so the game doesn't stop while the picture is made.
+    
+    Args:
+        world (World): Current state of the world.
+        path (str): The file to write.
+    Returns:
+        threading.Thread: The thread writing the picture, or None if the
+            last export isn't finished yet.
+    '''
+    global EXPORT_THREAD
+    if EXPORT_THREAD is not None and EXPORT_THREAD.is_alive():
+        return None
+    grid = world['grid']
+    area = canvas_stats(grid).bounds()
+    if area is None:
+        left, bottom, right, top = view_cells(world['view x'], world['view y'], world['zoom'])
+        area = (max(left, 0), max(bottom, 0), min(right, len(grid[0])), min(top, len(grid)))
+    snapshot = grid.snapshot() if isinstance(grid, TrackedGrid) else PaletteGrid.from_lists(grid)
+    # The PALETTE_VALUES list grows with new colors, so the thread gets a copy
+    EXPORT_THREAD = threading.Thread(target=export_png, args=(snapshot, path, EXPORT_SCALE,
+                                                             list(PALETTE_VALUES)),
+                                     kwargs={'area': area})
+    EXPORT_THREAD.start()
+    return EXPORT_THREAD
+
+def random_color(world: World) -> str:
+    '''
+    Picks a color of its own for the player. The pick only depends on the
+    world (the current color, how much the grid changed and where the mouse
+    is), so a replayed session picks the same colors the player got.
+    
+    Args:
+        world (World): Current state of the world.
+    Returns:
+        str: The '#rrggbb' name of the color.
+    '''
+    generation = getattr(world['grid'], 'generation', 0)
+    mouse_x, mouse_y = world['current mouse x'] or 0, world['current mouse y'] or 0
+    rng = numpy.random.default_rng([color_index(world['color']), generation,
+                                    mouse_x % 2**32, mouse_y % 2**32])
+    red, green, blue = rng.integers(0, 256, 3).tolist()
+    return custom_color(red, green, blue)
+
+def import_picture_into_view(world: World, path: str):
+    '''
+    Paints a picture over the part of the canvas in the window, one square
+    per cell, as a single change that can be undone.
+    
+    Args:
+        world (World): Current state of the world.
+        path (str): The picture file.
+    '''
+    grid = world['grid']
+    left, bottom, right, top = view_cells(world['view x'], world['view y'], world['zoom'])
+    left, bottom = max(left, 0), max(bottom, 0)
+    right, top = min(right, len(grid[0])), min(top, len(grid))
+    indexes = picture_indexes(path, right - left, top - bottom, PALETTE_VALUES)
+    world['history'].end_step()
+    # One batch of cells per color
+    for index in numpy.unique(indexes).tolist():
+        grid_ys, grid_xs = numpy.nonzero(indexes == index)
+        grid.paint_cells(grid_xs + left, grid_ys + bottom, PALETTE[index])
+    world['history'].end_step()
+    if world.get('share') is not None:
+        grid_ys, grid_xs = numpy.indices(indexes.shape).reshape(2, -1)
+        world['share'].send_cells(grid, grid_xs + left, grid_ys + bottom)
+
+# The shape tool each key picks
+SHAPE_KEYS = {ord('n'): 'line', ord('r'): 'rectangle', ord('o'): 'ellipse'}
+# The brush each number key picks
+BRUSH_KEYS = {ord(str(number)): brush for number, brush in enumerate(BRUSHES, 1)}
+
+# The direction each arrow key moves the view in
+PAN_KEYS = {arcade.key.LEFT: (-1, 0), arcade.key.RIGHT: (1, 0),
+            arcade.key.DOWN: (0, -1), arcade.key.UP: (0, 1)}
+
+def move_view(world: World, dx: float, dy: float):
+    '''
+    Moves the view over the canvas, without going past its edges.
+    
+    Args:
+        world (World): Current state of the world.
+        dx (float): How many squares to move right (or left, if negative).
+        dy (float): How many squares to move up (or down, if negative).
+    '''
+    grid = world['grid']
+    # The most the view can move before the canvas runs out
+    most_x = max(len(grid[0]) - GRID_WIDTH / world['zoom'], 0)
+    most_y = max(len(grid) - GRID_HEIGHT / world['zoom'], 0)
+    world['view x'] = float(min(max(world['view x'] + dx, 0), most_x))
+    world['view y'] = float(min(max(world['view y'] + dy, 0), most_y))
+    # The squares under the mouse are different now, so the stroke can't
+    # carry on from where it was
+    forget_stroke(world)
+
+def forget_stroke(world: World):
+    '''
+    Makes the next stroke start fresh, instead of joining up with where the
+    last one stopped.
+    
+    Args:
+        world (World): Current state of the world.
+    '''
+    world['stroke'] = []
+    world['last stroke x'] = None
+    world['last stroke y'] = None
+
+def zoom_view(world: World, factor: float):
+    '''
+    Zooms the view in or out, keeping the middle of the window where it is.
+    
+    Args:
+        world (World): Current state of the world.
+        factor (float): How many times bigger the squares should be drawn.
+    '''
+    old_zoom = world['zoom']
+    new_zoom = min(max(old_zoom * factor, MIN_ZOOM), MAX_ZOOM)
+    world['zoom'] = float(new_zoom)
+    move_view(world, GRID_WIDTH/2 * (1/old_zoom - 1/new_zoom),
+              GRID_HEIGHT/2 * (1/old_zoom - 1/new_zoom))
+
+def mouse_to_grid(world: World, x: float, y: float) -> (int, int):
+    '''
+    Finds the grid position under a position in the window, taking the view
+    into account.
+    
+    Args:
+        world (World): Current state of the world.
+        x (float): The x-coordinate within the window.
+        y (float): The y-coordinate within the window.
+    Returns:
+        int: The column of the grid.
+        int: The row of the grid.
+    '''
+    return (screen_to_grid(x, WINDOW_WIDTH, GRID_WIDTH, world['view x'], world['zoom']),
+            screen_to_grid(y, WINDOW_HEIGHT, GRID_HEIGHT, world['view y'], world['zoom']))
+
 def handle_mouse(world: World, x: int, y: int, button: str):
     """
     Describe how the game responds to mouse clicks.
@@ -221,36 +979,64 @@ def handle_mouse(world: World, x: int, y: int, button: str):
         y (int): The y-coordinate of the mouse when the button was clicked.
         button (str): The button that was clicked ('left', 'right', 'middle')
     """
+    # Whatever was drawn before the click can be undone on its own
+    world['history'].end_step()
 # Toggle drawing mode
     if button == 'right':
         if world['draw'] == False:
             world['draw'] = True
         else:
             world['draw'] = False
-# Selecting colors in the palette
-    if button == 'left' and 440.5 < y < 500:
-        if x > 0 and x < BOX_WIDTH:
-            world['color'] = 'red'
-        elif x > BOX_WIDTH and x < BOX_WIDTH*2:
-            world['color'] = 'orange'
-        elif x > BOX_WIDTH*2 and x < BOX_WIDTH*3:
-            world['color'] = 'yellow'
-        elif x > BOX_WIDTH*3 and x < BOX_WIDTH*4:
-            world['color'] = 'green'
-        elif x > BOX_WIDTH*4 and x < BOX_WIDTH*5:
-            world['color'] = 'blue'
-        elif x > BOX_WIDTH*5 and x < BOX_WIDTH*6:
-            world['color'] = 'purple'
-        elif x > BOX_WIDTH*6 and x < BOX_WIDTH*7:
-            world['color'] = 'magenta'
-        elif x > BOX_WIDTH*7 and x < BOX_WIDTH*8:
-            world['color'] = 'black'
-# For resetting and erasing
-    if button == 'left' and 0 < y < 59.5:
-        if x > 0 and x < BOX_WIDTH:
-            make_grid_white(world)
-        elif x > BOX_WIDTH*7 and x < BOX_WIDTH*8:
-            world['color'] = 'white'
+        # Either way, the next stroke starts fresh
+        forget_stroke(world)
+# Selecting colors in the palette, resetting and erasing
+    if button == 'left':
+        region = UI_REGIONS.find(x, y)
+        if region is not None:
+            kind, value = region
+            if kind == 'color':
+                world['color'] = value
+            elif kind == 'reset':
+                make_grid_white(world)
+                world['history'].end_step()
+            elif kind == 'tool':
+                # Clicking the selected tool again goes back to the pen
+                if world['tool'] == value:
+                    world['tool'] = 'pen'
+                else:
+                    world['tool'] = value
+                world['shape start'] = []
+                world['shape end'] = []
+                forget_stroke(world)
+        elif world['tool'] == 'fill':
+            grid_x, grid_y = mouse_to_grid(world, x, y)
+            if 0 <= grid_x < len(world['grid'][0]) and 0 <= grid_y < len(world['grid']):
+                fill_grid_region(world['grid'], grid_x, grid_y, world)
+                world['history'].end_step()
+        elif world['tool'] in SHAPES:
+            click_shape(world, *mouse_to_grid(world, x, y))
+
+def click_shape(world: World, grid_x: int, grid_y: int):
+    '''
+    Starts a shape at the clicked square, or if one is started, paints it
+    into the grid (all at once, as a single change) ending there.
+    
+    Args:
+        world (World): Current state of the world.
+        grid_x (int): The column that was clicked.
+        grid_y (int): The row that was clicked.
+    '''
+    if not world['shape start']:
+        world['shape start'] = [grid_x, grid_y]
+        world['shape end'] = [grid_x, grid_y]
+        return
+    (x0, y0), grid = world['shape start'], world['grid']
+    grid_xs, grid_ys = shape_cells(world['tool'], x0, y0, grid_x, grid_y, len(grid[0]), len(grid),
+                                   world['brush'], world['brush size'])
+    paint_grid_cells(grid, grid_xs, grid_ys, world)
+    world['history'].end_step()
+    world['shape start'] = []
+    world['shape end'] = []
 def handle_motion(world: World, x: int, y: int):
     """
     Moving over a square changes its color.
@@ -260,40 +1046,27 @@ def handle_motion(world: World, x: int, y: int):
         x (int): The x-coordinate of where the mouse was moved to.
         y (int): The x-coordinate of where the mouse was moved to.
     """
+    # A started shape follows the mouse, without changing the grid yet
+    if world['shape start']:
+        world['shape end'] = list(mouse_to_grid(world, x, y))
     # First we translate from the position within the window to the
     #   position within the grid of circles
-    if world['draw'] == True:
-        grid_x = screen_to_grid(x, WINDOW_WIDTH, GRID_WIDTH)
-        grid_y = screen_to_grid(y, WINDOW_HEIGHT, GRID_HEIGHT)
+    if world['draw'] == True and world['tool'] == 'pen':
+        grid_x, grid_y = mouse_to_grid(world, x, y)
+    # Queue the position for the next update to draw through. Moving within
+    # the same square again doesn't need to be queued twice.
+        stroke = world['stroke']
+        if not stroke or stroke[-1] != [grid_x, grid_y]:
+            stroke.append([grid_x, grid_y])
     # If we're out of bounds, then we set the values to None
-        if grid_x < 0 or grid_x >= GRID_WIDTH:
+        if grid_x < 0 or grid_x >= len(world['grid'][0]):
             grid_x = None
-        if grid_y < 0 or grid_y >= GRID_HEIGHT:
+        if grid_y < 0 or grid_y >= len(world['grid']):
             grid_y = None
     # Then we update our world to keep track of the latest mouse
     # movements within the grid.
         world['current mouse x'] = grid_x
         world['current mouse y'] = grid_y
-def screen_to_grid(coordinate: float, screen_size: int, grid_size: int) -> int:
-    '''
-    Converts a coordinate (either the x part or the y part) from a position
-    within the window to the equivalent position within the grid. It does this by
-    scaling the between the two different sizes.
-    
-    Think about this as a number line. If you have the coordinate 50 on that
-    number line, and the number line's maximum value was 100 (screen_size),
-    then scaling that a number line with the maximum value of 20 (grid_size) would
-    give you the new coordinate 10.
-    
-    Args:
-        coordinate (float): Either an X or Y value in a coordinate system.
-        screen_size (int): The number of values in the original coordinate system.
-        grid_width (int): The number of values in the target coordinate system.
-    Returns:
-        int: The scaled value in the other coordinate system.
-    '''
-    return int(coordinate * grid_size / screen_size)
-    
 def advance_color() -> str:
     '''
     Consumes a color (string) and produces the starting color, which is red.
@@ -314,148 +1087,270 @@ def handle_release(world: World, key: int):
 
 ########################################################################################3
 # Additional functions for the color palette
-def draw_box_red(filled: bool, value: int, x: int, y: int, size: int):
-    '''
-    Draws a red box for the palette.
-    
-    Args:
-        filled (bool): Whether or not to fill the box.
-        value (int): The value that should be shown inside this box.
-        x (int): The x-coordinate to draw at.
-        y (int): The y-coordinate to draw at.
-        size (int): The height and width of the box.
-    '''
-    arcade.draw_xywh_rectangle_filled(x, y, size, size+15, arcade.color.RED)
-    arcade.draw_xywh_rectangle_outline(x, y, size, size+15, arcade.color.BLACK)
 
-def draw_box_orange(filled: bool, value: int, x: int, y: int, size: int):
-    '''
-    Draws an orange box for the palette.
-    
-    Args:
-        filled (bool): Whether or not to fill the box.
-        value (int): The value that should be shown inside this box.
-        x (int): The x-coordinate to draw at.
-        y (int): The y-coordinate to draw at.
-        size (int): The height and width of the box.
-    '''
-    arcade.draw_xywh_rectangle_filled(x, y, size, size+15, arcade.color.ORANGE)
-    arcade.draw_xywh_rectangle_outline(x, y, size, size+15, arcade.color.BLACK)
+# The colors in the palette bar, from left to right
+PALETTE_BAR = ['red', 'orange', 'yellow', 'green', 'blue', 'purple', 'magenta', 'black']
+# Where the bottom of the palette bar boxes is
+PALETTE_BAR_Y = 440.5
 
-def draw_box_yellow(filled: bool, value: int, x: int, y: int, size: int):
+def make_box_shapes(color: str, x: float, y: float, size: float) -> [arcade.Shape]:
     '''
-    Draws a yellow box for the palette.
+    Makes the shapes of one box of the palette: the filled color with a black
+    outline around it.
     
     Args:
-        filled (bool): Whether or not to fill the box.
-        value (int): The value that should be shown inside this box.
-        x (int): The x-coordinate to draw at.
-        y (int): The y-coordinate to draw at.
-        size (int): The height and width of the box.
+        color (str): The color of the box.
+        x (float): The x-coordinate of the left side of the box.
+        y (float): The y-coordinate of the bottom of the box.
+        size (float): The width of the box.
+    Returns:
+        [arcade.Shape]: The shapes to draw for the box.
     '''
-    arcade.draw_xywh_rectangle_filled(x, y, size, size+15, arcade.color.YELLOW)
-    arcade.draw_xywh_rectangle_outline(x, y, size, size+15, arcade.color.BLACK)
+    center_x = x + size/2
+    center_y = y + (size+15)/2
+    return [arcade.create_rectangle_filled(center_x, center_y, size, size+15,
+                                           COLOR_VALUES[color]),
+            arcade.create_rectangle_outline(center_x, center_y, size, size+15,
+                                            arcade.color.BLACK)]
 
-def draw_box_green(filled: bool, value: int, x: int, y: int, size: int):
+class PaletteLayer:
     '''
-    Draws a green box for the palette.
+    The palette bar (the color boxes and the tool icons), built once into a
+    shape list and a sprite list so every frame draws it with a single call
+    for each. It is only built again when what it shows changes.
     
-    Args:
-        filled (bool): Whether or not to fill the box.
-        value (int): The value that should be shown inside this box.
-        x (int): The x-coordinate to draw at.
-        y (int): The y-coordinate to draw at.
-        size (int): The height and width of the box.
+    Attributes:
+        shown (tuple): The palette, values, hovering index and tool it was
+            built for.
+        shapes (arcade.ShapeElementList): The color boxes.
+        icons (arcade.SpriteList): The tool icons.
     '''
-    arcade.draw_xywh_rectangle_filled(x, y, size, size+15, arcade.color.GREEN)
-    arcade.draw_xywh_rectangle_outline(x, y, size, size+15, arcade.color.BLACK)
+    def __init__(self):
+        self.shown = None
+        self.shapes = None
+        self.icons = None
+    
+    def build(self, values: [int], hovering: int, tool: str):
+        '''
+        Makes the shapes and sprites of the palette bar.
+        
+        Args:
+            values ([int]): The list of values to draw.
+            hovering (int): The index of the value to fill in with color.
+            tool (str): The selected tool, which gets outlined.
+        '''
+        self.shapes = arcade.ShapeElementList()
+        self.icons = arcade.SpriteList()
+        # The boxes would all land on the same spot, so one set is enough
+        if not values:
+            return
+        for index, color in enumerate(PALETTE_BAR):
+            for shape in make_box_shapes(color, index*BOX_WIDTH, PALETTE_BAR_Y, BOX_WIDTH):
+                self.shapes.append(shape)
+        for filename, center_x in TOOL_ICONS:
+            icon = arcade.Sprite(center_x=center_x, center_y=ICON_Y)
+            icon.texture = TEXTURES.get(filename)
+            icon.width = ICON_WIDTH
+            icon.height = ICON_HEIGHT
+            self.icons.append(icon)
+            if TOOL_FILES.get(tool) == filename:
+                self.shapes.append(arcade.create_rectangle_outline(
+                    center_x, ICON_Y, ICON_WIDTH, ICON_HEIGHT, arcade.color.BLACK, 3))
+    
+    def draw(self, values: [int], hovering: int, tool: str = 'pen'):
+        '''
+        Draws the palette bar, building it first if anything changed.
+        
+        Args:
+            values ([int]): The list of values to draw.
+            hovering (int): The index of the value to fill in with color.
+            tool (str): The selected tool, which gets outlined.
+        '''
+        showing = (tuple(PALETTE_BAR), tuple(values), hovering, tool)
+        if showing != self.shown:
+            self.build(values, hovering, tool)
+            self.shown = showing
+        self.shapes.draw()
+        self.icons.draw()
+
+# The palette bar drawn by draw_boxes
+PALETTE_LAYER = PaletteLayer()
+# The icon of each tool that can be selected in the palette bar
+TOOL_FILES = {'fill': 'bucket.png'}
 
-def draw_box_blue(filled: bool, value: int, x: int, y: int, size: int):
+class RegionIndex:
     '''
-    Draws a blue box for the palette.
+    Finds which clickable region of the window a point is in. The window is
+    cut into square buckets, and every region is listed in each bucket it
+    overlaps, so finding a point only looks at the few regions of one bucket
+    no matter how many regions there are.
     
     Args:
-        filled (bool): Whether or not to fill the box.
-        value (int): The value that should be shown inside this box.
-        x (int): The x-coordinate to draw at.
-        y (int): The y-coordinate to draw at.
-        size (int): The height and width of the box.
+        bucket_size (float): The width and height of a bucket.
+    
+    Attributes:
+        buckets ({(int, int): [(float, float, float, float, tuple)]}): The
+            (left, bottom, right, top, action) of the regions in each bucket.
     '''
-    arcade.draw_xywh_rectangle_filled(x, y, size, size+15, arcade.color.BLUE)
-    arcade.draw_xywh_rectangle_outline(x, y, size, size+15, arcade.color.BLACK)
+    def __init__(self, bucket_size: float):
+        self.bucket_size = bucket_size
+        self.buckets = {}
+    
+    def add(self, left: float, bottom: float, width: float, height: float, action: tuple):
+        '''
+        Registers a new region. Its edges do not count as part of it.
+        
+        Args:
+            left (float): The x-coordinate of the left side.
+            bottom (float): The y-coordinate of the bottom side.
+            width (float): How wide the region is.
+            height (float): How tall the region is.
+            action (tuple): What the region does, as (kind, value).
+        '''
+        region = (left, bottom, left+width, bottom+height, action)
+        for column in range(int(left // self.bucket_size),
+                            int((left+width) // self.bucket_size) + 1):
+            for row in range(int(bottom // self.bucket_size),
+                             int((bottom+height) // self.bucket_size) + 1):
+                self.buckets.setdefault((column, row), []).append(region)
+    
+    def find(self, x: float, y: float) -> tuple:
+        '''
+        Looks up the action of the region a point is in.
+        
+        Args:
+            x (float): The x-coordinate of the point.
+            y (float): The y-coordinate of the point.
+        Returns:
+            tuple: The (kind, value) action, or None outside of all regions.
+        '''
+        bucket = (int(x // self.bucket_size), int(y // self.bucket_size))
+        for left, bottom, right, top, action in self.buckets.get(bucket, ()):
+            if left < x < right and bottom < y < top:
+                return action
+        return None
 
-def draw_box_purple(filled: bool, value: int, x: int, y: int, size: int):
+def make_ui_regions() -> RegionIndex:
     '''
-    Draws a purple box for the palette.
+    Registers the clickable parts of the palette bar: a color box for each
+    color, and the tool icons.
     
-    Args:
-        filled (bool): Whether or not to fill the box.
-        value (int): The value that should be shown inside this box.
-        x (int): The x-coordinate to draw at.
-        y (int): The y-coordinate to draw at.
-        size (int): The height and width of the box.
+    Returns:
+        RegionIndex: The regions of the palette bar.
     '''
-    arcade.draw_xywh_rectangle_filled(x, y, size, size+15, arcade.color.PURPLE)
-    arcade.draw_xywh_rectangle_outline(x, y, size, size+15, arcade.color.BLACK)
+    regions = RegionIndex(BOX_WIDTH)
+    for index, color in enumerate(PALETTE_BAR):
+        regions.add(index*BOX_WIDTH, PALETTE_BAR_Y, BOX_WIDTH,
+                    WINDOW_HEIGHT-PALETTE_BAR_Y, ('color', color))
+    regions.add(0, 0, BOX_WIDTH, 59.5, ('reset', None))
+    regions.add(BOX_WIDTH*7, 0, BOX_WIDTH, 59.5, ('color', 'white'))
+    for tool, filename in TOOL_FILES.items():
+        center_x = dict(TOOL_ICONS)[filename]
+        regions.add(center_x - ICON_WIDTH/2, ICON_Y - ICON_HEIGHT/2, ICON_WIDTH,
+                    ICON_HEIGHT, ('tool', tool))
+    return regions
 
-def draw_box_magenta(filled: bool, value: int, x: int, y: int, size: int):
+# The clickable regions used by handle_mouse
+UI_REGIONS = make_ui_regions()
+
+def draw_boxes(values: [int], hovering: int, tool: str = 'pen'):
     '''
-    Draws a magenta box for the palette.
+    Draws all the boxes for the color palette.
     
     Args:
-        filled (bool): Whether or not to fill the box.
-        value (int): The value that should be shown inside this box.
-        x (int): The x-coordinate to draw at.
-        y (int): The y-coordinate to draw at.
-        size (int): The height and width of the box.
+        values ([int]): The list of values to draw.
+        hovering (int): The index of the value to fill in with color.
+        tool (str): The selected tool, which gets outlined.
     '''
-    arcade.draw_xywh_rectangle_filled(x, y, size, size+15, arcade.color.MAGENTA)
-    arcade.draw_xywh_rectangle_outline(x, y, size, size+15, arcade.color.BLACK)
+    PALETTE_LAYER.draw(values, hovering, tool)
 
-def draw_box_black(filled: bool, value: int, x: int, y: int, size: int):
+############################################################################
+# Set up the game
+# Don't need to change any of this
+
+def parse_arguments(arguments: [str]) -> argparse.Namespace:
     '''
-    Draws a black box for the palette.
+    Reads the command line options.
     
     Args:
-        filled (bool): Whether or not to fill the box.
-        value (int): The value that should be shown inside this box.
-        x (int): The x-coordinate to draw at.
-        y (int): The y-coordinate to draw at.
-        size (int): The height and width of the box.
+        arguments ([str]): The command line, without the program name.
+    Returns:
+        argparse.Namespace: The options.
     '''
-    arcade.draw_xywh_rectangle_filled(x, y, size, size+15, arcade.color.BLACK)
-    arcade.draw_xywh_rectangle_outline(x, y, size, size+15, arcade.color.BLACK)
+    parser = argparse.ArgumentParser(description=GAME_TITLE)
+    parser.add_argument('--headless', metavar='EVENTS', type=int, nargs='?', const=10000,
+                        help='play a made up session of EVENTS events without a window')
+    parser.add_argument('--timing', metavar='FILE',
+                        help='time every callback and write the results to FILE '
+                             '(.csv, or JSON otherwise) when the game ends')
+    parser.add_argument('--record', metavar='FILE',
+                        help='record every mouse, key, update and draw event to FILE')
+    parser.add_argument('--replay', metavar='FILE',
+                        help='play back the events recorded in FILE without a window')
+    parser.add_argument('--real-time', action='store_true',
+                        help='with --replay, wait between events as long as the player did')
+    parser.add_argument('--restore', action='store_true',
+                        help='start from the autosaved drawing without asking')
+    parser.add_argument('--no-autosave', action='store_true',
+                        help="don't keep a copy of the drawing in " + AUTOSAVE_FILE)
+    parser.add_argument('--share', metavar='ADDRESS',
+                        help='paint together on the canvas of the server at ADDRESS '
+                             '(host:port, or a Unix socket; see csquares_share.py)')
+    return parser.parse_args(arguments)
 
-def draw_boxes(values: [int], hovering: int):
+def offer_restore(path: str) -> bool:
     '''
-    Draws all the boxes for the color palette.
+    Asks the player whether to bring back the autosaved drawing.
     
     Args:
-        values ([int]): The list of values to draw.
-        hovering (int): The index of the value to fill in with color.
+        path (str): The autosave file.
+    Returns:
+        bool: Whether to restore it.
     '''
-    index = 0
-    for box_value in values:
-        # If the current index is our hovering one, we pass in True
-        draw_box_red(hovering==index, box_value, 0, 440.5, BOX_WIDTH)
-        draw_box_orange(hovering==index, box_value, 62.5, 440.5, BOX_WIDTH)
-        draw_box_yellow(hovering==index, box_value, 125, 440.5, BOX_WIDTH)
-        draw_box_green(hovering==index, box_value, 187.5, 440.5, BOX_WIDTH)
-        draw_box_blue(hovering==index, box_value, 250, 440.5, BOX_WIDTH)
-        draw_box_purple(hovering==index, box_value, 312.5, 440.5, BOX_WIDTH)
-        draw_box_magenta(hovering==index, box_value, 375, 440.5, BOX_WIDTH)
-        draw_box_black(hovering==index, box_value, 437.5, 440.5, BOX_WIDTH)
-        arcade.draw_texture_rectangle(40, 40, 59.5, 62.5, arcade.load_texture('garbage.png'))
-        arcade.draw_texture_rectangle(460, 40, 59.5, 62.5, arcade.load_texture('eraser.png'))
-        index = index + 1
-
-############################################################################
-# Set up the game
-# Don't need to change any of this
+    saved = time.strftime('%Y-%m-%d %H:%M', time.localtime(os.path.getmtime(path)))
+    if sys.stdin is None or not sys.stdin.isatty():
+        print('There is an autosaved drawing from {} (run with --restore to bring it back)'.format(saved))
+        return False
+    answer = input('Bring back the autosaved drawing from {}? [y/N] '.format(saved))
+    return answer.strip().lower().startswith('y')
 
 if __name__ == '__main__':
-    Cisc108Game(World, WINDOW_WIDTH, WINDOW_HEIGHT, GAME_TITLE, INITIAL_WORLD,
-                draw_world, update_world, handle_key, handle_mouse,
-                handle_motion, handle_release)
-    arcade.set_background_color(BACKGROUND_COLOR)
-    arcade.run()
+    arguments = parse_arguments(sys.argv[1:])
+    TEXTURES.preload(ICON_FILES)
+    timer = None
+    if arguments.timing:
+        timer = FrameTimer()
+        timer.dump_at_exit(arguments.timing)
+    recorder = None
+    if arguments.record:
+        recorder = EventRecorder(arguments.record)
+        recorder.close_at_exit()
+    if arguments.share:
+        INITIAL_WORLD['share'] = SharedCanvas(arguments.share)
+    if arguments.headless or arguments.replay:
+        # Play a made up (or recorded) session without a window (e.g. on a
+        # server), and report how fast the game got through it.
+        runner = HeadlessRunner(Cisc108Game, World, WINDOW_WIDTH, WINDOW_HEIGHT,
+                                GAME_TITLE, INITIAL_WORLD, draw_world, update_world,
+                                handle_key, handle_mouse, handle_motion, handle_release,
+                                timer=timer, recorder=recorder)
+        if arguments.replay:
+            print(runner.replay(arguments.replay, arguments.real_time))
+        else:
+            print(runner.run(make_scribble(arguments.headless, WINDOW_WIDTH, WINDOW_HEIGHT)))
+    else:
+        if not arguments.no_autosave:
+            if os.path.exists(AUTOSAVE_FILE) and (arguments.restore or offer_restore(AUTOSAVE_FILE)):
+                INITIAL_WORLD['grid'] = restore(AUTOSAVE_FILE)
+                INITIAL_WORLD['history'].attach(INITIAL_WORLD['grid'])
+            INITIAL_WORLD['autosave'] = Autosaver(AUTOSAVE_FILE, AUTOSAVE_SECONDS, AUTOSAVE_CHANGES)
+            INITIAL_WORLD['autosave'].close_at_exit()
+        Cisc108Game(World, WINDOW_WIDTH, WINDOW_HEIGHT, GAME_TITLE, INITIAL_WORLD,
+                    draw_world, update_world, handle_key, handle_mouse,
+                    handle_motion, handle_release, timer=timer, recorder=recorder)
+        arcade.set_background_color(BACKGROUND_COLOR)
+        arcade.run()
+        # The window was closed normally, so there is nothing to bring back
+        # next time (if the game dies instead, close_at_exit keeps the file)
+        if INITIAL_WORLD['autosave'] is not None:
+            INITIAL_WORLD['autosave'].close(remove=True)
@@ -0,0 +1,167 @@
+'''
+Autosaving Coloring Squares canvases.
+
+An Autosaver keeps a copy of the drawing on disk while the game runs, so
+nothing much is lost if the game dies. The slow part, turning the grid into a
+canvas file and writing it, happens in a thread of its own. The game itself
+only takes a snapshot of the grid, which for a ChunkedGrid shares the chunks
+instead of copying them (see ChunkedGrid.snapshot), so frames don't slow down
+while a save is going on. Files are written with save_grid, which renames a
+finished file into place, so the autosave file is always a whole canvas.
+'''
+
+import atexit
+import os
+import threading
+import time
+from csquares_grid import PaletteGrid, ChunkedGrid, TrackedGrid
+from csquares_io import save_grid, load_grid
+
+class Autosaver:
+    '''
+    Saves a grid in the background, once some time has passed or enough has
+    changed since the last save (and never when nothing changed). The grid
+    the game starts with is not saved until it changes.
+
+    Args:
+        path (str): The file to save to.
+        interval (float): How many seconds to wait at most before saving
+            new changes.
+        changes (int): How many changes (strokes, fills and so on) make it
+            save right away.
+
+    Attributes:
+        grid (TrackedGrid): The grid given to the last update.
+        saved_generation (int): The generation of the grid last snapshotted.
+        saved_time (float): When the last snapshot was taken.
+        waiting (PaletteGrid): The snapshot waiting to be written, if any.
+        saves (int): How many files were written.
+        error (OSError): What went wrong with the last write, if anything did.
+    '''
+    def __init__(self, path: str, interval: float = 30, changes: int = 1000):
+        self.path = path
+        self.interval = interval
+        self.changes = changes
+        self.grid = None
+        self.saved_generation = None
+        self.saved_time = time.perf_counter()
+        self.waiting = None
+        self.saves = 0
+        self.error = None
+        self.stopping = False
+        self.lock = threading.Condition()
+        self.thread = threading.Thread(target=self._work, daemon=True)
+        self.thread.start()
+
+    def update(self, grid: [[str]]) -> bool:
+        '''
+        Called every update: hands a snapshot of the grid to the saving
+        thread if it is time to.
+
+        Args:
+            grid ([[str]]): The grid of the world (any kind of grid).
+        Returns:
+            bool: Whether a snapshot was taken.
+        '''
+        if self.grid is None:
+            # The starting grid is blank, or was just restored from the
+            # autosave file, so there is nothing new to save yet
+            self.grid = grid
+            self.saved_generation = getattr(grid, 'generation', None)
+            self.saved_time = time.perf_counter()
+            return False
+        if grid is not self.grid:
+            # A new grid (loaded, say, or sent by the canvas server) is a
+            # different drawing from the one in the autosave file
+            self.grid = grid
+            self.save_soon()
+            return True
+        if not isinstance(grid, TrackedGrid):
+            return self._save_every_interval()
+        if grid.generation == self.saved_generation:
+            return False
+        if (grid.generation - self.saved_generation < self.changes and
+                time.perf_counter() - self.saved_time < self.interval):
+            return False
+        self.save_soon()
+        return True
+
+    def _save_every_interval(self) -> bool:
+        # A plain list of lists can't tell us whether it changed
+        if time.perf_counter() - self.saved_time < self.interval:
+            return False
+        self.save_soon()
+        return True
+
+    def save_soon(self):
+        '''
+        Takes a snapshot of the grid now and lets the saving thread write it.
+        If the last one isn't written yet, it is skipped for this newer one.
+        '''
+        grid = self.grid
+        if isinstance(grid, TrackedGrid):
+            snapshot = grid.snapshot()
+            self.saved_generation = grid.generation
+        else:
+            snapshot = PaletteGrid.from_lists(grid)
+        self.saved_time = time.perf_counter()
+        with self.lock:
+            self.waiting = snapshot
+            self.lock.notify()
+
+    def _work(self):
+        while True:
+            with self.lock:
+                while self.waiting is None and not self.stopping:
+                    self.lock.wait()
+                if self.waiting is None:
+                    return
+                snapshot, self.waiting = self.waiting, None
+            try:
+                save_grid(snapshot, self.path)
+                self.saves += 1
+            except OSError as error:
+                self.error = error
+
+    def close(self, remove: bool = False):
+        '''
+        Saves the last changes and waits for the saving thread to finish.
+        Closing again does nothing.
+
+        Args:
+            remove (bool): Whether to delete the autosave file instead, for
+                when the game ends normally and there is nothing to bring
+                back.
+        '''
+        if self.stopping:
+            return
+        if not remove and self.grid is not None and (
+                not isinstance(self.grid, TrackedGrid) or
+                self.grid.generation != self.saved_generation):
+            self.save_soon()
+        with self.lock:
+            if remove:
+                self.waiting = None
+            self.stopping = True
+            self.lock.notify()
+        self.thread.join()
+        if remove and os.path.exists(self.path):
+            os.remove(self.path)
+
+    def close_at_exit(self):
+        '''
+        Makes sure the last changes are saved when the program ends, even
+        when it ends with an error (unless close was called first).
+        '''
+        atexit.register(self.close)
+
+def restore(path: str) -> ChunkedGrid:
+    '''
+    Loads the grid an Autosaver saved.
+
+    Args:
+        path (str): The autosave file.
+    Returns:
+        ChunkedGrid: The grid.
+    '''
+    return load_grid(path, chunked=True)
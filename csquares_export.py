@@ -0,0 +1,171 @@
+'''
+Exporting Coloring Squares canvases as PNG pictures.
+
+The picture is made straight from the palette indexes of the grid, without
+drawing anything in the window: every cell becomes a square of scale by
+scale pixels. Since a grid only ever holds PALETTE colors, the PNG is an
+indexed one, with one byte per pixel that is the palette index itself. A
+PNG palette can't have more than 256 colors, so once custom colors grow the
+PALETTE past that, the picture is saved with red, green and blue for every
+pixel instead.
+
+Big canvases are cut into bands of rows. Each band is scaled up and
+compressed on its own (in a pool of processes when there is more than one
+band), and the compressed bands are written to the file one after the other
+as they come back. Only a few bands are ever in memory at once, however big
+the picture is.
+'''
+
+import os
+import struct
+import zlib
+import collections
+import multiprocessing
+import numpy
+from csquares_grid import palette_region
+
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+# Roughly how many pixel bytes each band may hold before it is compressed
+BAND_BYTES = 8 * 1024 * 1024
+# zlib's own number for "deflate, 32K window" and "default compression"
+ZLIB_HEADER = b'\x78\x9c'
+ADLER_BASE = 65521
+
+def write_chunk(png_file, kind: bytes, data: bytes):
+    '''
+    Writes one PNG chunk: its length, its kind, the data and a checksum.
+
+    Args:
+        png_file (file): The file opened for writing bytes.
+        kind (bytes): The four letters of the chunk kind, like b'IDAT'.
+        data (bytes): What goes in the chunk.
+    '''
+    png_file.write(struct.pack('>I', len(data)))
+    png_file.write(kind)
+    png_file.write(data)
+    png_file.write(struct.pack('>I', zlib.crc32(data, zlib.crc32(kind))))
+
+def adler32_combine(first: int, second: int, second_length: int) -> int:
+    '''
+    Works out the Adler-32 checksum of two pieces of data joined together
+    from the checksums of the pieces (the same way zlib does), so the bands
+    can be checksummed separately.
+
+    Args:
+        first (int): The checksum of the first piece.
+        second (int): The checksum of the second piece.
+        second_length (int): How many bytes the second piece has.
+    Returns:
+        int: The checksum of both pieces together.
+    '''
+    remainder = second_length % ADLER_BASE
+    sum1 = first & 0xffff
+    sum2 = (remainder * sum1) % ADLER_BASE
+    sum1 = (sum1 + (second & 0xffff) + ADLER_BASE - 1) % ADLER_BASE
+    sum2 = (sum2 + (first >> 16) + (second >> 16) + ADLER_BASE - remainder) % ADLER_BASE
+    return sum1 | (sum2 << 16)
+
+def compress_band(band: numpy.ndarray, scale: int,
+                  colors: numpy.ndarray = None) -> (bytes, int, int):
+    '''
+    Turns a band of palette indexes into compressed PNG rows. Each cell
+    becomes scale by scale pixels, and each row of pixels starts with a 0
+    (no filter). The rows are compressed as a piece of a longer deflate
+    stream, so the bands can simply be written one after the other.
+
+    Args:
+        band (numpy.ndarray): The palette indexes, top row first.
+        scale (int): How many pixels wide and high each cell is.
+        colors (numpy.ndarray): For pictures without a palette, the red,
+            green and blue of every color, to write instead of the indexes.
+    Returns:
+        bytes: The compressed rows.
+        int: The Adler-32 checksum of the rows before compressing.
+        int: How many bytes the rows had before compressing.
+    '''
+    height, width = band.shape
+    pixels = numpy.repeat(numpy.repeat(band, scale, axis=0), scale, axis=1)
+    if colors is not None:
+        pixels = colors[pixels].reshape(height * scale, width * scale * 3)
+    rows = numpy.zeros((height * scale, pixels.shape[1] + 1), dtype=numpy.uint8)
+    rows[:, 1:] = pixels
+    raw = rows.tobytes()
+    # A negative window size makes plain deflate data, without zlib's header
+    compressor = zlib.compressobj(zlib.Z_DEFAULT_COMPRESSION, zlib.DEFLATED, -15)
+    data = compressor.compress(raw) + compressor.flush(zlib.Z_SYNC_FLUSH)
+    return data, zlib.adler32(raw), len(raw)
+
+def compress_bands(jobs, use_pool: bool, processes: int = None):
+    '''
+    Compresses bands in order, handing each one back as soon as it is done.
+    With a pool, only a couple of bands per process are given out at a time,
+    so the bands waiting to be compressed don't pile up in memory.
+
+    Args:
+        jobs: The (band, scale, colors) arguments for compress_band, in order.
+        use_pool (bool): Whether to compress in a pool of processes.
+        processes (int): How many processes the pool has (by default, one
+            per CPU).
+    Yields:
+        (bytes, int, int): What compress_band gives back for each band.
+    '''
+    if not use_pool:
+        for job in jobs:
+            yield compress_band(*job)
+        return
+    with multiprocessing.Pool(processes) as pool:
+        waiting = collections.deque()
+        most_waiting = 2 * (processes or os.cpu_count() or 1)
+        for job in jobs:
+            waiting.append(pool.apply_async(compress_band, job))
+            if len(waiting) >= most_waiting:
+                yield waiting.popleft().get()
+        while waiting:
+            yield waiting.popleft().get()
+
+def export_png(grid: [[str]], path: str, scale: int, colors: [(int, int, int)],
+               processes: int = None, area: (int, int, int, int) = None):
+    '''
+    Saves a grid (or a rectangle of it) as a PNG picture.
+
+    Args:
+        grid ([[str]]): Any kind of grid.
+        path (str): The file to write.
+        scale (int): How many pixels wide and high each cell is.
+        colors ([(int, int, int)]): The red, green and blue of every color,
+            in PALETTE order.
+        processes (int): How many processes to compress with (by default,
+            one per CPU). Pictures of a single band don't start any.
+        area ((int, int, int, int)): The first column, first row, column
+            after the last one and row after the last one to save (by
+            default, the whole grid).
+    '''
+    if area is None:
+        area = (0, 0, len(grid[0]) if grid else 0, len(grid))
+    left, bottom, right, top = area
+    height, width = top - bottom, right - left
+    indexed = len(colors) <= 256
+    pixel_bytes = 1 if indexed else 3
+    band_height = max(1, BAND_BYTES // max(1, (width * scale * pixel_bytes + 1) * scale))
+    values = None if indexed else numpy.array([color[:3] for color in colors], dtype=numpy.uint8)
+    # PNG rows go from the top down, but grid rows go from the bottom up
+    tops = range(top, bottom, -band_height)
+    jobs = ((palette_region(grid, left, max(band_top - band_height, bottom), right, band_top)[::-1],
+             scale, values)
+            for band_top in tops)
+    with open(path, 'wb') as png_file:
+        png_file.write(PNG_SIGNATURE)
+        # 8 bits per sample, palette colors (3) or red, green and blue (2),
+        # no interlacing
+        write_chunk(png_file, b'IHDR', struct.pack('>IIBBBBB', width * scale, height * scale,
+                                                   8, 3 if indexed else 2, 0, 0, 0))
+        if indexed:
+            write_chunk(png_file, b'PLTE', b''.join(bytes(color[:3]) for color in colors))
+        write_chunk(png_file, b'IDAT', ZLIB_HEADER)
+        checksum = zlib.adler32(b'')
+        for data, band_checksum, length in compress_bands(jobs, len(tops) > 1, processes):
+            write_chunk(png_file, b'IDAT', data)
+            checksum = adler32_combine(checksum, band_checksum, length)
+        # An empty last block ends the deflate data, then comes the checksum
+        write_chunk(png_file, b'IDAT', b'\x03\x00' + struct.pack('>I', checksum))
+        write_chunk(png_file, b'IEND', b'')
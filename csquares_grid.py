@@ -0,0 +1,1447 @@
+'''
+Grid storage for Coloring Squares.
+
+A grid is a list of lists of color strings, where the rows go from the bottom
+of the window to the top. The Grid class below is such a list that also keeps
+track of which cells have been changed, so that drawing and checking the grid
+can skip the work when nothing happened.
+
+The PaletteGrid class stores the same thing much more compactly: every cell
+is a single byte holding the position of its color in PALETTE. The
+ChunkedGrid class stores those bytes in square chunks that are only made
+once something is painted in them, for canvases much bigger than the window.
+
+Nothing here needs arcade, so tools and tests can use the grids without
+loading it (or opening a window).
+'''
+
+import math
+import numpy
+
+# The colors a grid can hold. A PaletteGrid stores the position of a color in
+# this list instead of its name, so white (0) is what an empty grid holds.
+PALETTE = ['white', 'red', 'orange', 'yellow', 'green', 'blue', 'purple',
+           'magenta', 'black', 'apricot', 'brown']
+# The position of each color in the PALETTE
+PALETTE_INDEX = {color: index for index, color in enumerate(PALETTE)}
+# The red, green and blue of each color (the same as arcade.color has)
+COLOR_VALUES = {
+    'white': (255, 255, 255),
+    'red': (255, 0, 0),
+    'orange': (255, 165, 0),
+    'yellow': (255, 255, 0),
+    'green': (0, 255, 0),
+    'blue': (0, 0, 255),
+    'purple': (128, 0, 128),
+    'magenta': (255, 0, 255),
+    'black': (0, 0, 0),
+    'apricot': (251, 206, 177),
+    'brown': (165, 42, 42)
+}
+# The same color values, in PALETTE order
+PALETTE_VALUES = [COLOR_VALUES[color] for color in PALETTE]
+# The most colors the PALETTE can grow to, so an index fits in 2 bytes
+MAX_COLORS = 65536
+
+def custom_color(red: int, green: int, blue: int) -> str:
+    '''
+    Makes a color out of any red, green and blue, adding it to the PALETTE
+    the first time. Its name is the usual '#rrggbb' way of writing it.
+
+    Args:
+        red (int): How much red, from 0 to 255.
+        green (int): How much green, from 0 to 255.
+        blue (int): How much blue, from 0 to 255.
+    Returns:
+        str: The name of the color, to use like 'red' or 'blue'.
+    '''
+    color = '#{:02x}{:02x}{:02x}'.format(red, green, blue)
+    color_index(color)
+    return color
+
+def color_index(color: str) -> int:
+    '''
+    Looks up the position of a color in the PALETTE. A '#rrggbb' color
+    that isn't there yet is added to the end.
+
+    Args:
+        color (str): The name of the color.
+    Returns:
+        int: The palette index of the color.
+    Raises:
+        KeyError: If there is no color by that name.
+        ValueError: If the PALETTE is already full.
+    '''
+    index = PALETTE_INDEX.get(color)
+    if index is not None:
+        return index
+    if len(color) != 7 or color[0] != '#':
+        raise KeyError(color)
+    value = (int(color[1:3], 16), int(color[3:5], 16), int(color[5:7], 16))
+    color = color.lower()
+    if color in PALETTE_INDEX:
+        return PALETTE_INDEX[color]
+    if len(PALETTE) >= MAX_COLORS:
+        raise ValueError("There is no room for more than {} colors".format(MAX_COLORS))
+    # The lists are changed in place, so everyone holding them sees the new color
+    PALETTE_INDEX[color] = len(PALETTE)
+    PALETTE.append(color)
+    COLOR_VALUES[color] = value
+    PALETTE_VALUES.append(value)
+    return PALETTE_INDEX[color]
+
+def index_type(largest: int = None) -> type:
+    '''
+    Picks the smallest kind of array element that holds palette indexes:
+    one byte while there are 256 colors or fewer, two bytes after that.
+
+    Args:
+        largest (int): The largest index to hold (by default, the largest
+            index in the PALETTE).
+    Returns:
+        type: numpy.uint8 or numpy.uint16.
+    '''
+    if largest is None:
+        largest = len(PALETTE) - 1
+    return numpy.uint8 if largest < 256 else numpy.uint16
+
+def make_room(indexes: numpy.ndarray, largest: int) -> numpy.ndarray:
+    '''
+    Makes sure an array of palette indexes can hold the given index, giving
+    back a two byte copy of it if it can't.
+
+    Args:
+        indexes (numpy.ndarray): The palette indexes.
+        largest (int): The index the array has to hold.
+    Returns:
+        numpy.ndarray: The same array, or the wider copy.
+    '''
+    if largest <= numpy.iinfo(indexes.dtype).max:
+        return indexes
+    return indexes.astype(numpy.uint16)
+
+def clip_block(left: int, bottom: int, indexes: numpy.ndarray, width: int,
+               height: int) -> (int, int, numpy.ndarray):
+    '''
+    Cuts a block of palette indexes down to the part inside a grid.
+
+    Args:
+        left (int): The column of the left side of the block.
+        bottom (int): The row of the bottom of the block.
+        indexes (numpy.ndarray): The palette indexes, one row per grid row.
+        width (int): How many columns the grid has.
+        height (int): How many rows the grid has.
+    Returns:
+        (int, int, numpy.ndarray): The left side and bottom of the part inside
+            the grid, and its palette indexes.
+    '''
+    skip_x, skip_y = max(-left, 0), max(-bottom, 0)
+    indexes = indexes[skip_y:max(height - bottom, 0), skip_x:max(width - left, 0)]
+    return left + skip_x, bottom + skip_y, indexes
+
+# How many cells wide (and high) each chunk of a ChunkedGrid is
+CHUNK_SIZE = 64
+
+class TrackedGrid:
+    '''
+    The bookkeeping shared by the grids that remember their changes.
+
+    Attributes:
+        generation (int): Goes up by one every time the grid changes.
+        dirty ({(int, int)}): The (x, y) cells changed since the last draw.
+        all_dirty (bool): Whether every cell has to be drawn again.
+        stats (ColorStats): Kept up to date with every change, once
+            track_stats has been called (otherwise None).
+    '''
+    def start_tracking(self):
+        '''
+        Sets up the tracking for a brand new grid, where every cell counts as
+        changed until it has been drawn once.
+        '''
+        self.generation = 0
+        self.dirty = set()
+        self.all_dirty = True
+        self.stats = None
+
+    def track_stats(self) -> 'ColorStats':
+        '''
+        Starts keeping count of the colors of the grid, if it isn't already.
+        Counting takes one look at every cell (only at the chunks made, for a
+        ChunkedGrid), after that every change just updates the counts.
+
+        Returns:
+            ColorStats: The counts.
+        '''
+        if self.stats is None:
+            self.stats = ColorStats(self)
+        return self.stats
+
+    def mark_dirty(self, x: int, y: int):
+        '''
+        Remembers that one cell changed.
+
+        Args:
+            x (int): The column of the cell.
+            y (int): The row of the cell.
+        '''
+        self.generation += 1
+        if not self.all_dirty:
+            self.dirty.add((x, y))
+
+    def mark_cells_dirty(self, xs: numpy.ndarray, ys: numpy.ndarray):
+        '''
+        Remembers that a whole batch of cells changed at once.
+
+        Args:
+            xs (numpy.ndarray): The columns of the cells.
+            ys (numpy.ndarray): The rows of the cells, in the same order.
+        '''
+        self.generation += 1
+        if not self.all_dirty:
+            self.dirty.update(zip(xs.tolist(), ys.tolist()))
+
+    def mark_all_dirty(self):
+        '''
+        Remembers that (possibly) every cell changed.
+        '''
+        self.generation += 1
+        self.dirty.clear()
+        self.all_dirty = True
+
+    def paint_cells(self, xs: numpy.ndarray, ys: numpy.ndarray, color: str) -> int:
+        '''
+        Changes many cells to the same color.
+
+        Args:
+            xs (numpy.ndarray): The columns of the cells.
+            ys (numpy.ndarray): The rows of the cells, in the same order.
+            color (str): The new color for the cells.
+        Returns:
+            int: How many cells actually changed.
+        '''
+        changed = 0
+        for x, y in zip(xs.tolist(), ys.tolist()):
+            changed += self.set_color(x, y, color)
+        return changed
+
+    def take_dirty(self) -> (bool, {(int, int)}):
+        '''
+        Hands over the changes made since the last call and forgets them.
+
+        Returns:
+            bool: Whether every cell changed.
+            {(int, int)}: The (x, y) cells that changed otherwise.
+        '''
+        all_dirty, dirty = self.all_dirty, self.dirty
+        self.all_dirty = False
+        self.dirty = set()
+        return all_dirty, dirty
+
+class Grid(TrackedGrid, list):
+    '''
+    A 2D list of colors (the same thing make_grid_color makes) that remembers
+    which of its cells have changed.
+
+    The cells should be changed through set_color and fill instead of
+    assigning into the rows directly, otherwise the changes are not noticed.
+
+    Args:
+        rows ([[str]]): The rows of colors to start with.
+
+    Attributes:
+        row_generations ([int]): The generation each row last changed in.
+    '''
+    def __init__(self, rows: [[str]] = ()):
+        super().__init__(rows)
+        self.start_tracking()
+        self.row_generations = [0] * len(self)
+
+    def set_color(self, x: int, y: int, color: str) -> bool:
+        '''
+        Changes the color of one cell, remembering it only if it is different.
+
+        Args:
+            x (int): The column of the cell.
+            y (int): The row of the cell.
+            color (str): The new color for the cell.
+        Returns:
+            bool: Whether the cell actually changed.
+        '''
+        # Note that it's row/column, so y comes first
+        row = self[y]
+        if row[x] == color:
+            return False
+        if self.stats is not None:
+            self.stats.change(numpy.array([x]), numpy.array([y]),
+                              numpy.array([color_index(row[x])]), color_index(color))
+        row[x] = color
+        self.mark_dirty(x, y)
+        self.row_generations[y] = self.generation
+        return True
+
+    def fill(self, color: str):
+        '''
+        Changes every cell of the grid to the given color.
+
+        Args:
+            color (str): The new color for all the cells.
+        '''
+        for row in self:
+            row[:] = [color] * len(row)
+        if self.stats is not None:
+            self.stats.fill(color_index(color))
+        self.mark_all_dirty()
+        self.row_generations = [self.generation] * len(self)
+
+    def snapshot(self) -> 'PaletteGrid':
+        '''
+        Makes a copy of the grid that doesn't change when the grid does.
+
+        Returns:
+            PaletteGrid: The copy, as a PaletteGrid.
+        '''
+        return PaletteGrid.from_lists(self)
+
+    def changed_rows(self, since: int) -> [int]:
+        '''
+        Finds the rows that changed after the given generation.
+
+        Args:
+            since (int): An earlier value of the generation counter.
+        Returns:
+            [int]: The indexes of the rows that changed since then.
+        '''
+        if len(self.row_generations) != len(self):
+            # Rows were added or removed behind our back
+            return list(range(len(self)))
+        return [y for y, generation in enumerate(self.row_generations)
+                if generation > since]
+
+class PaletteGrid(TrackedGrid):
+    '''
+    A grid that keeps every cell as a single byte: the position of its color
+    in the PALETTE. (Once a color past the first 256 is painted, every cell
+    takes two bytes instead.) It can still be used like a list of lists of
+    colors, so grid[y][x] reads and writes color names, but whole-grid work
+    should use the cells array directly.
+
+    Args:
+        width (int): The number of cells in each row.
+        height (int): The number of rows.
+        color (str): The color to start every cell with.
+
+    Attributes:
+        width (int): The number of cells in each row.
+        height (int): The number of rows.
+        cells (numpy.ndarray): The palette indexes, as a height by width array
+            of unsigned bytes (or two byte numbers).
+        journal (History): Told about every change, if set (see
+            csquares_history).
+    '''
+    def __init__(self, width: int, height: int, color: str = 'white'):
+        self.width = width
+        self.height = height
+        index = color_index(color)
+        self.cells = numpy.full((height, width), index, dtype=index_type(index))
+        self.journal = None
+        self.start_tracking()
+
+    @classmethod
+    def from_lists(cls, rows: [[str]]) -> 'PaletteGrid':
+        '''
+        Makes a PaletteGrid holding the same colors as a list of lists.
+
+        Args:
+            rows ([[str]]): The list of lists (a 2-Dimensional list) of colors.
+        Returns:
+            PaletteGrid: The new grid.
+        '''
+        grid = cls(len(rows[0]) if rows else 0, len(rows))
+        grid.cells = palette_indexes(rows).copy()
+        return grid
+
+    def snapshot(self) -> 'PaletteGrid':
+        '''
+        Makes a copy of the grid that doesn't change when the grid does.
+
+        Returns:
+            PaletteGrid: The copy.
+        '''
+        grid = PaletteGrid(0, 0)
+        grid.width, grid.height, grid.cells = self.width, self.height, self.cells.copy()
+        return grid
+
+    def __len__(self) -> int:
+        return self.height
+
+    def __getitem__(self, y: int) -> 'PaletteRow':
+        return PaletteRow(self, y)
+
+    def __iter__(self):
+        for y in range(self.height):
+            yield self[y]
+
+    def __repr__(self) -> str:
+        return 'PaletteGrid({}x{})'.format(self.width, self.height)
+
+    def to_lists(self) -> [[str]]:
+        '''
+        Gives back the colors as a plain list of lists of color names.
+
+        Returns:
+            [[str]]: The list of lists (a 2-Dimensional list) of colors.
+        '''
+        return [[PALETTE[index] for index in row] for row in self.cells.tolist()]
+
+    def get_color(self, x: int, y: int) -> str:
+        '''
+        Looks up the color of one cell.
+
+        Args:
+            x (int): The column of the cell.
+            y (int): The row of the cell.
+        Returns:
+            str: The color of the cell.
+        '''
+        return PALETTE[self.cells[y, x]]
+
+    def region(self, left: int, bottom: int, right: int, top: int) -> numpy.ndarray:
+        '''
+        Gives the palette indexes of a rectangle of cells. The rectangle is
+        cut down to the part inside the grid.
+
+        Args:
+            left (int): The first column.
+            bottom (int): The first row.
+            right (int): The column after the last one.
+            top (int): The row after the last one.
+        Returns:
+            numpy.ndarray: The palette indexes, one row per grid row (part of
+                the cells array, not a copy).
+        '''
+        return self.cells[max(bottom, 0):max(top, 0), max(left, 0):max(right, 0)]
+
+    def read_cells(self, xs: numpy.ndarray, ys: numpy.ndarray) -> numpy.ndarray:
+        '''
+        Looks up the palette indexes of a batch of cells.
+
+        Args:
+            xs (numpy.ndarray): The columns of the cells.
+            ys (numpy.ndarray): The rows of the cells, in the same order.
+        Returns:
+            numpy.ndarray: The palette index of each cell.
+        '''
+        return self.cells[ys, xs]
+
+    def write_cells(self, xs: numpy.ndarray, ys: numpy.ndarray, indexes: numpy.ndarray):
+        '''
+        Puts palette indexes straight into cells, without telling the journal
+        (the History uses this to undo and redo).
+
+        Args:
+            xs (numpy.ndarray): The columns of the cells.
+            ys (numpy.ndarray): The rows of the cells, in the same order.
+            indexes (numpy.ndarray): The palette index for each cell, or a
+                single one for all of them.
+        '''
+        if len(xs):
+            self.cells = make_room(self.cells, int(numpy.max(indexes)))
+        if self.stats is not None:
+            self.stats.change(xs, ys, self.cells[ys, xs], indexes)
+        self.cells[ys, xs] = indexes
+        self.mark_cells_dirty(xs, ys)
+
+    def write_region(self, left: int, bottom: int, indexes: numpy.ndarray):
+        '''
+        Puts a block of palette indexes straight into the grid, without
+        telling the journal. Only the part of the block inside the grid is
+        written.
+
+        Args:
+            left (int): The column of the left side of the block.
+            bottom (int): The row of the bottom of the block.
+            indexes (numpy.ndarray): The palette indexes, one row per grid row.
+        '''
+        left, bottom, indexes = clip_block(left, bottom, indexes, self.width, self.height)
+        height, width = indexes.shape
+        if indexes.size:
+            self.cells = make_room(self.cells, int(indexes.max()))
+        if self.stats is not None:
+            self.stats.change_region(left, bottom, self.region(left, bottom, left + width,
+                                                               bottom + height), indexes)
+        self.cells[bottom:bottom + height, left:left + width] = indexes
+        self.mark_all_dirty()
+
+    def fill_index(self, index: int):
+        '''
+        Changes every cell to the same palette index, without telling the
+        journal (the History uses this to redo a fill).
+
+        Args:
+            index (int): The palette index for all the cells.
+        '''
+        self.cells = make_room(self.cells, index)
+        self.cells.fill(index)
+        if self.stats is not None:
+            self.stats.fill(index)
+        self.mark_all_dirty()
+
+    def set_color(self, x: int, y: int, color: str) -> bool:
+        '''
+        Changes the color of one cell, remembering it only if it is different.
+
+        Args:
+            x (int): The column of the cell.
+            y (int): The row of the cell.
+            color (str): The new color for the cell.
+        Returns:
+            bool: Whether the cell actually changed.
+        '''
+        index = color_index(color)
+        old = self.cells[y, x]
+        if old == index:
+            return False
+        if self.journal is not None:
+            self.journal.record_cells(numpy.array([y * self.width + x]),
+                                      numpy.array([old]), index)
+        if self.stats is not None:
+            self.stats.change(numpy.array([x]), numpy.array([y]), numpy.array([old]), index)
+        self.cells = make_room(self.cells, index)
+        self.cells[y, x] = index
+        self.mark_dirty(x, y)
+        return True
+
+    def fill(self, color: str):
+        '''
+        Changes every cell of the grid to the given color.
+
+        Args:
+            color (str): The new color for all the cells.
+        '''
+        index = color_index(color)
+        if self.journal is not None:
+            self.journal.record_fill(self.cells, index)
+        self.fill_index(index)
+
+    def paint_cells(self, xs: numpy.ndarray, ys: numpy.ndarray, color: str) -> int:
+        '''
+        Changes many cells to the same color with a single array write.
+
+        Args:
+            xs (numpy.ndarray): The columns of the cells.
+            ys (numpy.ndarray): The rows of the cells, in the same order.
+            color (str): The new color for the cells.
+        Returns:
+            int: How many cells actually changed.
+        '''
+        index = color_index(color)
+        # Only the cells that are not that color yet count as changes
+        changed = self.cells[ys, xs] != index
+        xs, ys = xs[changed], ys[changed]
+        if len(xs):
+            old = self.cells[ys, xs]
+            if self.journal is not None:
+                self.journal.record_cells(ys * self.width + xs, old, index)
+            if self.stats is not None:
+                self.stats.change(xs, ys, old, index)
+            self.cells = make_room(self.cells, index)
+            self.cells[ys, xs] = index
+            self.mark_cells_dirty(xs, ys)
+        return len(xs)
+
+class ChunkedGrid(TrackedGrid):
+    '''
+    A grid split up into square chunks of CHUNK_SIZE by CHUNK_SIZE cells,
+    each kept as bytes like the cells of a PaletteGrid. A chunk is only made
+    once one of its cells is painted; until then all of its cells have the
+    background color. A huge canvas that is mostly empty costs next to
+    nothing, and work can stay with the chunks around the part being looked at.
+
+    It is used like a PaletteGrid (grid[y][x], set_color, paint_cells, fill),
+    but has no single cells array: region copies out the part that is needed.
+
+    Args:
+        width (int): The number of cells in each row.
+        height (int): The number of rows.
+        color (str): The color to start every cell with.
+
+    Attributes:
+        width (int): The number of cells in each row.
+        height (int): The number of rows.
+        background (int): The palette index of every cell in the chunks that
+            haven't been made.
+        chunks ({(int, int): numpy.ndarray}): The chunks made so far, by the
+            (column, row) of the chunk. Each is a CHUNK_SIZE by CHUNK_SIZE
+            array of palette indexes (cells past the edge of the grid are
+            never used), one byte each unless the chunk holds a color past
+            the first 256.
+        journal (History): Told about every change, if set (see
+            csquares_history).
+    '''
+    def __init__(self, width: int, height: int, color: str = 'white'):
+        self.width = width
+        self.height = height
+        self.background = color_index(color)
+        self.chunks = {}
+        self.journal = None
+        self.start_tracking()
+
+    def __len__(self) -> int:
+        return self.height
+
+    def __getitem__(self, y: int) -> 'PaletteRow':
+        return PaletteRow(self, y)
+
+    def __iter__(self):
+        for y in range(self.height):
+            yield self[y]
+
+    def __repr__(self) -> str:
+        return 'ChunkedGrid({}x{}, {} chunks)'.format(self.width, self.height, len(self.chunks))
+
+    def to_lists(self) -> [[str]]:
+        '''
+        Gives back the colors as a plain list of lists of color names.
+
+        Returns:
+            [[str]]: The list of lists (a 2-Dimensional list) of colors.
+        '''
+        rows = self.region(0, 0, self.width, self.height).tolist()
+        return [[PALETTE[index] for index in row] for row in rows]
+
+    def get_index(self, x: int, y: int) -> int:
+        '''
+        Looks up the palette index of one cell.
+
+        Args:
+            x (int): The column of the cell.
+            y (int): The row of the cell.
+        Returns:
+            int: The palette index of the cell.
+        '''
+        chunk = self.chunks.get((x // CHUNK_SIZE, y // CHUNK_SIZE))
+        if chunk is None:
+            return self.background
+        return int(chunk[y % CHUNK_SIZE, x % CHUNK_SIZE])
+
+    def get_color(self, x: int, y: int) -> str:
+        '''
+        Looks up the color of one cell.
+
+        Args:
+            x (int): The column of the cell.
+            y (int): The row of the cell.
+        Returns:
+            str: The color of the cell.
+        '''
+        return PALETTE[self.get_index(x, y)]
+
+    def make_chunk(self, chunk_x: int, chunk_y: int, largest: int = 0) -> numpy.ndarray:
+        '''
+        Gives back a chunk, making it (all background) if it isn't made yet.
+
+        Args:
+            chunk_x (int): The column of the chunk.
+            chunk_y (int): The row of the chunk.
+            largest (int): The largest palette index the chunk must be able
+                to hold.
+        Returns:
+            numpy.ndarray: The palette indexes of the chunk.
+        '''
+        chunk = self.chunks.get((chunk_x, chunk_y))
+        if chunk is None:
+            chunk = numpy.full((CHUNK_SIZE, CHUNK_SIZE), self.background,
+                               dtype=index_type(max(largest, self.background)))
+            self.chunks[chunk_x, chunk_y] = chunk
+        else:
+            wider = make_room(chunk, largest)
+            if wider is chunk and not chunk.flags.writeable:
+                # A chunk shared with a snapshot is copied before it is changed
+                wider = chunk.copy()
+            if wider is not chunk:
+                chunk = self.chunks[chunk_x, chunk_y] = wider
+        return chunk
+
+    def chunk_parts(self, xs: numpy.ndarray, ys: numpy.ndarray):
+        '''
+        Splits a batch of cells up by the chunk they are in.
+
+        Args:
+            xs (numpy.ndarray): The columns of the cells.
+            ys (numpy.ndarray): The rows of the cells, in the same order.
+        Yields:
+            (int, int): The (column, row) of a chunk.
+            numpy.ndarray: The positions in xs and ys of its cells.
+        '''
+        if len(xs) == 0:
+            return
+        chunk_xs, chunk_ys = xs // CHUNK_SIZE, ys // CHUNK_SIZE
+        # One number per chunk, so sorting puts the cells of a chunk together
+        keys = chunk_ys * self.width + chunk_xs
+        order = numpy.argsort(keys, kind='stable')
+        keys = keys[order]
+        for part in numpy.split(order, numpy.flatnonzero(keys[1:] != keys[:-1]) + 1):
+            yield (int(chunk_xs[part[0]]), int(chunk_ys[part[0]])), part
+
+    def read_cells(self, xs: numpy.ndarray, ys: numpy.ndarray) -> numpy.ndarray:
+        '''
+        Looks up the palette indexes of a batch of cells.
+
+        Args:
+            xs (numpy.ndarray): The columns of the cells.
+            ys (numpy.ndarray): The rows of the cells, in the same order.
+        Returns:
+            numpy.ndarray: The palette index of each cell.
+        '''
+        indexes = numpy.full(len(xs), self.background, dtype=index_type())
+        for key, part in self.chunk_parts(xs, ys):
+            chunk = self.chunks.get(key)
+            if chunk is not None:
+                indexes[part] = chunk[ys[part] % CHUNK_SIZE, xs[part] % CHUNK_SIZE]
+        return indexes
+
+    def write_cells(self, xs: numpy.ndarray, ys: numpy.ndarray, indexes: numpy.ndarray,
+                    old: numpy.ndarray = None):
+        '''
+        Puts palette indexes straight into cells, without telling the journal
+        (the History uses this to undo and redo).
+
+        Args:
+            xs (numpy.ndarray): The columns of the cells.
+            ys (numpy.ndarray): The rows of the cells, in the same order.
+            indexes (numpy.ndarray): The palette index for each cell, or a
+                single one for all of them.
+            old (numpy.ndarray): The palette indexes the cells have now, if
+                already known (they are only needed for the stats).
+        '''
+        indexes = numpy.broadcast_to(indexes, xs.shape)
+        if self.stats is not None:
+            self.stats.change(xs, ys, self.read_cells(xs, ys) if old is None else old, indexes)
+        for (chunk_x, chunk_y), part in self.chunk_parts(xs, ys):
+            chunk = self.make_chunk(chunk_x, chunk_y, int(indexes[part].max()))
+            chunk[ys[part] % CHUNK_SIZE, xs[part] % CHUNK_SIZE] = indexes[part]
+        self.mark_cells_dirty(xs, ys)
+
+    def chunks_in(self, left: int, bottom: int, right: int, top: int) -> [(int, int)]:
+        '''
+        Finds the chunks that touch a rectangle of cells, whether they have
+        been made or not. The rectangle is cut down to the part inside the grid.
+
+        Args:
+            left (int): The first column.
+            bottom (int): The first row.
+            right (int): The column after the last one.
+            top (int): The row after the last one.
+        Returns:
+            [(int, int)]: The (column, row) of each chunk.
+        '''
+        left, bottom = max(left, 0), max(bottom, 0)
+        right, top = min(right, self.width), min(top, self.height)
+        if left >= right or bottom >= top:
+            return []
+        return [(chunk_x, chunk_y)
+                for chunk_y in range(bottom // CHUNK_SIZE, (top - 1) // CHUNK_SIZE + 1)
+                for chunk_x in range(left // CHUNK_SIZE, (right - 1) // CHUNK_SIZE + 1)]
+
+    def region(self, left: int, bottom: int, right: int, top: int) -> numpy.ndarray:
+        '''
+        Copies out the palette indexes of a rectangle of cells. The rectangle
+        is cut down to the part inside the grid.
+
+        Args:
+            left (int): The first column.
+            bottom (int): The first row.
+            right (int): The column after the last one.
+            top (int): The row after the last one.
+        Returns:
+            numpy.ndarray: The palette indexes, one row per grid row.
+        '''
+        left, bottom = max(left, 0), max(bottom, 0)
+        right, top = max(min(right, self.width), left), max(min(top, self.height), bottom)
+        area = numpy.full((top - bottom, right - left), self.background, dtype=index_type())
+        for chunk_x, chunk_y in self.chunks_in(left, bottom, right, top):
+            chunk = self.chunks.get((chunk_x, chunk_y))
+            if chunk is None:
+                continue
+            # The part of the rectangle this chunk covers
+            x0, y0 = chunk_x * CHUNK_SIZE, chunk_y * CHUNK_SIZE
+            x1, x2 = max(left, x0), min(right, x0 + CHUNK_SIZE)
+            y1, y2 = max(bottom, y0), min(top, y0 + CHUNK_SIZE)
+            area[y1-bottom:y2-bottom, x1-left:x2-left] = chunk[y1-y0:y2-y0, x1-x0:x2-x0]
+        return area
+
+    def write_region(self, left: int, bottom: int, indexes: numpy.ndarray):
+        '''
+        Puts a block of palette indexes straight into the grid, without
+        telling the journal. Only the part of the block inside the grid is
+        written, and chunks are only made where it has something besides the
+        background color.
+
+        Args:
+            left (int): The column of the left side of the block.
+            bottom (int): The row of the bottom of the block.
+            indexes (numpy.ndarray): The palette indexes, one row per grid row.
+        '''
+        left, bottom, indexes = clip_block(left, bottom, indexes, self.width, self.height)
+        height, width = indexes.shape
+        right, top = left + width, bottom + height
+        if self.stats is not None:
+            self.stats.change_region(left, bottom, self.region(left, bottom, right, top), indexes)
+        for chunk_x, chunk_y in self.chunks_in(left, bottom, right, top):
+            x0, y0 = chunk_x * CHUNK_SIZE, chunk_y * CHUNK_SIZE
+            x1, x2 = max(left, x0), min(right, x0 + CHUNK_SIZE)
+            y1, y2 = max(bottom, y0), min(top, y0 + CHUNK_SIZE)
+            block = indexes[y1-bottom:y2-bottom, x1-left:x2-left]
+            if (chunk_x, chunk_y) not in self.chunks and (block == self.background).all():
+                continue
+            chunk = self.make_chunk(chunk_x, chunk_y, int(block.max()))
+            chunk[y1-y0:y2-y0, x1-x0:x2-x0] = block
+        self.mark_all_dirty()
+
+    def snapshot(self) -> 'ChunkedGrid':
+        '''
+        Makes a copy of the grid that doesn't change when the grid does,
+        without copying any cells. The chunks are shared and marked read-only
+        instead, and make_chunk copies one the first time it is changed again,
+        so a snapshot costs about as much as the number of chunks.
+
+        Returns:
+            ChunkedGrid: The copy.
+        '''
+        grid = ChunkedGrid(self.width, self.height)
+        grid.background = self.background
+        for chunk in self.chunks.values():
+            chunk.flags.writeable = False
+        grid.chunks = dict(self.chunks)
+        return grid
+
+    def replace_chunks(self, chunks: {(int, int): numpy.ndarray}, background: int):
+        '''
+        Swaps in a whole new set of chunks and background, without telling
+        the journal (the History uses this to undo and redo a fill).
+
+        Args:
+            chunks ({(int, int): numpy.ndarray}): The chunks to use.
+            background (int): The palette index for the cells of the rest.
+        '''
+        self.chunks = dict(chunks)
+        self.background = background
+        if self.stats is not None:
+            self.stats.recount(self)
+        self.mark_all_dirty()
+
+    def set_color(self, x: int, y: int, color: str) -> bool:
+        '''
+        Changes the color of one cell, remembering it only if it is different.
+
+        Args:
+            x (int): The column of the cell.
+            y (int): The row of the cell.
+            color (str): The new color for the cell.
+        Returns:
+            bool: Whether the cell actually changed.
+        '''
+        index = color_index(color)
+        old = self.get_index(x, y)
+        if old == index:
+            return False
+        if self.journal is not None:
+            self.journal.record_cells(numpy.array([y * self.width + x]),
+                                      numpy.array([old]), index)
+        if self.stats is not None:
+            self.stats.change(numpy.array([x]), numpy.array([y]), numpy.array([old]), index)
+        chunk = self.make_chunk(x // CHUNK_SIZE, y // CHUNK_SIZE, index)
+        chunk[y % CHUNK_SIZE, x % CHUNK_SIZE] = index
+        self.mark_dirty(x, y)
+        return True
+
+    def fill(self, color: str):
+        '''
+        Changes every cell of the grid to the given color, by throwing all
+        the chunks away and changing the background.
+
+        Args:
+            color (str): The new color for all the cells.
+        '''
+        index = color_index(color)
+        if self.journal is not None:
+            self.journal.record_clear(self.chunks, self.background, index)
+        self.replace_chunks({}, index)
+
+    def paint_cells(self, xs: numpy.ndarray, ys: numpy.ndarray, color: str) -> int:
+        '''
+        Changes many cells to the same color, with one array write per chunk.
+
+        Args:
+            xs (numpy.ndarray): The columns of the cells.
+            ys (numpy.ndarray): The rows of the cells, in the same order.
+            color (str): The new color for the cells.
+        Returns:
+            int: How many cells actually changed.
+        '''
+        index = color_index(color)
+        old = self.read_cells(xs, ys)
+        # Only the cells that are not that color yet count as changes
+        changed = old != index
+        xs, ys = xs[changed], ys[changed]
+        if len(xs):
+            if self.journal is not None:
+                self.journal.record_cells(ys * self.width + xs, old[changed], index)
+            self.write_cells(xs, ys, index, old[changed])
+        return len(xs)
+
+class PaletteRow:
+    '''
+    One row of a PaletteGrid (or ChunkedGrid), read and written with color
+    names.
+
+    Args:
+        grid (PaletteGrid): The grid the row belongs to.
+        y (int): Which row of the grid this is.
+    '''
+    __slots__ = ('grid', 'y')
+
+    def __init__(self, grid: PaletteGrid, y: int):
+        self.grid = grid
+        self.y = y
+
+    def __len__(self) -> int:
+        return self.grid.width
+
+    def __getitem__(self, x: int) -> str:
+        return self.grid.get_color(x, self.y)
+
+    def __setitem__(self, x: int, color: str):
+        self.grid.set_color(x, self.y, color)
+
+    def __iter__(self):
+        row = self.grid.region(0, self.y, self.grid.width, self.y + 1)[0]
+        return (PALETTE[index] for index in row.tolist())
+
+    def __eq__(self, other) -> bool:
+        return list(self) == list(other)
+
+def palette_indexes(grid: [[str]]) -> numpy.ndarray:
+    '''
+    Gives the palette index of every cell of a grid as an array. For a
+    PaletteGrid this is its own cells array, not a copy. A ChunkedGrid has to
+    be copied out whole, so for big ones palette_region is better.
+
+    Args:
+        grid ([[str]]): Any kind of grid.
+    Returns:
+        numpy.ndarray: A height by width array of palette indexes.
+    '''
+    if isinstance(grid, PaletteGrid):
+        return grid.cells
+    if isinstance(grid, ChunkedGrid):
+        return grid.region(0, 0, grid.width, grid.height)
+    width = len(grid[0]) if grid else 0
+    rows = [[color_index(color) for color in row] for row in grid]
+    return numpy.array(rows, dtype=index_type()).reshape(len(grid), width)
+
+def palette_region(grid: [[str]], left: int, bottom: int, right: int, top: int) -> numpy.ndarray:
+    '''
+    Gives the palette indexes of a rectangle of cells of any kind of grid.
+    The rectangle is cut down to the part inside the grid.
+
+    Args:
+        grid ([[str]]): Any kind of grid.
+        left (int): The first column.
+        bottom (int): The first row.
+        right (int): The column after the last one.
+        top (int): The row after the last one.
+    Returns:
+        numpy.ndarray: The palette indexes, one row per grid row.
+    '''
+    if isinstance(grid, (PaletteGrid, ChunkedGrid)):
+        return grid.region(left, bottom, right, top)
+    return palette_indexes(grid)[max(bottom, 0):max(top, 0), max(left, 0):max(right, 0)]
+
+class ColorStats:
+    '''
+    How much of each color a grid holds and where it has been painted, kept
+    up to date by the grid as it changes (see TrackedGrid.track_stats), so
+    asking costs about as much as the size of the PALETTE instead of a look
+    at every cell. A cell counts as painted when it isn't white.
+
+    Args:
+        grid ([[str]]): The grid to count (any kind of grid).
+
+    Attributes:
+        width (int): The number of cells in each row of the grid.
+        height (int): The number of rows of the grid.
+        counts (numpy.ndarray): How many cells have each color, by palette
+            index.
+        row_counts (numpy.ndarray): How many cells of each row are painted.
+        column_counts (numpy.ndarray): How many cells of each column are
+            painted.
+    '''
+    def __init__(self, grid: [[str]]):
+        self.recount(grid)
+
+    def recount(self, grid: [[str]]):
+        '''
+        Counts every cell of the grid again. For a ChunkedGrid only the
+        chunks made are looked at, the rest all have the background color.
+
+        Args:
+            grid ([[str]]): The grid to count.
+        '''
+        self.height = len(grid)
+        self.width = len(grid[0]) if self.height else 0
+        self._bounds = None
+        if not isinstance(grid, ChunkedGrid):
+            cells = palette_indexes(grid)
+            self.counts = numpy.bincount(cells.ravel(), minlength=len(PALETTE)).astype(numpy.int64)
+            painted = cells != 0
+            self.row_counts = painted.sum(axis=1, dtype=numpy.int64)
+            self.column_counts = painted.sum(axis=0, dtype=numpy.int64)
+            return
+        self.fill(grid.background)
+        background_painted = int(grid.background != 0)
+        for (chunk_x, chunk_y), chunk in grid.chunks.items():
+            x0, y0 = chunk_x * CHUNK_SIZE, chunk_y * CHUNK_SIZE
+            # Cells past the edge of the grid are never used
+            part = chunk[:self.height - y0, :self.width - x0]
+            self.counts += numpy.bincount(part.ravel(), minlength=len(self.counts))
+            self.counts[grid.background] -= part.size
+            painted = part != 0
+            rows, columns = part.shape
+            self.row_counts[y0:y0 + rows] += painted.sum(axis=1) - background_painted * columns
+            self.column_counts[x0:x0 + columns] += painted.sum(axis=0) - background_painted * rows
+
+    def fill(self, index: int):
+        '''
+        Counts every cell as having the same color.
+
+        Args:
+            index (int): The palette index of all the cells.
+        '''
+        self.counts = numpy.zeros(len(PALETTE), dtype=numpy.int64)
+        self.counts[index] = self.width * self.height
+        painted = int(index != 0)
+        self.row_counts = numpy.full(self.height, painted * self.width, dtype=numpy.int64)
+        self.column_counts = numpy.full(self.width, painted * self.height, dtype=numpy.int64)
+        self._bounds = None
+
+    def _count(self, old: numpy.ndarray, new: numpy.ndarray):
+        if len(self.counts) < len(PALETTE):
+            # Colors were added to the PALETTE since
+            self.counts = numpy.concatenate(
+                (self.counts, numpy.zeros(len(PALETTE) - len(self.counts), dtype=numpy.int64)))
+        self.counts -= numpy.bincount(old, minlength=len(self.counts))
+        self.counts += numpy.bincount(new, minlength=len(self.counts))
+
+    def change(self, xs: numpy.ndarray, ys: numpy.ndarray, old: numpy.ndarray, new: numpy.ndarray):
+        '''
+        Counts a batch of cells changing color.
+
+        Args:
+            xs (numpy.ndarray): The columns of the cells.
+            ys (numpy.ndarray): The rows of the cells, in the same order.
+            old (numpy.ndarray): The palette index each cell had.
+            new (numpy.ndarray): The palette index each cell has now, or a
+                single one for all of them.
+        '''
+        new = numpy.broadcast_to(new, old.shape)
+        # A cell listed twice only changes once (to the last index given)
+        cells, last = numpy.unique((ys * self.width + xs)[::-1], return_index=True)
+        if len(cells) < len(xs):
+            last = len(xs) - 1 - last
+            xs, ys, old, new = xs[last], ys[last], old[last], new[last]
+        self._count(old, new)
+        # Only the cells that got painted or unpainted move the bounds
+        painted = (new != 0).astype(numpy.int64) - (old != 0)
+        moved = numpy.flatnonzero(painted)
+        if len(moved):
+            numpy.add.at(self.row_counts, ys[moved], painted[moved])
+            numpy.add.at(self.column_counts, xs[moved], painted[moved])
+            self._bounds = None
+
+    def change_region(self, left: int, bottom: int, old: numpy.ndarray, new: numpy.ndarray):
+        '''
+        Counts a block of cells changing color. The block is cut down to the
+        size of old, which is the part of it inside the grid.
+
+        Args:
+            left (int): The column of the left side of the block.
+            bottom (int): The row of the bottom of the block.
+            old (numpy.ndarray): The palette indexes the block had, one row
+                per grid row.
+            new (numpy.ndarray): The palette indexes it has now.
+        '''
+        rows, columns = old.shape
+        new = new[:rows, :columns]
+        self._count(old.ravel(), new.ravel())
+        painted = (new != 0).astype(numpy.int64) - (old != 0)
+        self.row_counts[bottom:bottom + rows] += painted.sum(axis=1)
+        self.column_counts[left:left + columns] += painted.sum(axis=0)
+        self._bounds = None
+
+    def color_counts(self) -> {str: int}:
+        '''
+        Gives how many cells have each color.
+
+        Returns:
+            {str: int}: The number of cells, by color, for the colors used.
+        '''
+        used = numpy.flatnonzero(self.counts)
+        return {PALETTE[index]: int(self.counts[index]) for index in used.tolist()}
+
+    def coverage(self) -> float:
+        '''
+        Gives how much of the grid is painted.
+
+        Returns:
+            float: The percentage of cells that aren't white.
+        '''
+        total = self.width * self.height
+        if not total:
+            return 0.0
+        return 100 * (total - int(self.counts[0])) / total
+
+    def bounds(self) -> (int, int, int, int):
+        '''
+        Finds the smallest rectangle holding every painted cell. It is only
+        looked for again after cells are painted or unpainted.
+
+        Returns:
+            (int, int, int, int): The first column, first row, column after
+                the last one and row after the last one, like region takes,
+                or None if nothing is painted.
+        '''
+        if self._bounds is None:
+            rows = numpy.flatnonzero(self.row_counts)
+            columns = numpy.flatnonzero(self.column_counts)
+            if len(rows):
+                self._bounds = (int(columns[0]), int(rows[0]),
+                                int(columns[-1]) + 1, int(rows[-1]) + 1)
+            else:
+                self._bounds = ()
+        return self._bounds or None
+
+    def report(self) -> dict:
+        '''
+        Puts all the stats together.
+
+        Returns:
+            dict: The 'coverage' percentage, the 'colors' counts and the
+                'bounds' of the painted cells.
+        '''
+        return {'coverage': self.coverage(), 'colors': self.color_counts(),
+                'bounds': self.bounds()}
+
+def canvas_stats(grid: [[str]]) -> ColorStats:
+    '''
+    Gives the color stats of any kind of grid. A grid that tracks its
+    changes keeps them up to date from then on; a plain list of lists is
+    counted again every time.
+
+    Args:
+        grid ([[str]]): The grid.
+    Returns:
+        ColorStats: The stats.
+    '''
+    if isinstance(grid, TrackedGrid):
+        return grid.track_stats()
+    return ColorStats(grid)
+
+def line_cells(points: [[int]]) -> (numpy.ndarray, numpy.ndarray):
+    '''
+    Finds every cell on the straight lines joining the points one after the
+    other, the way a pen dragged through them would. Neighbouring cells of a
+    line always touch, at least diagonally, so there are no gaps.
+
+    Args:
+        points ([[int]]): The [x, y] grid positions, in order.
+    Returns:
+        numpy.ndarray: The columns of the cells (with repeats).
+        numpy.ndarray: The rows of the cells, in the same order.
+    '''
+    points = numpy.array(points, dtype=int).reshape(-1, 2)
+    starts, ends = points[:-1], points[1:]
+    moves = ends - starts
+    # Move one cell at a time along the longer direction (a DDA line), all
+    # the lines at once: every step knows its line and how far along it is
+    steps = numpy.abs(moves).max(axis=1) if len(moves) else numpy.zeros(0, dtype=int)
+    lines = numpy.repeat(numpy.arange(len(steps)), steps)
+    t = (numpy.arange(len(lines)) - numpy.repeat(numpy.cumsum(steps) - steps, steps) + 1) / steps[lines]
+    xs = starts[lines, 0] + numpy.rint(moves[lines, 0] * t).astype(int)
+    ys = starts[lines, 1] + numpy.rint(moves[lines, 1] * t).astype(int)
+    return numpy.concatenate((points[:1, 0], xs)), numpy.concatenate((points[:1, 1], ys))
+
+def stroke_cells(points: [[int]], width: int, height: int) -> (numpy.ndarray, numpy.ndarray):
+    '''
+    Finds the cells of a grid that a stroke through the points covers, each
+    only once. Parts of the stroke outside of the grid are left out.
+
+    Args:
+        points ([[int]]): The [x, y] grid positions, in order.
+        width (int): The number of cells in each row of the grid.
+        height (int): The number of rows of the grid.
+    Returns:
+        numpy.ndarray: The columns of the cells.
+        numpy.ndarray: The rows of the cells, in the same order.
+    '''
+    xs, ys = line_cells(points)
+    inside = (xs >= 0) & (xs < width) & (ys >= 0) & (ys < height)
+    # Turning each cell into a single number lets numpy drop the repeats
+    cells = numpy.unique(ys[inside] * width + xs[inside])
+    return cells % width, cells // width
+
+# The shapes a brush can have
+BRUSHES = ['square', 'circle', 'spray']
+# How many of the cells under the spray brush each dab paints
+SPRAY_DENSITY = 0.15
+# The stamps made so far, by (shape, size)
+_BRUSH_STAMPS = {}
+
+def brush_stamp(shape: str, size: int) -> numpy.ndarray:
+    '''
+    Gives back the cells a brush covers around its center, as a size by size
+    array that is True where the brush paints. For the spray, this is the
+    circle the dabs land in.
+
+    Args:
+        shape (str): One of the BRUSHES.
+        size (int): How many cells wide the brush is.
+    Returns:
+        numpy.ndarray: The stamp (shared, so it shouldn't be changed).
+    '''
+    stamp = _BRUSH_STAMPS.get((shape, size))
+    if stamp is None:
+        if shape == 'square':
+            stamp = numpy.ones((size, size), dtype=bool)
+        else:
+            # Distances from the middle of the stamp, so even sizes are round
+            # too. Shaving half a radius off keeps small brushes from being
+            # squares.
+            offsets = numpy.arange(size) - (size - 1) / 2
+            radius = size / 2
+            stamp = offsets[:, None] ** 2 + offsets[None, :] ** 2 <= radius ** 2 - radius / 2
+        _BRUSH_STAMPS[shape, size] = stamp
+    return stamp
+
+def brush_cells(points: [[int]], width: int, height: int, shape: str = 'square',
+                size: int = 1) -> (numpy.ndarray, numpy.ndarray):
+    '''
+    Finds the cells of a grid that a brush dragged through the points covers,
+    each only once. The square and circle brushes are stamped on every cell
+    of the stroke, the spray only where the points are, with a different
+    (but always the same for the same spot) scattering of dabs each time.
+
+    Each stamp is one slice of a mask around the stroke, cut to the edges of
+    the grid, so the work per stamp doesn't grow with the size of the brush.
+
+    Args:
+        points ([[int]]): The [x, y] grid positions, in order.
+        width (int): The number of cells in each row of the grid.
+        height (int): The number of rows of the grid.
+        shape (str): One of the BRUSHES.
+        size (int): How many cells wide the brush is.
+    Returns:
+        numpy.ndarray: The columns of the cells.
+        numpy.ndarray: The rows of the cells, in the same order.
+    '''
+    if shape == 'square' and size == 1:
+        return stroke_cells(points, width, height)
+    if shape == 'spray':
+        centers = numpy.array(points, dtype=int).reshape(-1, 2)
+        xs, ys = centers[:, 0], centers[:, 1]
+    else:
+        xs, ys = line_cells(points)
+    stamp = brush_stamp(shape, size)
+    reach = size // 2
+    # The part of the grid the stroke can reach
+    left, bottom = max(int(xs.min()) - reach, 0), max(int(ys.min()) - reach, 0)
+    right = min(int(xs.max()) - reach + size, width)
+    top = min(int(ys.max()) - reach + size, height)
+    if left >= right or bottom >= top:
+        return numpy.zeros(0, dtype=int), numpy.zeros(0, dtype=int)
+    mask = numpy.zeros((top - bottom, right - left), dtype=bool)
+    for x, y in zip(xs.tolist(), ys.tolist()):
+        x0, y0 = x - reach, y - reach
+        x1, x2 = max(x0, left), min(x0 + size, right)
+        y1, y2 = max(y0, bottom), min(y0 + size, top)
+        if x1 >= x2 or y1 >= y2:
+            continue
+        dabs = stamp[y1-y0:y2-y0, x1-x0:x2-x0]
+        if shape == 'spray':
+            rng = numpy.random.default_rng([x % 2**32, y % 2**32])
+            dabs = dabs & (rng.random(dabs.shape) < SPRAY_DENSITY)
+        mask[y1-bottom:y2-bottom, x1-left:x2-left] |= dabs
+    grid_ys, grid_xs = numpy.nonzero(mask)
+    return grid_xs + left, grid_ys + bottom
+
+# The shapes the shape tools draw
+SHAPES = ['line', 'rectangle', 'ellipse']
+
+def shape_points(shape: str, x0: int, y0: int, x1: int, y1: int,
+                 segments: int = None) -> [[int]]:
+    '''
+    Finds the points a shape's outline goes through, in order, so it can be
+    painted like a stroke (or drawn as a line strip). The line goes from one
+    corner to the other, the rectangle and the ellipse fit between them.
+
+    Args:
+        shape (str): One of the SHAPES.
+        x0 (int): The column of the first corner.
+        y0 (int): The row of the first corner.
+        x1 (int): The column of the other corner.
+        y1 (int): The row of the other corner.
+        segments (int): How many straight pieces make up an ellipse (by
+            default, enough that each is about one cell long).
+    Returns:
+        [[int]]: The [x, y] grid positions.
+    '''
+    if shape == 'line':
+        return [[x0, y0], [x1, y1]]
+    if shape == 'rectangle':
+        return [[x0, y0], [x1, y0], [x1, y1], [x0, y1], [x0, y0]]
+    center_x, center_y = (x0 + x1) / 2, (y0 + y1) / 2
+    radius_x, radius_y = abs(x1 - x0) / 2, abs(y1 - y0) / 2
+    if segments is None:
+        segments = max(8, math.ceil(math.pi * (radius_x + radius_y)))
+    angles = numpy.linspace(0, 2 * math.pi, segments + 1)
+    xs = numpy.rint(center_x + radius_x * numpy.cos(angles)).astype(int)
+    ys = numpy.rint(center_y + radius_y * numpy.sin(angles)).astype(int)
+    return numpy.stack([xs, ys], axis=1).tolist()
+
+def shape_cells(shape: str, x0: int, y0: int, x1: int, y1: int, width: int, height: int,
+                brush: str = 'square', size: int = 1) -> (numpy.ndarray, numpy.ndarray):
+    '''
+    Finds the cells of a grid that the outline of a shape covers, drawn with
+    a brush. Parts outside of the grid are left out.
+
+    Args:
+        shape (str): One of the SHAPES.
+        x0 (int): The column of the first corner.
+        y0 (int): The row of the first corner.
+        x1 (int): The column of the other corner.
+        y1 (int): The row of the other corner.
+        width (int): The number of cells in each row of the grid.
+        height (int): The number of rows of the grid.
+        brush (str): One of the BRUSHES.
+        size (int): How many cells wide the brush is.
+    Returns:
+        numpy.ndarray: The columns of the cells.
+        numpy.ndarray: The rows of the cells, in the same order.
+    '''
+    points = shape_points(shape, x0, y0, x1, y1)
+    if brush == 'spray':
+        # The spray only lands where the points are, so spread them along
+        # the outline about half a brush apart
+        xs, ys = line_cells(points)
+        points = numpy.stack([xs, ys], axis=1)[::max(1, size // 2)].tolist()
+    return brush_cells(points, width, height, brush, size)
+
+def flood_cells(cells: numpy.ndarray, x: int, y: int) -> (numpy.ndarray, numpy.ndarray):
+    '''
+    Finds the region a paint bucket would fill: every cell connected to the
+    starting cell (through its left, right, top and bottom neighbours) that
+    has the same color as it.
+
+    This is a scanline fill. Each row of the region is filled a whole span at
+    a time, and each row is kept as bytes so the ends of a span are found by
+    the quick bytes searches instead of a Python loop over the cells.
+
+    Args:
+        cells (numpy.ndarray): The palette indexes of the grid.
+        x (int): The column of the starting cell.
+        y (int): The row of the starting cell.
+    Returns:
+        numpy.ndarray: The columns of the cells in the region.
+        numpy.ndarray: The rows of the cells, in the same order.
+    '''
+    height, width = cells.shape
+    same = cells == cells[y, x]
+    # 1 for the cells of the right color that haven't been filled yet
+    open_rows = [bytearray(row) for row in same.view(numpy.uint8)]
+    seeds = [(x, y)]
+    while seeds:
+        x, y = seeds.pop()
+        row = open_rows[y]
+        if not row[x]:
+            continue
+        # Stretch out to both sides, then fill that whole span
+        left = row.rfind(0, 0, x) + 1
+        right = row.find(0, x)
+        if right == -1:
+            right = width
+        row[left:right] = bytes(right - left)
+        # Every separate span touching it above and below needs filling too
+        for next_y in (y - 1, y + 1):
+            if 0 <= next_y < height:
+                next_row = open_rows[next_y]
+                start = next_row.find(1, left, right)
+                while start != -1:
+                    seeds.append((start, next_y))
+                    end = next_row.find(0, start, right)
+                    if end == -1:
+                        break
+                    start = next_row.find(1, end, right)
+    still_open = numpy.frombuffer(b''.join(open_rows), dtype=numpy.uint8).reshape(height, width)
+    ys, xs = numpy.nonzero(same & (still_open == 0))
+    return xs, ys
+
+def make_grid_color(width: int, height: int, color: str, packed: bool = False,
+                    chunked: bool = False) -> [[str]]:
+    '''
+    Make a 2D list (list of lists) of the given width and height,
+    where every cell has the given color.
+
+    Args:
+        width (int): The number of elements in each row.
+        height (int): The number of rows.
+        color (str): The color string to put in each cell.
+        packed (bool): Whether to make a PaletteGrid instead, which keeps
+            every cell in a single byte.
+        chunked (bool): Whether to make a ChunkedGrid instead, which only
+            keeps the chunks of cells that have been painted.
+    Returns:
+        [[str]]: The grid (a PaletteGrid if packed, a ChunkedGrid if chunked).
+    '''
+    if chunked:
+        return ChunkedGrid(width, height, color)
+    if packed:
+        return PaletteGrid(width, height, color)
+    grid = []
+    # y will be 0..height
+    for y in range(height):
+        row = []
+        # x will be 0..width
+        for x in range(width):
+            # Add this cell to the row
+            row.append(color)
+        # Add this row to the grid
+        grid.append(row)
+    return grid
+
+def screen_to_grid(coordinate: float, screen_size: int, grid_size: int,
+                   offset: float = 0.0, zoom: float = 1.0) -> int:
+    '''
+    Converts a coordinate (either the x part or the y part) from a position
+    within the window to the equivalent position within the grid. It does this by
+    scaling the between the two different sizes.
+
+    Think about this as a number line. If you have the coordinate 50 on that
+    number line, and the number line's maximum value was 100 (screen_size),
+    then scaling that a number line with the maximum value of 20 (grid_size) would
+    give you the new coordinate 10.
+
+    When the view is zoomed in, fewer grid values fit on the screen's number
+    line, and when it is moved, the screen's number line starts at offset
+    instead of 0.
+
+    Args:
+        coordinate (float): Either an X or Y value in a coordinate system.
+        screen_size (int): The number of values in the original coordinate system.
+        grid_width (int): The number of values in the target coordinate system
+            that fit on the screen without zooming.
+        offset (float): The grid value at the start of the screen.
+        zoom (float): How many times bigger grid values are drawn.
+    Returns:
+        int: The scaled value in the other coordinate system.
+    '''
+    return math.floor(coordinate * grid_size / (screen_size * zoom) + offset)
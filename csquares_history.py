@@ -0,0 +1,211 @@
+'''
+Undo and redo for Coloring Squares.
+
+Instead of copying the whole grid before every change, the History only
+writes down what changed: which cells, what color they had, and what color
+they got. Clearing the whole grid is written down as the runs of colors it
+used to have (the same runs that canvas files use), or for a ChunkedGrid,
+as the chunks it threw away.
+'''
+
+import numpy
+from collections import deque
+from csquares_io import find_runs
+from csquares_grid import CHUNK_SIZE, index_type
+
+class History:
+    '''
+    Remembers the changes made to a PaletteGrid (or ChunkedGrid) so they
+    can be undone and redone. Once attached, the grid reports every change it
+    makes, and the changes are collected into steps: everything reported
+    until end_step is called is undone (or redone) together.
+
+    When there are too many steps, or they hold too many cells in total, the
+    oldest steps are forgotten first. A step that holds too many cells all by
+    itself (a huge import, say) is not kept at all.
+
+    Args:
+        max_steps (int): How many steps can be undone at most.
+        max_cells (int): How many recorded cells (or runs) to keep at most.
+
+    Attributes:
+        grid (PaletteGrid): The grid whose changes are remembered.
+        undo_steps (deque): The finished steps, oldest first.
+        redo_steps ([list]): The undone steps, most recently undone last.
+        current (list): The records of the step still being made.
+        too_big (bool): Whether the step being made got too big to keep, so
+            the rest of its changes aren't recorded either.
+        size (int): How many cells (or runs) the undo steps and the current
+            step hold together.
+    '''
+    def __init__(self, max_steps: int = 100, max_cells: int = 5000000):
+        self.max_steps = max_steps
+        self.max_cells = max_cells
+        self.grid = None
+        self.clear()
+
+    def clear(self):
+        '''
+        Forgets everything.
+        '''
+        self.undo_steps = deque()
+        self.redo_steps = []
+        self.current = []
+        self.too_big = False
+        self.size = 0
+
+    def attach(self, grid: 'PaletteGrid'):
+        '''
+        Starts remembering the changes of a grid (and forgets the old ones).
+
+        Args:
+            grid (PaletteGrid): The grid to follow.
+        '''
+        if self.grid is not None and self.grid.journal is self:
+            self.grid.journal = None
+        self.grid = grid
+        grid.journal = self
+        self.clear()
+
+    def record_cells(self, cells: numpy.ndarray, old: numpy.ndarray, new: int):
+        '''
+        Called by the grid when some cells change to the same color.
+
+        Args:
+            cells (numpy.ndarray): The cells, as y * width + x.
+            old (numpy.ndarray): The palette indexes they had before.
+            new (int): The palette index they have now.
+        '''
+        self._record(('cells', cells.astype(numpy.uint32), old.astype(index_type()), new),
+                     len(cells))
+
+    def record_fill(self, old_cells: numpy.ndarray, new: int):
+        '''
+        Called by the grid when every cell changes to the same color.
+
+        Args:
+            old_cells (numpy.ndarray): The palette indexes of the whole grid
+                before the change.
+            new (int): The palette index every cell has now.
+        '''
+        values, lengths = find_runs(old_cells.ravel())
+        self._record(('fill', values, lengths, new), len(values))
+
+    def record_clear(self, old_chunks: {(int, int): numpy.ndarray}, old_background: int,
+                     new: int):
+        '''
+        Called by a ChunkedGrid when every cell changes to the same color.
+        The grid throws its old chunks away instead of changing them, so they
+        are kept as they are rather than copied.
+
+        Args:
+            old_chunks ({(int, int): numpy.ndarray}): The chunks before the change.
+            old_background (int): The background palette index before the change.
+            new (int): The palette index every cell has now.
+        '''
+        self._record(('clear', dict(old_chunks), old_background, new),
+                     len(old_chunks) * CHUNK_SIZE * CHUNK_SIZE)
+
+    def _record(self, record: tuple, size: int):
+        # Anything undone before can't be redone after a new change
+        self.redo_steps.clear()
+        if self.too_big:
+            return
+        self.current.append((record, size))
+        self.size += size
+        self._forget_oldest()
+
+    def end_step(self):
+        '''
+        Finishes the current step, so the next change starts a new one.
+        '''
+        self.too_big = False
+        if self.current:
+            self.undo_steps.append(self.current)
+            self.current = []
+            self._forget_oldest()
+
+    def _forget_oldest(self):
+        current_size = sum(size for record, size in self.current)
+        if current_size > self.max_cells:
+            # Keeping only part of a step would undo it only partly, so
+            # none of it is kept, and the older steps stay as they were
+            self.size -= current_size
+            self.current = []
+            self.too_big = True
+        while self.undo_steps and (len(self.undo_steps) > self.max_steps or
+                                   self.size > self.max_cells):
+            step = self.undo_steps.popleft()
+            self.size -= sum(size for record, size in step)
+
+    def undo(self) -> bool:
+        '''
+        Undoes the most recent step.
+
+        Returns:
+            bool: Whether there was anything to undo.
+        '''
+        self.end_step()
+        if not self.undo_steps:
+            return False
+        step = self.undo_steps.pop()
+        self.size -= sum(size for record, size in step)
+        # Going backwards puts cells changed twice back to their first color
+        for record, size in reversed(step):
+            self._apply(record, undo=True)
+        self.redo_steps.append(step)
+        return True
+
+    def redo(self) -> bool:
+        '''
+        Redoes the most recently undone step.
+
+        Returns:
+            bool: Whether there was anything to redo.
+        '''
+        self.end_step()
+        if not self.redo_steps:
+            return False
+        step = self.redo_steps.pop()
+        for record, size in step:
+            self._apply(record, undo=False)
+        self.undo_steps.append(step)
+        self.size += sum(size for record, size in step)
+        return True
+
+    def _apply(self, record: tuple, undo: bool):
+        grid = self.grid
+        kind = record[0]
+        if kind == 'cells':
+            kind, cells, old, new = record
+            ys, xs = numpy.divmod(cells, grid.width)
+            grid.write_cells(xs, ys, old if undo else new)
+        elif kind == 'fill':
+            kind, values, lengths, new = record
+            if undo:
+                grid.write_region(0, 0, numpy.repeat(values, lengths).reshape(grid.cells.shape))
+            else:
+                grid.fill_index(new)
+        elif kind == 'clear':
+            kind, chunks, background, new = record
+            if undo:
+                grid.replace_chunks(chunks, background)
+            else:
+                grid.replace_chunks({}, new)
+
+def step_cells(step: list) -> numpy.ndarray:
+    '''
+    Finds the cells a step of a History changed.
+
+    Args:
+        step (list): The step, as kept in undo_steps or redo_steps.
+    Returns:
+        numpy.ndarray: The cells, as y * width + x, or None if the step
+            changed every cell of the grid.
+    '''
+    cells = [numpy.zeros(0, dtype=numpy.uint32)]
+    for record, size in step:
+        if record[0] != 'cells':
+            return None
+        cells.append(record[1])
+    return numpy.concatenate(cells)
@@ -0,0 +1,126 @@
+'''
+Importing pictures into Coloring Squares canvases.
+
+A picture is shrunk (or stretched) to the size of the grid, and then every
+pixel is matched to the closest of the palette colors. The matching is done
+for all the pixels at once with array math: the distance from every pixel to
+every color is one matrix product, instead of a Python loop over the pixels.
+For even quicker matching, a ColorCube works out the answer for every color
+ahead of time, so matching is a single table lookup.
+'''
+
+import numpy
+import PIL.Image
+from csquares_grid import PaletteGrid, ChunkedGrid, index_type
+
+def nearest_colors(pixels: numpy.ndarray, colors: [(int, int, int)]) -> numpy.ndarray:
+    '''
+    Finds the closest color (by straight-line distance in red, green and
+    blue) for every pixel.
+
+    Args:
+        pixels (numpy.ndarray): The pixels, with red, green and blue last.
+        colors ([(int, int, int)]): The colors to choose from.
+    Returns:
+        numpy.ndarray: For every pixel, the position of its color in colors.
+    '''
+    palette = numpy.array([color[:3] for color in colors], dtype=numpy.float32)
+    flat = pixels.reshape(-1, 3).astype(numpy.float32)
+    # |pixel - color|^2 is |pixel|^2 - 2 pixel.color + |color|^2, and the
+    # first part is the same for every color, so it can be left out
+    distances = (palette * palette).sum(axis=1) - 2 * (flat @ palette.T)
+    indexes = distances.argmin(axis=1).astype(index_type(len(colors) - 1))
+    return indexes.reshape(pixels.shape[:-1])
+
+class ColorCube:
+    '''
+    A table with the closest color for every red, green and blue value,
+    worked out ahead of time. To keep it small, the lowest bits of each
+    value are dropped, so a pixel right between two colors can get the
+    other one.
+
+    Args:
+        colors ([(int, int, int)]): The colors to choose from.
+        bits (int): How many bits of each of red, green and blue to keep.
+
+    Attributes:
+        shift (int): How many low bits are dropped.
+        table (numpy.ndarray): The position of the closest color for every
+            (red, green, blue) with the low bits dropped.
+    '''
+    def __init__(self, colors: [(int, int, int)], bits: int = 6):
+        self.shift = 8 - bits
+        levels = numpy.arange(0, 256, 1 << self.shift) + (1 << self.shift) // 2
+        red, green, blue = numpy.meshgrid(levels, levels, levels, indexing='ij')
+        self.table = nearest_colors(numpy.stack([red, green, blue], axis=-1), colors)
+
+    def lookup(self, pixels: numpy.ndarray) -> numpy.ndarray:
+        '''
+        Looks up the closest color for every pixel.
+
+        Args:
+            pixels (numpy.ndarray): The pixels (unsigned bytes), with red,
+                green and blue last.
+        Returns:
+            numpy.ndarray: For every pixel, the position of its color.
+        '''
+        levels = pixels >> self.shift
+        return self.table[levels[..., 0], levels[..., 1], levels[..., 2]]
+
+def load_picture(path: str, width: int, height: int) -> numpy.ndarray:
+    '''
+    Loads a picture and resizes it to the size of a grid.
+
+    Args:
+        path (str): The picture file.
+        width (int): The number of cells in each row of the grid.
+        height (int): The number of rows of the grid.
+    Returns:
+        numpy.ndarray: A height by width by 3 array of red, green and blue,
+            bottom row first like a grid.
+    '''
+    with PIL.Image.open(path) as picture:
+        picture = picture.convert('RGB').resize((width, height), PIL.Image.BILINEAR)
+        return numpy.asarray(picture)[::-1]
+
+def picture_indexes(path: str, width: int, height: int, colors: [(int, int, int)],
+                    cube: ColorCube = None) -> numpy.ndarray:
+    '''
+    Loads a picture, resizes it to the size of a grid and matches every
+    pixel to the closest color.
+
+    Args:
+        path (str): The picture file.
+        width (int): The number of cells in each row of the grid.
+        height (int): The number of rows of the grid.
+        colors ([(int, int, int)]): The red, green and blue of every color,
+            in PALETTE order.
+        cube (ColorCube): A table made for the same colors, to match with.
+    Returns:
+        numpy.ndarray: The palette indexes, bottom row first.
+    '''
+    pixels = load_picture(path, width, height)
+    if cube is not None:
+        return cube.lookup(pixels)
+    return nearest_colors(pixels, colors)
+
+def import_picture(path: str, width: int, height: int, colors: [(int, int, int)],
+                   cube: ColorCube = None, chunked: bool = False) -> PaletteGrid:
+    '''
+    Makes a grid out of a picture.
+
+    Args:
+        path (str): The picture file.
+        width (int): The number of cells in each row of the grid.
+        height (int): The number of rows of the grid.
+        colors ([(int, int, int)]): The red, green and blue of every color,
+            in PALETTE order.
+        cube (ColorCube): A table made for the same colors, to match with.
+        chunked (bool): Whether to make a ChunkedGrid instead, which only
+            makes the chunks that aren't all white.
+    Returns:
+        PaletteGrid: The grid (a ChunkedGrid if chunked).
+    '''
+    grid = ChunkedGrid(width, height) if chunked else PaletteGrid(width, height)
+    grid.write_region(0, 0, picture_indexes(path, width, height, colors, cube))
+    return grid
@@ -0,0 +1,207 @@
+'''
+Saving and loading Coloring Squares canvases.
+
+A canvas file is small and quick to read. After a short header comes the
+list of color names the file uses (its palette), followed by the cells as
+runs: a run is a palette index and how many cells in a row (going left to
+right, bottom row first) have that color. Only the colors the grid really
+uses are written, so the run colors stay one byte each unless a canvas uses
+more than 256 different colors. A mostly white canvas is only a
+handful of runs, however big it is, and is read and written a band of rows
+at a time so a huge ChunkedGrid never has to be in one array.
+
+File layout (all numbers little-endian):
+    b'CSQR'                         the magic bytes
+    version (1 byte)                FORMAT_VERSION
+    width, height (4 bytes each)    the size of the grid
+    palette size (2 bytes)          then, for every color, the length of
+                                    its name (1 byte) and the name in UTF-8
+    run count (4 bytes)             then all the run colors (1 byte each,
+                                    or 2 bytes if the palette has more than
+                                    256 colors), then all the run lengths
+                                    (4 bytes each)
+
+Version 1 files are the same, except that the palette size is 1 byte and
+the run colors always are too.
+'''
+
+import os
+import struct
+import numpy
+from csquares_grid import (PaletteGrid, ChunkedGrid, PALETTE, CHUNK_SIZE,
+                           color_index, index_type, palette_region)
+
+MAGIC = b'CSQR'
+# Goes up whenever the layout of the file changes
+FORMAT_VERSION = 2
+HEADER = struct.Struct('<4sBIIH')
+# The header of version 1 files, which had at most 256 colors
+HEADER_V1 = struct.Struct('<4sBIIB')
+RUN_COUNT = struct.Struct('<I')
+
+def find_runs(values: numpy.ndarray, lengths: numpy.ndarray = None) -> (numpy.ndarray, numpy.ndarray):
+    '''
+    Splits a 1D array into runs of equal values.
+
+    Args:
+        values (numpy.ndarray): The values.
+        lengths (numpy.ndarray): If the values are already runs, their
+            lengths. Runs next to each other with the same value are joined.
+    Returns:
+        numpy.ndarray: The value of each run.
+        numpy.ndarray: The length of each run.
+    '''
+    if len(values) == 0:
+        return values[:0], numpy.zeros(0, dtype=numpy.uint32)
+    # A new run starts wherever a value differs from the one before it
+    starts = numpy.concatenate(([0], numpy.flatnonzero(values[1:] != values[:-1]) + 1))
+    if lengths is None:
+        lengths = numpy.diff(numpy.append(starts, len(values)))
+    else:
+        lengths = numpy.add.reduceat(lengths, starts)
+    return values[starts], lengths.astype(numpy.uint32)
+
+def encode_grid(grid: [[str]]) -> bytes:
+    '''
+    Turns a grid into the bytes of a canvas file.
+
+    Args:
+        grid ([[str]]): Any kind of grid.
+    Returns:
+        bytes: The contents of the file.
+    '''
+    height = len(grid)
+    width = len(grid[0]) if grid else 0
+    band_values = [numpy.zeros(0, dtype=index_type())]
+    band_lengths = [numpy.zeros(0, dtype=numpy.uint32)]
+    for bottom in range(0, height, CHUNK_SIZE):
+        band = palette_region(grid, 0, bottom, width, bottom + CHUNK_SIZE)
+        values, lengths = find_runs(band.ravel())
+        band_values.append(values)
+        band_lengths.append(lengths)
+    # A run can carry on from one band into the next
+    values, lengths = find_runs(numpy.concatenate(band_values), numpy.concatenate(band_lengths))
+    # The file's palette is only the colors used, in PALETTE order
+    used, values = numpy.unique(values, return_inverse=True)
+    parts = [HEADER.pack(MAGIC, FORMAT_VERSION, width, height, len(used))]
+    for index in used:
+        name = PALETTE[index].encode('utf-8')
+        parts.append(bytes([len(name)]) + name)
+    parts.append(RUN_COUNT.pack(len(values)))
+    parts.append(values.astype(value_type(len(used))).tobytes())
+    parts.append(lengths.astype('<u4').tobytes())
+    return b''.join(parts)
+
+def value_type(palette_size: int) -> str:
+    '''
+    Picks how the run colors of a file with this many colors are stored.
+
+    Args:
+        palette_size (int): How many colors the file's palette has.
+    Returns:
+        str: The numpy type, one byte or two little-endian bytes.
+    '''
+    return 'u1' if palette_size <= 256 else '<u2'
+
+def decode_grid(data: bytes, chunked: bool = False) -> PaletteGrid:
+    '''
+    Turns the bytes of a canvas file back into a grid. Colors are matched up
+    by name, so files still load after the PALETTE is reordered or grows.
+
+    Args:
+        data (bytes): The contents of the file.
+        chunked (bool): Whether to make a ChunkedGrid instead, which only
+            makes the chunks that aren't all white.
+    Returns:
+        PaletteGrid: The grid (a ChunkedGrid if chunked).
+    Raises:
+        ValueError: If the data is not a canvas file this version can read,
+            or uses a color that is no longer in the PALETTE.
+    '''
+    if len(data) < HEADER_V1.size:
+        raise ValueError("Not a canvas file: too short")
+    magic, version = data[:4], data[4]
+    if magic != MAGIC:
+        raise ValueError("Not a canvas file")
+    if version not in (1, FORMAT_VERSION):
+        raise ValueError("Canvas file version {} is not supported (expected {})"
+                         .format(version, FORMAT_VERSION))
+    header = HEADER_V1 if version == 1 else HEADER
+    if len(data) < header.size:
+        raise ValueError("Not a canvas file: too short")
+    magic, version, width, height, palette_size = header.unpack_from(data, 0)
+    offset = header.size
+    # Where each of the file's palette indexes is in our PALETTE ('#rrggbb'
+    # colors the PALETTE doesn't have yet are added to it)
+    remap = numpy.zeros(max(palette_size, 1), dtype=numpy.uint32)
+    for index in range(palette_size):
+        if offset >= len(data) or offset + 1 + data[offset] > len(data):
+            raise ValueError("Canvas file is damaged: it ends in the middle of the colors")
+        length = data[offset]
+        color = data[offset+1:offset+1+length].decode('utf-8')
+        offset += 1 + length
+        try:
+            remap[index] = color_index(color)
+        except KeyError:
+            raise ValueError("Canvas file uses the unknown color {!r}".format(color))
+    remap = remap.astype(index_type(int(remap.max())))
+    if offset + RUN_COUNT.size > len(data):
+        raise ValueError("Canvas file is damaged: it ends before the runs")
+    run_count, = RUN_COUNT.unpack_from(data, offset)
+    offset += RUN_COUNT.size
+    if offset + run_count * (numpy.dtype(value_type(palette_size)).itemsize + 4) > len(data):
+        raise ValueError("Canvas file is damaged: it ends in the middle of the runs")
+    values = numpy.frombuffer(data, dtype=value_type(palette_size), count=run_count,
+                              offset=offset)
+    offset += values.nbytes
+    lengths = numpy.frombuffer(data, dtype='<u4', count=run_count, offset=offset)
+    if int(lengths.sum()) != width * height:
+        raise ValueError("Canvas file is damaged: the runs don't fill the grid")
+    if run_count and int(values.max()) >= palette_size:
+        raise ValueError("Canvas file is damaged: a run uses color {}, but the file only has {}"
+                         .format(int(values.max()), palette_size))
+    grid = ChunkedGrid(width, height) if chunked else PaletteGrid(width, height)
+    ends = numpy.cumsum(lengths, dtype=numpy.int64)
+    starts = ends - lengths
+    for bottom in range(0, height, CHUNK_SIZE):
+        top = min(bottom + CHUNK_SIZE, height)
+        first, last = bottom * width, top * width
+        # The runs that overlap this band, and how much of each is inside it
+        start_run = numpy.searchsorted(ends, first, side='right')
+        end_run = numpy.searchsorted(ends, last, side='left') + 1
+        inside = (numpy.minimum(ends[start_run:end_run], last) -
+                  numpy.maximum(starts[start_run:end_run], first))
+        band = numpy.repeat(remap[values[start_run:end_run]], numpy.maximum(inside, 0))
+        grid.write_region(0, bottom, band.reshape(top - bottom, width))
+    return grid
+
+def save_grid(grid: [[str]], path: str):
+    '''
+    Saves a grid to a canvas file. The file is written under another name
+    first and only then renamed, so if the game dies halfway through, the
+    old file is still there and whole.
+
+    Args:
+        grid ([[str]]): Any kind of grid.
+        path (str): The file to write.
+    '''
+    data = encode_grid(grid)
+    temporary = path + '.tmp'
+    with open(temporary, 'wb') as canvas_file:
+        canvas_file.write(data)
+        canvas_file.flush()
+        os.fsync(canvas_file.fileno())
+    os.replace(temporary, path)
+
+def load_grid(path: str, chunked: bool = False) -> PaletteGrid:
+    '''
+    Loads a grid from a canvas file, reading the whole file at once.
+
+    Args:
+        path (str): The file to read.
+        chunked (bool): Whether to make a ChunkedGrid instead.
+    Returns:
+        PaletteGrid: The grid (a ChunkedGrid if chunked).
+    '''
+    with open(path, 'rb') as canvas_file:
+        return decode_grid(canvas_file.read(), chunked)
@@ -0,0 +1,642 @@
+'''
+Painting on one canvas together.
+
+A CanvasServer holds the real grid. Every player's game connects to it (over
+localhost or a Unix socket) and sends the cells it painted, in batches. The
+server puts the changes into its grid and, a fixed number of times a second,
+sends everyone one delta with all the cells that changed since the last tick,
+so the players see each other's strokes. Someone who joins late is sent the
+whole canvas first, as a compressed canvas file.
+
+Deltas are never sent cell by cell. The changed cells are numbered
+(y * width + x), sorted, and cut into runs of neighbouring cells with the same
+color, which is how a stroke or a filled area usually looks. A cell painted
+many times in one tick is only sent once, with its latest color.
+
+Every message is its length (4 bytes), its kind (1 byte) and its body:
+    b'S'  snapshot      the canvas file of the whole grid, zlib compressed
+    b'D'  delta         the name of the color the grid was cleared to (1 byte
+                        length, 0 for no clearing), the color names the runs
+                        use (2 byte count, then 1 byte length and the name
+                        for each), the run count (4 bytes), then the color of
+                        every run (2 bytes each), where it starts and how long
+                        it is (4 bytes each)
+Players and the server both send deltas, and both read them the same way.
+
+    python csquares_share.py serve localhost:8108
+    python csquares_share.py simulate --clients 100
+'''
+
+import argparse, asyncio, queue, struct, sys, threading, time, zlib
+import numpy
+from csquares_grid import (PaletteGrid, ChunkedGrid, PALETTE, CHUNK_SIZE,
+                           color_index, index_type, make_grid_color)
+from csquares_io import encode_grid, decode_grid
+
+LENGTH = struct.Struct('<I')
+COUNT = struct.Struct('<H')
+SNAPSHOT = b'S'
+DELTA = b'D'
+# Anything longer is not a message this version sent
+MAX_MESSAGE = 256 * 1024 * 1024
+# A player more than this many bytes behind is dropped (they can join again)
+MAX_BACKLOG = 16 * 1024 * 1024
+
+def parse_address(address: str) -> (str, int):
+    '''
+    Reads an address written as host:port, or the path of a Unix socket.
+
+    Args:
+        address (str): The address, like 'localhost:8108' or '/tmp/canvas.sock'.
+    Returns:
+        (str, int): The host and port, or the path and None for a Unix socket.
+    '''
+    host, colon, port = address.rpartition(':')
+    if colon and port.isdigit() and '/' not in address:
+        return host or 'localhost', int(port)
+    return address, None
+
+def pack_message(kind: bytes, body: bytes) -> bytes:
+    '''
+    Puts the length and kind in front of a message body.
+
+    Args:
+        kind (bytes): SNAPSHOT or DELTA.
+        body (bytes): The body of the message.
+    Returns:
+        bytes: The message, ready to send.
+    '''
+    return LENGTH.pack(len(body) + 1) + kind + body
+
+async def read_message(reader: asyncio.StreamReader) -> (bytes, bytes):
+    '''
+    Waits for the next message.
+
+    Args:
+        reader (asyncio.StreamReader): Where the messages come from.
+    Returns:
+        bytes: The kind of the message.
+        bytes: The body of the message.
+    Raises:
+        asyncio.IncompleteReadError: If the other side hung up.
+        ValueError: If the message is too long to be real.
+    '''
+    length, = LENGTH.unpack(await reader.readexactly(LENGTH.size))
+    if not 1 <= length <= MAX_MESSAGE:
+        raise ValueError("Message of {} bytes is not a canvas message".format(length))
+    data = await reader.readexactly(length)
+    return data[:1], data[1:]
+
+def pack_snapshot(grid: PaletteGrid) -> bytes:
+    '''
+    Makes the snapshot message for a grid: its canvas file, compressed.
+
+    Args:
+        grid (PaletteGrid): The grid (or ChunkedGrid).
+    Returns:
+        bytes: The message, ready to send.
+    '''
+    return pack_message(SNAPSHOT, zlib.compress(encode_grid(grid), 1))
+
+def pack_name(color: str) -> bytes:
+    name = color.encode('utf-8')
+    return bytes([len(name)]) + name
+
+def encode_delta(cells: numpy.ndarray, indexes: numpy.ndarray, clear: str = None) -> bytes:
+    '''
+    Turns a batch of changed cells into the body of a delta.
+
+    Args:
+        cells (numpy.ndarray): The cells, as y * width + x, each only once.
+        indexes (numpy.ndarray): The palette index of each cell.
+        clear (str): The color the whole grid was cleared to before these
+            changes, if it was.
+    Returns:
+        bytes: The body of the delta.
+    '''
+    cells = numpy.asarray(cells, dtype=numpy.int64)
+    indexes = numpy.asarray(indexes, dtype=numpy.int64)
+    # Sorting by color, then by cell, puts every run's cells next to each other
+    order = numpy.lexsort((cells, indexes))
+    cells, indexes = cells[order], indexes[order]
+    starts = numpy.flatnonzero((numpy.diff(cells) != 1) | (numpy.diff(indexes) != 0)) + 1
+    starts = numpy.concatenate(([0], starts)) if len(cells) else starts
+    lengths = numpy.diff(numpy.append(starts, len(cells)))
+    used, run_colors = numpy.unique(indexes[starts], return_inverse=True)
+    parts = [pack_name(clear) if clear else b'\x00', COUNT.pack(len(used))]
+    parts.extend(pack_name(PALETTE[index]) for index in used.tolist())
+    parts.append(LENGTH.pack(len(starts)))
+    parts.append(run_colors.astype('<u2').tobytes())
+    parts.append(cells[starts].astype('<u4').tobytes())
+    parts.append(lengths.astype('<u4').tobytes())
+    return b''.join(parts)
+
+def decode_delta(body: bytes, size: int = None) -> (str, numpy.ndarray, numpy.ndarray):
+    '''
+    Reads the body of a delta back. Colors are matched by name, so the
+    sender's PALETTE doesn't have to be in the same order as ours.
+
+    Args:
+        body (bytes): The body of the delta.
+        size (int): How many cells the grid has, so runs past its end are
+            turned down (by default, they aren't checked).
+    Returns:
+        str: The color the grid was cleared to first, or None.
+        numpy.ndarray: The changed cells, as y * width + x.
+        numpy.ndarray: The palette index of each cell.
+    Raises:
+        ValueError: If the delta is cut off or damaged, goes past the end of
+            the grid or uses a color that isn't in the PALETTE.
+    '''
+    try:
+        offset = body[0] + 1
+        clear = body[1:offset].decode('utf-8') or None
+        color_count, = COUNT.unpack_from(body, offset)
+        offset += COUNT.size
+        names = []
+        for _ in range(color_count):
+            length = body[offset]
+            names.append(body[offset+1:offset+1+length].decode('utf-8'))
+            offset += 1 + length
+        run_count, = LENGTH.unpack_from(body, offset)
+    except (IndexError, struct.error, UnicodeDecodeError):
+        raise ValueError("Delta is damaged or cut off")
+    offset += LENGTH.size
+    run_colors = numpy.frombuffer(body, dtype='<u2', count=run_count, offset=offset)
+    starts = numpy.frombuffer(body, dtype='<u4', count=run_count, offset=offset + 2 * run_count)
+    lengths = numpy.frombuffer(body, dtype='<u4', count=run_count, offset=offset + 6 * run_count)
+    if run_count and int(run_colors.max()) >= color_count:
+        raise ValueError("Delta is damaged: a run uses color {}, but the delta only has {}"
+                         .format(int(run_colors.max()), color_count))
+    if size is not None and (int(lengths.sum(dtype=numpy.int64)) > size or
+                             (starts.astype(numpy.int64) + lengths > size).any()):
+        raise ValueError("Delta goes past the end of a grid of {} cells".format(size))
+    try:
+        if clear is not None:
+            color_index(clear)
+        remap = numpy.array([color_index(name) for name in names] or [0], dtype=index_type())
+    except KeyError as error:
+        raise ValueError("Delta uses the unknown color {!r}".format(error.args[0]))
+    # Every cell of a run is its start plus how far into the run it is
+    total = int(lengths.sum())
+    run_ends = numpy.cumsum(lengths, dtype=numpy.int64)
+    steps = numpy.arange(total, dtype=numpy.int64) - numpy.repeat(run_ends - lengths, lengths)
+    cells = numpy.repeat(starts.astype(numpy.int64), lengths) + steps
+    return clear, cells, numpy.repeat(remap[run_colors], lengths)
+
+def grid_delta(grid: PaletteGrid, xs: numpy.ndarray, ys: numpy.ndarray,
+               clear: str = None) -> bytes:
+    '''
+    Makes a delta with the colors some cells have in a grid right now.
+
+    Args:
+        grid (PaletteGrid): The grid (or ChunkedGrid).
+        xs (numpy.ndarray): The columns of the cells.
+        ys (numpy.ndarray): The rows of the cells, in the same order.
+        clear (str): The color the grid was cleared to first, if it was.
+    Returns:
+        bytes: The body of the delta.
+    '''
+    cells = numpy.unique(numpy.asarray(ys, dtype=numpy.int64) * grid.width + xs)
+    ys, xs = numpy.divmod(cells, grid.width)
+    return encode_delta(cells, grid.read_cells(xs, ys), clear)
+
+def whole_grid_delta(grid: PaletteGrid) -> bytes:
+    '''
+    Makes a delta that turns any grid of the same size into this one: a
+    clear to the background, then the cells of every chunk made so far.
+
+    Args:
+        grid (PaletteGrid): The grid (or ChunkedGrid).
+    Returns:
+        bytes: The body of the delta.
+    '''
+    if not isinstance(grid, ChunkedGrid):
+        ys, xs = numpy.indices(grid.cells.shape).reshape(2, -1)
+        return grid_delta(grid, xs, ys)
+    parts = [numpy.zeros(0, dtype=numpy.int64)]
+    for chunk_x, chunk_y in grid.chunks:
+        ys, xs = numpy.indices((CHUNK_SIZE, CHUNK_SIZE)).reshape(2, -1)
+        xs, ys = xs + chunk_x * CHUNK_SIZE, ys + chunk_y * CHUNK_SIZE
+        inside = (xs < grid.width) & (ys < grid.height)
+        parts.append(ys[inside] * grid.width + xs[inside])
+    cells = numpy.concatenate(parts)
+    ys, xs = numpy.divmod(cells, grid.width)
+    return encode_delta(cells, grid.read_cells(xs, ys), PALETTE[grid.background])
+
+def apply_delta(grid: PaletteGrid, body: bytes) -> (str, numpy.ndarray):
+    '''
+    Makes the changes of a delta to a grid, without telling its journal (so
+    other players' strokes can't be undone).
+
+    Args:
+        grid (PaletteGrid): The grid (or ChunkedGrid).
+        body (bytes): The body of the delta.
+    Returns:
+        str: The color the grid was cleared to first, or None.
+        numpy.ndarray: The cells that changed, as y * width + x.
+    Raises:
+        ValueError: If the delta is damaged or doesn't fit the grid.
+    '''
+    clear, cells, indexes = decode_delta(body, grid.width * grid.height)
+    if clear is not None:
+        index = color_index(clear)
+        if isinstance(grid, ChunkedGrid):
+            grid.replace_chunks({}, index)
+        else:
+            grid.write_region(0, 0, numpy.full(grid.cells.shape, index, dtype=index_type(index)))
+    if len(cells):
+        ys, xs = numpy.divmod(cells, grid.width)
+        grid.write_cells(xs, ys, indexes)
+    return clear, cells
+
+class CanvasServer:
+    '''
+    Holds the shared grid and keeps every connected player up to date.
+
+    Args:
+        grid (PaletteGrid): The grid everyone paints on (a ChunkedGrid for
+            big canvases).
+        tick_rate (float): How many times a second the changes are sent out.
+
+    Attributes:
+        writers ([asyncio.StreamWriter]): The connected players.
+        joining ({asyncio.StreamWriter: [bytes]}): The players whose
+            snapshot is still being made, with the deltas they will be sent
+            right after it.
+        tasks ({asyncio.Task}): The tasks reading from each player.
+        pending ([numpy.ndarray]): The cells changed since the last tick.
+        pending_clear (str): The color the grid was cleared to since the last
+            tick, or None.
+        received (int): How many deltas the players sent.
+        sent (int): How many deltas went out (one per tick with changes).
+        sent_bytes (int): How many bytes of deltas went out to all players.
+        snapshot ((int, bytes)): The grid's generation and the last snapshot
+            made of it, so players joining together share one.
+    '''
+    def __init__(self, grid: PaletteGrid, tick_rate: float = 30):
+        self.grid = grid
+        self.tick_rate = tick_rate
+        self.writers = []
+        self.joining = {}
+        self.tasks = set()
+        self.pending = []
+        self.pending_clear = None
+        self.received = 0
+        self.sent = 0
+        self.sent_bytes = 0
+        self.snapshot = (None, b'')
+        self.server = None
+        self.ticker = None
+
+    async def start(self, address: str):
+        '''
+        Starts listening for players and sending out changes.
+
+        Args:
+            address (str): host:port, or the path of a Unix socket.
+        '''
+        host, port = parse_address(address)
+        if port is None:
+            self.server = await asyncio.start_unix_server(self.handle_player, host)
+        else:
+            self.server = await asyncio.start_server(self.handle_player, host, port)
+        self.ticker = asyncio.ensure_future(self.run_ticks())
+
+    def address(self) -> str:
+        '''
+        Gives back the address players can connect to (useful after starting
+        on port 0, which picks a free port).
+
+        Returns:
+            str: host:port, or the path of the Unix socket.
+        '''
+        name = self.server.sockets[0].getsockname()
+        return name if isinstance(name, str) else '{}:{}'.format(*name[:2])
+
+    async def close(self):
+        '''
+        Stops the server and hangs up on every player.
+        '''
+        self.ticker.cancel()
+        self.server.close()
+        # Hanging up ends each player's task the same way a player leaving does
+        for writer in list(self.writers) + list(self.joining):
+            writer.close()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+        await self.server.wait_closed()
+
+    async def handle_player(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        # Everything changed before now is in the snapshot, so the player
+        # starts getting deltas from the next tick on
+        self.send_pending()
+        self.joining[writer] = []
+        self.tasks.add(asyncio.current_task())
+        try:
+            if self.snapshot[0] != self.grid.generation:
+                # Making the canvas file of a big grid takes a while, so it
+                # is made from a copy in another thread, and the other
+                # players keep getting their deltas in the meantime
+                generation, copy = self.grid.generation, self.grid.snapshot()
+                message = await asyncio.get_running_loop().run_in_executor(
+                    None, pack_snapshot, copy)
+                self.snapshot = (generation, message)
+            writer.write(self.snapshot[1])
+            for message in self.joining.pop(writer):
+                writer.write(message)
+            self.writers.append(writer)
+            while True:
+                kind, body = await read_message(reader)
+                if kind == DELTA:
+                    self.receive_delta(body)
+        except (asyncio.IncompleteReadError, ConnectionError, ValueError):
+            pass
+        finally:
+            self.joining.pop(writer, None)
+            self.tasks.discard(asyncio.current_task())
+            self.drop(writer)
+
+    def drop(self, writer: asyncio.StreamWriter):
+        if writer in self.writers:
+            self.writers.remove(writer)
+        writer.close()
+
+    def receive_delta(self, body: bytes):
+        '''
+        Makes a player's changes to the grid, to be sent out on the next tick.
+
+        Args:
+            body (bytes): The body of the delta.
+        '''
+        self.received += 1
+        clear, cells = apply_delta(self.grid, body)
+        if clear is not None:
+            # Nothing painted before the clearing matters any more
+            self.pending = []
+            self.pending_clear = clear
+        self.pending.append(cells)
+
+    def send_pending(self):
+        '''
+        Sends everyone one delta with the cells changed since the last tick.
+        '''
+        if not self.pending and self.pending_clear is None:
+            return
+        cells = numpy.unique(numpy.concatenate(self.pending or [numpy.zeros(0, dtype=numpy.int64)]))
+        ys, xs = numpy.divmod(cells, self.grid.width)
+        message = pack_message(DELTA, encode_delta(cells, self.grid.read_cells(xs, ys),
+                                                   self.pending_clear))
+        self.pending = []
+        self.pending_clear = None
+        self.sent += 1
+        for waiting in self.joining.values():
+            waiting.append(message)
+        for writer in list(self.writers):
+            if writer.transport.get_write_buffer_size() > MAX_BACKLOG:
+                self.drop(writer)
+            else:
+                writer.write(message)
+                self.sent_bytes += len(message)
+
+    async def run_ticks(self):
+        while True:
+            await asyncio.sleep(1 / self.tick_rate)
+            self.send_pending()
+
+class CanvasClient:
+    '''
+    One player's connection to a CanvasServer, for use inside asyncio.
+
+    Args:
+        reader (asyncio.StreamReader): Where the server's messages come from.
+        writer (asyncio.StreamWriter): Where our messages go.
+        on_message (callable): Called with the kind and body of every
+            message from the server.
+    '''
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter, on_message):
+        self.reader = reader
+        self.writer = writer
+        self.on_message = on_message
+        self.listener = asyncio.ensure_future(self.listen())
+
+    @classmethod
+    async def connect(cls, address: str, on_message) -> 'CanvasClient':
+        '''
+        Connects to a server.
+
+        Args:
+            address (str): host:port, or the path of a Unix socket.
+            on_message (callable): Called with the kind and body of every
+                message from the server.
+        Returns:
+            CanvasClient: The connection.
+        '''
+        host, port = parse_address(address)
+        if port is None:
+            reader, writer = await asyncio.open_unix_connection(host)
+        else:
+            reader, writer = await asyncio.open_connection(host, port)
+        return cls(reader, writer, on_message)
+
+    async def listen(self):
+        try:
+            while True:
+                self.on_message(*await read_message(self.reader))
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+
+    def send_delta(self, body: bytes):
+        '''
+        Sends the server a delta.
+
+        Args:
+            body (bytes): The body of the delta.
+        '''
+        self.writer.write(pack_message(DELTA, body))
+
+    def close(self):
+        '''
+        Hangs up.
+        '''
+        self.listener.cancel()
+        self.writer.close()
+
+class SharedCanvas:
+    '''
+    Connects a game to a CanvasServer. The connection runs in a thread of its
+    own, so the game never waits on the network: the game hands over the
+    cells it painted, and once an update picks up whatever came from the
+    server in the meantime.
+
+    Args:
+        address (str): host:port, or the path of a Unix socket.
+        timeout (float): How many seconds to wait for the connection.
+
+    Attributes:
+        incoming (queue.Queue): The (kind, body) messages from the server
+            that haven't been picked up yet.
+    '''
+    def __init__(self, address: str, timeout: float = 10):
+        self.incoming = queue.Queue()
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+        self.thread.start()
+        connecting = CanvasClient.connect(address, lambda kind, body: self.incoming.put((kind, body)))
+        self.client = asyncio.run_coroutine_threadsafe(connecting, self.loop).result(timeout)
+
+    def send(self, body: bytes):
+        '''
+        Sends the server a delta, from any thread.
+
+        Args:
+            body (bytes): The body of the delta.
+        '''
+        self.loop.call_soon_threadsafe(self.client.send_delta, body)
+
+    def send_cells(self, grid: PaletteGrid, xs: numpy.ndarray, ys: numpy.ndarray):
+        '''
+        Sends the server the colors some cells have now.
+
+        Args:
+            grid (PaletteGrid): The grid (or ChunkedGrid).
+            xs (numpy.ndarray): The columns of the cells.
+            ys (numpy.ndarray): The rows of the cells, in the same order.
+        '''
+        if len(xs):
+            self.send(grid_delta(grid, xs, ys))
+
+    def send_clear(self, color: str):
+        '''
+        Tells the server the whole grid was cleared to one color.
+
+        Args:
+            color (str): The color.
+        '''
+        self.send(encode_delta([], [], color))
+
+    def send_grid(self, grid: PaletteGrid):
+        '''
+        Sends the server the whole grid (after loading one, say).
+
+        Args:
+            grid (PaletteGrid): The grid (or ChunkedGrid).
+        '''
+        self.send(whole_grid_delta(grid))
+
+    def receive(self, grid: PaletteGrid) -> PaletteGrid:
+        '''
+        Makes the changes that came from the server since the last call.
+
+        Args:
+            grid (PaletteGrid): The grid to change.
+        Returns:
+            PaletteGrid: The same grid, or a new one if the server sent the
+                whole canvas.
+        '''
+        while True:
+            try:
+                kind, body = self.incoming.get_nowait()
+            except queue.Empty:
+                return grid
+            if kind == SNAPSHOT:
+                grid = decode_grid(zlib.decompress(body), chunked=True)
+            elif kind == DELTA:
+                apply_delta(grid, body)
+
+    def close(self):
+        '''
+        Hangs up and stops the thread.
+        '''
+        asyncio.run_coroutine_threadsafe(self._hang_up(), self.loop).result()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+
+    async def _hang_up(self):
+        self.client.close()
+        # Let the listening task see it was cancelled before the loop stops
+        await asyncio.gather(self.client.listener, return_exceptions=True)
+
+async def simulate(address: str, width: int, clients: int, seconds: float, cells: int,
+                   rate: float, seed: int = 0) -> {str: float}:
+    '''
+    Connects many made up players to a server, each painting short random
+    strokes, and counts what gets through.
+
+    Args:
+        address (str): The server's address.
+        width (int): The number of cells in each row of the server's grid.
+        clients (int): How many players.
+        seconds (float): How long they paint for.
+        cells (int): How many cells long each stroke is.
+        rate (float): How many strokes a second each player paints.
+        seed (int): The random seed.
+    Returns:
+        {str: float}: How many strokes were sent, and how many deltas and
+            bytes the players got back.
+    '''
+    rng = numpy.random.default_rng(seed)
+    received = {'deltas': 0, 'bytes': 0}
+    def on_message(kind, body):
+        received['deltas'] += kind == DELTA
+        received['bytes'] += len(body) + 5
+    players = [await CanvasClient.connect(address, on_message) for _ in range(clients)]
+    strokes = 0
+    end = time.perf_counter() + seconds
+    while time.perf_counter() < end:
+        for player in players:
+            # A short horizontal stroke somewhere in the bottom left corner
+            start = int(rng.integers(0, 1000)) * width + int(rng.integers(0, 1000 - cells))
+            color = int(rng.integers(0, len(PALETTE)))
+            player.send_delta(encode_delta(numpy.arange(start, start + cells),
+                                           numpy.full(cells, color)))
+            strokes += 1
+        await asyncio.sleep(1 / rate)
+    await asyncio.sleep(0.5)
+    for player in players:
+        player.close()
+    return {'strokes': strokes, 'deltas received': received['deltas'],
+            'bytes received': received['bytes']}
+
+async def serve(address: str, width: int, height: int, tick_rate: float):
+    server = CanvasServer(make_grid_color(width, height, 'white', chunked=True), tick_rate)
+    await server.start(address)
+    print('Serving a {} by {} canvas on {}'.format(width, height, server.address()), flush=True)
+    await asyncio.Event().wait()
+
+async def serve_and_simulate(arguments: argparse.Namespace):
+    server = CanvasServer(make_grid_color(arguments.width, arguments.height, 'white',
+                                          chunked=True), arguments.tick_rate)
+    await server.start(arguments.address)
+    start = time.perf_counter()
+    results = await simulate(server.address(), arguments.width, arguments.clients, arguments.seconds,
+                             arguments.cells, arguments.rate)
+    results['seconds'] = time.perf_counter() - start
+    results['strokes received by the server'] = server.received
+    results['deltas sent by the server'] = server.sent
+    await server.close()
+    return results
+
+def main(arguments: [str]):
+    parser = argparse.ArgumentParser(description='Coloring Squares canvas server')
+    parser.add_argument('command', choices=['serve', 'simulate'],
+                        help='run a server, or time made up players painting on one')
+    parser.add_argument('address', nargs='?', default='localhost:0',
+                        help='host:port, or the path of a Unix socket')
+    parser.add_argument('--width', type=int, default=10000)
+    parser.add_argument('--height', type=int, default=10000)
+    parser.add_argument('--tick-rate', type=float, default=30,
+                        help='how many times a second changes are sent out')
+    parser.add_argument('--clients', type=int, default=100)
+    parser.add_argument('--seconds', type=float, default=5)
+    parser.add_argument('--cells', type=int, default=20, help='how long each stroke is')
+    parser.add_argument('--rate', type=float, default=20,
+                        help='how many strokes a second each player paints')
+    arguments = parser.parse_args(arguments)
+    if arguments.command == 'serve':
+        asyncio.run(serve(arguments.address, arguments.width, arguments.height,
+                          arguments.tick_rate))
+    else:
+        print(asyncio.run(serve_and_simulate(arguments)))
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -6,15 +6,20 @@ You do not need to open or read this file. It must
 be in the same folder as your other files.
 
 Change Log:
+  - 0.0.9: Added EventRecorder and HeadlessRunner.replay for replaying sessions
+  - 0.0.8: Added FrameTimer for opt-in timing of the callbacks
+  - 0.0.7: Added HeadlessRunner for running games without a display
+  - 0.0.6: Compile the World into a quick, incremental check
+  - 0.0.5: Skip checking lists with an unchanged generation counter
   - 0.0.4: Added on_key_release
   - 0.0.3: Allow int in World checks for float type
   - 0.0.2: Added assert_type, World checks, mock game runner
   - 0.0.1: Initial version
 """
 
-__version__ = '0.0.3'
+__version__ = '0.0.9'
 
-import arcade
+import arcade, random, time, bisect, atexit, json, csv, struct
 
 # Better tools for detecting issues in students' code
 from cisc108.assertions import (get_line_code, QUIET,
@@ -22,6 +27,195 @@ from cisc108.assertions import (get_line_code, QUIET,
 
 GAME_SPEED = 1/30
 
+class FrameTimer:
+    """
+    Opt-in timing for a game's callbacks. Give one to Cisc108GameUntyped or
+    Cisc108Game as `timer` and it records how long every callback (and, for
+    Cisc108Game, every World type check) takes, and how many frames took
+    longer than GAME_SPEED.
+    
+    Args:
+        deadline (float): How many seconds one frame is allowed to take.
+    
+    Attributes:
+        histograms ({str: [int]}): For each callback, how many calls took
+            up to each of the BUCKETS.
+        totals ({str: float}): The total seconds spent in each callback.
+        longest ({str: float}): The longest call of each callback, in seconds.
+        frames (int): How many frames (updates) there have been.
+        missed_frames (int): How many frames took longer than the deadline.
+    """
+    # The upper edges of the histogram buckets, in milliseconds
+    BUCKETS = [0.1, 0.25, 0.5, 1, 2, 4, 8, 16, 33, 66, 133, float('inf')]
+    
+    def __init__(self, deadline: float = GAME_SPEED):
+        self.deadline = deadline
+        self.histograms = {}
+        self.totals = {}
+        self.longest = {}
+        self.frames = 0
+        self.missed_frames = 0
+        self._frame_work = 0.0
+    
+    def record(self, name: str, seconds: float):
+        """ Adds one call of a callback """
+        if name not in self.histograms:
+            self.histograms[name] = [0] * len(self.BUCKETS)
+            self.totals[name] = 0.0
+            self.longest[name] = 0.0
+        self.histograms[name][bisect.bisect_left(self.BUCKETS, seconds * 1000)] += 1
+        self.totals[name] += seconds
+        self.longest[name] = max(self.longest[name], seconds)
+        self._frame_work += seconds
+    
+    def end_frame(self):
+        """ Counts the work recorded since the last call as one frame """
+        self.frames += 1
+        if self._frame_work > self.deadline:
+            self.missed_frames += 1
+        self._frame_work = 0.0
+    
+    def call(self, name: str, callback, *args):
+        """ Calls the callback with the arguments, recording how long it took """
+        start = time.perf_counter()
+        try:
+            return callback(*args)
+        finally:
+            self.record(name, time.perf_counter() - start)
+    
+    def summary(self) -> dict:
+        """
+        Sums up everything recorded so far.
+        
+        Returns:
+            dict: The calls, total, mean and longest milliseconds and the
+            histogram of each callback, and the frame counts.
+        """
+        labels = ["<= {} ms".format(edge) for edge in self.BUCKETS]
+        callbacks = {}
+        for name, histogram in self.histograms.items():
+            calls = sum(histogram)
+            callbacks[name] = {'calls': calls,
+                               'total ms': self.totals[name] * 1000,
+                               'mean ms': self.totals[name] * 1000 / calls,
+                               'longest ms': self.longest[name] * 1000,
+                               'histogram': dict(zip(labels, histogram))}
+        return {'callbacks': callbacks, 'frames': self.frames,
+                'missed frames': self.missed_frames,
+                'deadline ms': self.deadline * 1000}
+    
+    def dump(self, path: str):
+        """ Writes the summary to a .csv file, or as JSON to any other file """
+        summary = self.summary()
+        with open(path, 'w', newline='') as output:
+            if not path.endswith('.csv'):
+                json.dump(summary, output, indent=2)
+                return
+            writer = csv.writer(output)
+            labels = ["<= {} ms".format(edge) for edge in self.BUCKETS]
+            writer.writerow(['callback', 'calls', 'total ms', 'mean ms', 'longest ms'] + labels)
+            for name, stats in summary['callbacks'].items():
+                writer.writerow([name, stats['calls'], stats['total ms'], stats['mean ms'],
+                                 stats['longest ms']] + list(stats['histogram'].values()))
+            writer.writerow(['frames', summary['frames']])
+            writer.writerow(['missed frames', summary['missed frames']])
+    
+    def dump_at_exit(self, path: str):
+        """ Arranges for dump to be called when the program ends """
+        atexit.register(self.dump, path)
+
+class EventRecorder:
+    """
+    Opt-in recording of every event a game gets. Give one to
+    Cisc108GameUntyped or Cisc108Game as `recorder` and it writes the events
+    (in the same tuples HeadlessRunner uses) to a file, each with the time
+    it happened, so the session can be replayed later with
+    HeadlessRunner.replay.
+    
+    Every event takes the same number of bytes in the file (see RECORD), and
+    the writes are buffered, so recording costs next to nothing per event.
+    
+    Args:
+        path (str): The file to write the recording to.
+    
+    Attributes:
+        start (float): When the recording started (time.perf_counter).
+        count (int): How many events have been recorded.
+    """
+    MAGIC = b'CSEV'
+    VERSION = 1
+    # The kind of event, the milliseconds since the start, two numbers (the
+    # x and y, or the key and 0) and the mouse button
+    RECORD = struct.Struct('<BIiiB')
+    KINDS = ['draw', 'update', 'key', 'release', 'mouse', 'motion']
+    BUTTONS = ['left', 'right', 'middle', 'unknown']
+    
+    def __init__(self, path: str):
+        self.file = open(path, 'wb', buffering=64 * 1024)
+        self.file.write(self.MAGIC + bytes([self.VERSION]))
+        self.start = time.perf_counter()
+        self.count = 0
+    
+    def record(self, event: tuple):
+        """ Writes down one event, stamped with the time """
+        if self.file is None:
+            return
+        kind = event[0]
+        milliseconds = int((time.perf_counter() - self.start) * 1000)
+        first = event[1] if len(event) > 1 else 0
+        second = event[2] if len(event) > 2 else 0
+        button = self.BUTTONS.index(event[3]) if kind == 'mouse' else 0
+        self.file.write(self.RECORD.pack(self.KINDS.index(kind), milliseconds,
+                                         int(first), int(second), button))
+        self.count += 1
+    
+    def close(self):
+        """ Writes out whatever is still buffered and closes the file """
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+    
+    def close_at_exit(self):
+        """ Arranges for close to be called when the program ends """
+        atexit.register(self.close)
+    
+    @classmethod
+    def read(cls, path: str) -> [(float, tuple)]:
+        """
+        Reads a recording back.
+        
+        Args:
+            path (str): The recording file.
+        Returns:
+            [(float, tuple)]: The seconds since the start of the recording
+            and the event, for every event in order.
+        Raises:
+            ValueError: If the file is not a recording this version can read.
+        """
+        with open(path, 'rb') as recording:
+            data = recording.read()
+        header = len(cls.MAGIC) + 1
+        if data[:len(cls.MAGIC)] != cls.MAGIC or len(data) < header:
+            raise ValueError("Not an event recording")
+        if data[len(cls.MAGIC)] != cls.VERSION:
+            raise ValueError("Event recording version {} is not supported (expected {})"
+                             .format(data[len(cls.MAGIC)], cls.VERSION))
+        # A recording cut short (say, by a crash) still plays up to the cut
+        end = header + (len(data) - header) // cls.RECORD.size * cls.RECORD.size
+        events = []
+        for kind, milliseconds, first, second, button in cls.RECORD.iter_unpack(data[header:end]):
+            kind = cls.KINDS[kind]
+            if kind in ('draw', 'update'):
+                event = (kind,)
+            elif kind in ('key', 'release'):
+                event = (kind, first)
+            elif kind == 'mouse':
+                event = (kind, first, second, cls.BUTTONS[button])
+            else:
+                event = (kind, first, second)
+            events.append((milliseconds / 1000, event))
+        return events
+
 class Cisc108GameUntyped(arcade.Window):
     """
     An Arcade Window subclass that allows you to specify its
@@ -37,6 +231,9 @@ class Cisc108GameUntyped(arcade.Window):
         handle_key (World,int->None): A function that handles keyboard input.
         handle_mouse (World,int,int,str->None): A function that handles mouse clicks.
         handle_motion (World,int,int->None): A function that handles mouse movement.
+        handle_release (World,int->None): A function that handles releasing a key.
+        timer (FrameTimer): Optional. Records how long each callback takes.
+        recorder (EventRecorder): Optional. Records every event.
     
     Attributes:
         world (World): The current state of the world.
@@ -44,7 +241,7 @@ class Cisc108GameUntyped(arcade.Window):
     def __init__(self, window_width, window_height, window_caption,
                  an_initial_world, draw_world, update_world,
                  handle_key=None, handle_mouse=None, handle_motion=None,
-                 handle_release=None):
+                 handle_release=None, timer=None, recorder=None):
         super().__init__(window_width, window_height, window_caption, update_rate=GAME_SPEED)
         self.world = an_initial_world
         self.draw_world = draw_world
@@ -53,39 +250,60 @@ class Cisc108GameUntyped(arcade.Window):
         self.handle_release = handle_release
         self.handle_mouse = handle_mouse
         self.handle_motion = handle_motion
+        self.timer = timer
+        self.recorder = recorder
+    
+    def record(self, *event):
+        """ Gives an event to the recorder, if there is one """
+        if self.recorder is not None:
+            self.recorder.record(event)
+    
+    def call(self, name, callback, *args):
+        """ Calls one of the callbacks, timing it if there is a timer """
+        if self.timer is None:
+            return callback(*args)
+        return self.timer.call(name, callback, *args)
     
     def on_draw(self):
         """ Called when it is time to draw the world """
+        self.record('draw')
         arcade.start_render()
-        self.draw_world(self.world)
+        self.call('draw_world', self.draw_world, self.world)
     
     def on_update(self, delta_time: float):
         """ Called every frame """
-        self.update_world(self.world)
+        self.record('update')
+        if self.timer is not None:
+            self.timer.end_frame()
+        self.call('update_world', self.update_world, self.world)
     
     def on_key_press(self, key: int, modifiers: int):
         """ Called when the keyboard is pressed """
+        self.record('key', key)
         if self.handle_key is not None:
-            self.handle_key(self.world, key)
+            self.call('handle_key', self.handle_key, self.world, key)
     
     def on_key_release(self, key: int, modifiers: int):
         """ Called when a keyboard is released """
+        self.record('release', key)
         if self.handle_release is not None:
-            self.handle_release(self.world, key)
+            self.call('handle_release', self.handle_release, self.world, key)
     
     def on_mouse_press(self, x: int, y: int, button: int, modifiers: int):
         """ Called when the mouse is pressed """
+        button_str = ('left' if button == arcade.MOUSE_BUTTON_LEFT
+                      else 'right' if button == arcade.MOUSE_BUTTON_RIGHT
+                      else 'middle' if button == arcade.MOUSE_BUTTON_MIDDLE
+                      else 'unknown')
+        self.record('mouse', x, y, button_str)
         if self.handle_mouse is not None:
-            button_str = ('left' if button == arcade.MOUSE_BUTTON_LEFT
-                          else 'right' if button == arcade.MOUSE_BUTTON_RIGHT
-                          else 'middle' if button == arcade.MOUSE_BUTTON_MIDDLE
-                          else 'unknown')
-            self.handle_mouse(self.world, x, y, button_str)
+            self.call('handle_mouse', self.handle_mouse, self.world, x, y, button_str)
     
     def on_mouse_motion(self, x: int, y: int, dx: int, dy: int):
         """ Called when the mouse is moved """
+        self.record('motion', x, y)
         if self.handle_motion is not None:
-            self.handle_motion(self.world, x, y)
+            self.call('handle_motion', self.handle_motion, self.world, x, y)
 
 BETTER_TYPE_NAMES = {
     str: 'string',
@@ -160,6 +378,99 @@ def _validate_type(value, expected_type, path="world"):
     elif not isinstance(value, expected_type) and value is not None:
         return path + WRONG_TYPE_MESSAGE.format(x=repr(value), x_type=get_name(type(value)), y_type=get_name(expected_type))
 
+def _allowed_classes(expected_type):
+    '''
+    The classes a plain (not list or dictionary) value may have when it is
+    expected to be of the given type. None is always allowed.
+    '''
+    if expected_type == float:
+        return (int, float, type(None))
+    return (expected_type, type(None))
+
+def compile_type(expected_type):
+    '''
+    Turns a type (in the same format as _validate_type uses) into a function
+    that quickly tells whether a value has that type. No messages or paths are
+    built; when the check fails, _validate_type should be run to explain why.
+    
+    Lists that keep a `generation` counter (like the Coloring Squares Grid)
+    are only checked again after that counter moves, and if they also have a
+    `changed_rows(generation)` method, only those rows are checked.
+    
+    Args:
+        expected_type (type): Any kind of type value, as used by assert_type.
+    Returns:
+        Any->bool: The function that checks a value.
+    '''
+    if isinstance(expected_type, dict):
+        return _compile_dictionary_type(expected_type)
+    elif isinstance(expected_type, list):
+        return _compile_list_type(expected_type)
+    allowed = _allowed_classes(expected_type)
+    return lambda value: isinstance(value, allowed)
+
+def _compile_dictionary_type(expected_type):
+    fields = []
+    lookup = None
+    for expected_key, expected_value in expected_type.items():
+        if isinstance(expected_key, str):
+            fields.append((expected_key, compile_type(expected_value)))
+        elif isinstance(expected_key, type):
+            lookup = (expected_key, compile_type(expected_value))
+            break # only support one key/value type in Lookup style
+    size = len(expected_type)
+    def check_dictionary(value):
+        if not isinstance(value, dict):
+            return False
+        for key, check_value in fields:
+            if key not in value or not check_value(value[key]):
+                return False
+        if lookup is None:
+            return len(value) == size
+        key_type, check_value = lookup
+        return all(isinstance(k, key_type) and check_value(v)
+                   for k, v in value.items())
+    return check_dictionary
+
+def _compile_list_type(expected_type):
+    if not expected_type:
+        return lambda value: isinstance(value, list) and not value
+    element_type = expected_type[0]
+    if isinstance(element_type, (dict, list)):
+        check_element = compile_type(element_type)
+        def check_elements(elements):
+            return all(map(check_element, elements))
+    else:
+        allowed = _allowed_classes(element_type)
+        def check_elements(elements):
+            # Looking at each distinct class once is much quicker than
+            # calling isinstance on every single element
+            return all(issubclass(kind, allowed) for kind in set(map(type, elements)))
+    # The tracked list that passed last time, and its generation back then
+    last_value = last_generation = None
+    def check_list(value):
+        nonlocal last_value, last_generation
+        if not isinstance(value, list):
+            return False
+        generation = getattr(value, 'generation', None)
+        if generation is None:
+            return check_elements(value)
+        if value is last_value:
+            if generation == last_generation:
+                return True
+            if hasattr(value, 'changed_rows'):
+                elements = [value[index] for index in value.changed_rows(last_generation)]
+            else:
+                elements = value
+        else:
+            elements = value
+        if not check_elements(elements):
+            last_value = last_generation = None
+            return False
+        last_value, last_generation = value, generation
+        return True
+    return check_list
+
 
 class Cisc108Game(Cisc108GameUntyped):
     '''
@@ -169,14 +480,19 @@ class Cisc108Game(Cisc108GameUntyped):
     def __init__(self, World, window_width, window_height, window_caption,
                  an_initial_world, draw_world, update_world,
                  handle_key=None, handle_mouse=None, handle_motion=None,
-                 handle_release=None):
+                 handle_release=None, timer=None, recorder=None):
         super().__init__(window_width, window_height, window_caption,
                          an_initial_world, draw_world, update_world,
-                         handle_key, handle_mouse, handle_motion, handle_release)
+                         handle_key, handle_mouse, handle_motion, handle_release,
+                         timer, recorder)
         self.World = World
+        self.check_world = compile_type(World)
         self.validate_worlds_type("In the initial world")
     
     def validate_worlds_type(self, when: str):
+        # The compiled check is quick; the full one only explains a failure
+        if self.call('validate_worlds_type', self.check_world, self.world):
+            return
         that_world_is_valid = or_give_reason = _validate_type(self.world, self.World, when+", world")
         that_world_is_valid = not that_world_is_valid
         if not that_world_is_valid:
@@ -256,3 +572,172 @@ def assert_type(value, expected_type) -> bool:
     #student_tests.successes += 1
     return True
 
+
+class StandInArcade:
+    """
+    While active (in a with statement), swaps arcade's window and drawing
+    functions for stand-ins that only count how often they were called, so a
+    game can run its callbacks without a display or OpenGL.
+    
+    Attributes:
+        calls ({str: int}): How many times each stand-in was called.
+    """
+    # The arcade functions that need a window, besides draw_* and create_*
+    WINDOW_FUNCTIONS = ['start_render', 'finish_render', 'set_background_color',
+                        'set_viewport', 'close_window']
+    
+    def __init__(self):
+        self.calls = {}
+        self._swapped = []
+    
+    def count(self, name):
+        self.calls[name] = self.calls.get(name, 0) + 1
+    
+    def _stand_in(self, name):
+        def stand_in(*args, **kwargs):
+            self.count(name)
+        return stand_in
+    
+    def _swap(self, owner, name, replacement):
+        self._swapped.append((owner, name, getattr(owner, name)))
+        setattr(owner, name, replacement)
+    
+    def __enter__(self):
+        for name in dir(arcade):
+            if ((name.startswith(('draw_', 'create_')) or name in self.WINDOW_FUNCTIONS)
+                    and callable(getattr(arcade, name))):
+                self._swap(arcade, name, self._stand_in(name))
+        stand_in_arcade = self
+        class StandInShapeList(list):
+            def draw(self):
+                stand_in_arcade.count('ShapeElementList.draw')
+        self._swap(arcade, 'ShapeElementList', StandInShapeList)
+        self._swap(arcade.SpriteList, 'draw', lambda sprite_list: self.count('SpriteList.draw'))
+        self._swap(arcade.Window, '__init__', lambda window, *args, **kwargs: None)
+        return self
+    
+    def __exit__(self, *exception):
+        while self._swapped:
+            owner, name, original = self._swapped.pop()
+            setattr(owner, name, original)
+
+# The arcade button for each of the button names used by handle_mouse
+MOUSE_BUTTONS = {'left': arcade.MOUSE_BUTTON_LEFT,
+                 'right': arcade.MOUSE_BUTTON_RIGHT,
+                 'middle': arcade.MOUSE_BUTTON_MIDDLE,
+                 'unknown': -1}
+
+class HeadlessRunner:
+    """
+    Runs a game (a Cisc108GameUntyped or Cisc108Game) without opening a
+    window, by feeding it a scripted list of events as fast as possible.
+    
+    Events are tuples:
+        ('draw',), ('update',), ('key', key), ('release', key),
+        ('mouse', x, y, button) with button 'left', 'right' or 'middle',
+        and ('motion', x, y).
+    
+    Args:
+        game_class (type): Cisc108GameUntyped, Cisc108Game or a subclass.
+        *game_args: Everything the game class normally takes.
+        **game_kwargs: Such as the timer.
+    
+    Attributes:
+        game (Cisc108GameUntyped): The game, with its window swapped out.
+        arcade (StandInArcade): The stand-ins, with their call counts.
+    """
+    def __init__(self, game_class, *game_args, **game_kwargs):
+        self.arcade = StandInArcade()
+        with self.arcade:
+            self.game = game_class(*game_args, **game_kwargs)
+    
+    def send(self, event: tuple):
+        """ Calls the game's event method for one event """
+        kind = event[0]
+        if kind == 'draw':
+            self.game.on_draw()
+        elif kind == 'update':
+            self.game.on_update(GAME_SPEED)
+        elif kind == 'key':
+            self.game.on_key_press(event[1], 0)
+        elif kind == 'release':
+            self.game.on_key_release(event[1], 0)
+        elif kind == 'mouse':
+            self.game.on_mouse_press(event[1], event[2], MOUSE_BUTTONS[event[3]], 0)
+        elif kind == 'motion':
+            self.game.on_mouse_motion(event[1], event[2], 0, 0)
+        else:
+            raise ValueError("Unknown event kind {!r}".format(kind))
+    
+    def run(self, events) -> dict:
+        """
+        Sends all of the events to the game.
+        
+        Args:
+            events ([tuple]): The events, in order.
+        Returns:
+            dict: The number of events, the seconds it took, the events per
+            second and how many (stand-in) draw calls were made.
+        """
+        count = 0
+        with self.arcade:
+            start = time.perf_counter()
+            for event in events:
+                self.send(event)
+                count += 1
+            seconds = time.perf_counter() - start
+        return {'events': count, 'seconds': seconds,
+                'events per second': count / seconds if seconds else float('inf'),
+                'draw calls': sum(self.arcade.calls.values())}
+    
+    def replay(self, path: str, real_time: bool = False) -> dict:
+        """
+        Sends the events of a recording (see EventRecorder) to the game. As
+        long as the game starts from the same world, it ends up in the same
+        world the recorded game did.
+        
+        Args:
+            path (str): The recording file.
+            real_time (bool): Whether to wait between events as long as the
+                player did, instead of going as fast as possible.
+        Returns:
+            dict: The same as run gives back.
+        """
+        recording = EventRecorder.read(path)
+        if not real_time:
+            return self.run(event for seconds, event in recording)
+        start = time.perf_counter()
+        def paced():
+            for seconds, event in recording:
+                delay = seconds - (time.perf_counter() - start)
+                if delay > 0:
+                    time.sleep(delay)
+                yield event
+        return self.run(paced())
+
+def make_scribble(count: int, window_width: int, window_height: int,
+                  seed: int = 0) -> [tuple]:
+    """
+    Makes a scripted session for HeadlessRunner: a right click (which turns
+    drawing on in Coloring Squares), then the mouse wandering randomly around
+    the window, with an update and a draw after every few moves.
+    
+    Args:
+        count (int): Roughly how many events to make.
+        window_width (int): The width of the game window.
+        window_height (int): The height of the game window.
+        seed (int): The random seed, so the same session can be made again.
+    Returns:
+        [tuple]: The events.
+    """
+    rng = random.Random(seed)
+    x, y = window_width / 2, window_height / 2
+    events = [('mouse', x, y, 'right')]
+    while len(events) < count:
+        x = min(max(x + rng.uniform(-40, 40), 0), window_width - 1)
+        y = min(max(y + rng.uniform(-40, 40), 0), window_height - 1)
+        events.append(('motion', int(x), int(y)))
+        if len(events) % 4 == 0:
+            events.append(('update',))
+            events.append(('draw',))
+    return events
@@ -8,12 +8,21 @@ Change log:
 __VERSION__ = '0.0.1'
 
 from cisc108 import assert_equal
-from cisc108_game import assert_type
+from csquares_src import (assert_type, Cisc108GameUntyped, Cisc108Game, compile_type, _validate_type, FrameTimer,
+                          StandInArcade)
 
 ################################################################################
 # Game import
 # Rename this to the name of your project file.
-from project_starter import *
+from csquares import *
+from csquares_io import encode_grid, decode_grid
+import PIL.Image
+import subprocess, sys, time, csv, json
+from csquares_import import ColorCube, nearest_colors
+from csquares_share import CanvasServer, encode_delta, decode_delta, apply_delta
+import asyncio, threading
+from csquares_autosave import Autosaver, restore
+from csquares_grid import brush_stamp, shape_points, shape_cells
 
 
 ################################################################################
@@ -56,6 +65,531 @@ assert_equal(W1, {'grid': make_grid_color(GRID_WIDTH, GRID_HEIGHT, 'white'), 'cu
 assert_equal(screen_to_grid(76.9, 23, 50), 167)
 assert_equal(screen_to_grid(144.0, 43, 19), 63)
 assert_equal(screen_to_grid(23.4, 31, 103), 77)
+# Zooming in by 2 shows half as many squares, starting from the offset
+assert_equal(screen_to_grid(250, 500, 25, 100.5, 2.0), 106)
 
 ## Testing advance_color
-assert_equal(advance_color(), 'red')
\ No newline at end of file
+assert_equal(advance_color(), 'red')
+
+## Testing Grid
+# Only changes that actually change a color are remembered
+G0 = Grid(make_grid_color(2, 2, 'white'))
+assert_equal(G0.set_color(1, 0, 'red'), True)
+assert_equal(G0.set_color(1, 0, 'red'), False)
+assert_equal(G0, [['white', 'red'], ['white', 'white']])
+assert_equal(G0.generation, 1)
+G0.fill('black')
+assert_equal(G0.take_dirty(), (True, set()))
+assert_equal(G0, [['black', 'black'], ['black', 'black']])
+# Only the rows changed after a generation are reported
+G0.set_color(0, 1, 'red')
+assert_equal(G0.changed_rows(G0.generation - 1), [1])
+
+## Testing compile_type and Cisc108Game.check_world
+# A good world passes, and a missing or extra key, a wrong type or a bad list element fails
+T0 = {'grid': [[str]], 'count': int, 'zoom': float}
+K0 = compile_type(T0)
+assert_equal(K0({'grid': [['red']], 'count': 1, 'zoom': 2}), True)
+assert_equal([K0(world) for world in [{'grid': [['red']], 'count': 1, 'colour': 2.0},
+                                      {'grid': [['red']], 'count': 1, 'zoom': 2.0, 'extra': 0},
+                                      {'grid': [['red']], 'count': 'one', 'zoom': 2.0},
+                                      {'grid': [['red', 5]], 'count': 1, 'zoom': 2.0}]], [False] * 4)
+# A Grid is only checked again in the rows that changed, which still finds a bad value
+G9 = Grid(make_grid_color(3, 3, 'white'))
+W14 = {'grid': G9, 'count': 0, 'zoom': 1.0}
+assert_equal(K0(W14), True)
+G9.set_color(1, 2, 'red')
+assert_equal((G9.changed_rows(G9.generation - 1), K0(W14)), ([2], True))
+G9.set_color(0, 1, 7)
+assert_equal((G9.changed_rows(G9.generation - 1), K0(W14)), ([1], False))
+# The game stops with the same message _validate_type gives
+W15 = {'grid': Grid(make_grid_color(3, 3, 'white')), 'count': 0, 'zoom': 1.0}
+R2 = HeadlessRunner(Cisc108Game, T0, WINDOW_WIDTH, WINDOW_HEIGHT, GAME_TITLE, W15,
+                    lambda world: None, lambda world: world['grid'].set_color(2, 0, 8))
+try:
+    R2.send(('update',))
+    M0 = None
+except AssertionError as error:
+    M0 = str(error)
+assert_equal(M0, _validate_type(W15, T0, 'After on_update, world'))
+assert_equal(M0, "After on_update, world['grid'][0][2] was the wrong type. Expected type was 'string', but actual value was 8 ('integer').")
+
+## Testing PaletteGrid
+# It holds the same colors as a list of lists, one byte per cell
+P0 = make_grid_color(3, 2, 'white', packed=True)
+P0[1][2] = 'green'
+assert_equal(P0.to_lists(), [['white', 'white', 'white'], ['white', 'white', 'green']])
+assert_equal(P0.cells.nbytes, 6)
+assert_equal(P0.set_color(2, 1, 'green'), False)
+assert_equal(PaletteGrid.from_lists(P0.to_lists()).to_lists(), P0.to_lists())
+
+## Testing stroke_cells
+# A fast diagonal stroke still covers every square in between
+assert_equal([cells.tolist() for cells in stroke_cells([[0, 0], [3, 3]], 5, 5)], [[0, 1, 2, 3], [0, 1, 2, 3]])
+# Squares outside the grid are left out, and repeats only show up once
+assert_equal([cells.tolist() for cells in stroke_cells([[-2, 1], [1, 1], [0, 1]], 5, 5)], [[0, 1], [1, 1]])
+
+## Testing update_world with a queued stroke
+W2 = {
+    'grid': make_grid_color(5, 1, 'white', packed=True),
+    'current mouse x': 4,
+    'current mouse y': 0,
+    'stroke': [[4, 0]],
+    'last stroke x': 0,
+    'last stroke y': 0,
+    'values': [1],
+    'target': 0,
+    'hovering': None,
+    'draw': True,
+    'color': 'blue'}
+update_world(W2)
+assert_equal(W2['grid'].to_lists(), [['blue', 'blue', 'blue', 'blue', 'blue']])
+assert_equal(W2['stroke'], [])
+assert_equal((W2['last stroke x'], W2['last stroke y']), (4, 0))
+
+## Testing handle_mouse
+# Clicking the blue box selects blue, clicking the eraser selects white
+W3 = {'grid': make_grid_color(GRID_WIDTH, GRID_HEIGHT, 'white', packed=True), 'current mouse x': None, 'current mouse y': None, 'stroke': [], 'last stroke x': None, 'last stroke y': None, 'values': [1], 'target': 0, 'hovering': None, 'draw': False, 'color': 'red', 'history': History(), 'tool': 'pen', 'view x': 0.0, 'view y': 0.0, 'zoom': 1.0}
+handle_mouse(W3, 280, 470, 'left')
+assert_equal(W3['color'], 'blue')
+handle_mouse(W3, 480, 30, 'left')
+assert_equal(W3['color'], 'white')
+# Clicking in the middle of the grid doesn't change anything
+handle_mouse(W3, 250, 250, 'left')
+assert_equal(W3['color'], 'white')
+
+## Testing RegionIndex
+R0 = RegionIndex(10)
+R0.add(5, 5, 30, 10, ('color', 'red'))
+assert_equal(R0.find(31, 6), ('color', 'red'))
+assert_equal(R0.find(36, 6), None)
+
+## Testing encode_grid and decode_grid
+# A canvas comes back exactly the same, and a plain canvas takes few bytes
+P1 = make_grid_color(1000, 1000, 'white', packed=True)
+P1.paint_cells(numpy.arange(100, 200), numpy.arange(100, 200), 'purple')
+assert_equal(len(encode_grid(P1)) < 2000, True)
+assert_equal(decode_grid(encode_grid(P1)).cells.tolist(), P1.cells.tolist())
+assert_equal(decode_grid(encode_grid(make_grid_color(2, 2, 'red'))).to_lists(), [['red', 'red'], ['red', 'red']])
+# A damaged run color is reported as a ValueError
+D0 = bytearray(encode_grid(make_grid_color(2, 2, 'red')))
+D0[-5] = 3
+try:
+    decode_grid(bytes(D0))
+    M1 = None
+except ValueError as error:
+    M1 = str(error)
+assert_equal(M1, 'Canvas file is damaged: a run uses color 3, but the file only has 1')
+# So is a file cut off anywhere, in the colors or in the runs
+def decode_error(data):
+    try:
+        decode_grid(data)
+    except ValueError as error:
+        return str(error).split(':')[0]
+D3 = encode_grid(P1)
+assert_equal(sorted(set(decode_error(D3[:end]) for end in range(len(D3)))), ['Canvas file is damaged', 'Not a canvas file'])
+
+## Testing History
+# A stroke and a reset are undone and redone as whole steps
+P2 = make_grid_color(4, 2, 'white', packed=True)
+H0 = History()
+H0.attach(P2)
+P2.paint_cells(numpy.array([0, 1, 2]), numpy.array([1, 1, 1]), 'red')
+H0.end_step()
+P2.fill('black')
+assert_equal(H0.undo(), True)
+assert_equal(P2.to_lists(), [['white', 'white', 'white', 'white'], ['red', 'red', 'red', 'white']])
+assert_equal(H0.undo(), True)
+assert_equal(P2.to_lists(), [['white', 'white', 'white', 'white'], ['white', 'white', 'white', 'white']])
+assert_equal(H0.undo(), False)
+assert_equal(H0.redo(), True)
+assert_equal(P2.to_lists(), [['white', 'white', 'white', 'white'], ['red', 'red', 'red', 'white']])
+# Only the newest steps are kept
+H1 = History(max_steps=1)
+H1.attach(P2)
+P2.set_color(3, 0, 'blue')
+H1.end_step()
+P2.set_color(3, 0, 'green')
+H1.end_step()
+assert_equal(H1.undo(), True)
+assert_equal(H1.undo(), False)
+assert_equal(P2.get_color(3, 0), 'blue')
+# A step too big to keep on its own isn't kept at all, even while it is being made,
+# and the older steps are still there to undo
+H3 = History(max_cells=10)
+P7 = PaletteGrid(20, 20)
+H3.attach(P7)
+P7.set_color(0, 0, 'red')
+H3.end_step()
+P7.paint_cells(numpy.arange(8), numpy.full(8, 5), 'blue')
+P7.paint_cells(numpy.arange(8), numpy.full(8, 6), 'blue')
+P7.set_color(0, 7, 'blue')
+assert_equal((H3.size, H3.current), (1, []))
+assert_equal((H3.undo(), H3.undo(), P7.get_color(0, 0), P7.get_color(0, 5), P7.get_color(0, 7)), (True, False, 'white', 'blue', 'blue'))
+P7.set_color(1, 1, 'red')
+assert_equal((H3.undo(), P7.get_color(1, 1)), (True, 'white'))
+
+## Testing flood_cells
+# The fill stops at other colors and doesn't leak through corners
+P3 = PaletteGrid.from_lists([['white', 'red', 'white'], ['red', 'white', 'white'], ['white', 'white', 'red']])
+F0 = flood_cells(palette_indexes(P3), 1, 1)
+assert_equal(sorted(zip(F0[0].tolist(), F0[1].tolist())), [(0, 2), (1, 1), (1, 2), (2, 0), (2, 1)])
+
+## Testing fill_grid_region
+# Clicking the bucket selects the fill tool, and a fill is undone all at once
+W4 = {'grid': make_grid_color(GRID_WIDTH, GRID_HEIGHT, 'white', packed=True), 'current mouse x': None, 'current mouse y': None, 'stroke': [], 'last stroke x': None, 'last stroke y': None, 'values': [1], 'target': 0, 'hovering': None, 'draw': False, 'color': 'blue', 'history': History(), 'tool': 'pen', 'view x': 0.0, 'view y': 0.0, 'zoom': 1.0}
+W4['history'].attach(W4['grid'])
+W4['grid'].paint_cells(numpy.arange(GRID_WIDTH), numpy.full(GRID_WIDTH, 10), 'red')
+handle_mouse(W4, 120, 30, 'left')
+assert_equal(W4['tool'], 'fill')
+handle_mouse(W4, 250, 400, 'left')
+assert_equal(W4['grid'].get_color(0, GRID_HEIGHT-1), 'blue')
+assert_equal(W4['grid'].get_color(0, 0), 'white')
+W4['history'].undo()
+assert_equal(W4['grid'].get_color(0, GRID_HEIGHT-1), 'white')
+handle_mouse(W4, 120, 30, 'left')
+assert_equal(W4['tool'], 'pen')
+
+## Testing ChunkedGrid
+# A huge canvas only makes the chunks that get painted
+C0 = make_grid_color(10000, 10000, 'white', chunked=True)
+C0.paint_cells(numpy.array([0, 1, 9999]), numpy.array([0, 0, 9999]), 'red')
+assert_equal(len(C0.chunks), 2)
+assert_equal(C0.region(0, 0, 3, 1).tolist(), [[1, 1, 0]])
+assert_equal(C0[9999][9999], 'red')
+# Clearing it throws the chunks away, and undoing brings them back
+H2 = History()
+H2.attach(C0)
+C0.fill('black')
+assert_equal((len(C0.chunks), C0.get_color(5000, 5000)), (0, 'black'))
+H2.undo()
+assert_equal((len(C0.chunks), C0.get_color(1, 0), C0.get_color(2, 0)), (2, 'red', 'white'))
+
+## Testing zoom_view and move_view
+# Zooming keeps the middle of the window in place, and the view stays on the canvas
+W5 = {'grid': make_grid_color(100, 100, 'white', chunked=True), 'view x': 10.0, 'view y': 0.0, 'zoom': 1.0}
+zoom_view(W5, 2)
+assert_equal((W5['view x'], W5['view y'], W5['zoom']), (16.25, 6.25, 2.0))
+move_view(W5, 1000, -1000)
+assert_equal((W5['view x'], W5['view y']), (87.5, 0.0))
+# Panning while drawing starts a new stroke instead of joining up with the old spot
+W13 = dict(INITIAL_WORLD, grid=make_grid_color(500, 100, 'white', chunked=True), history=History(), draw=True, stroke=[])
+W13['history'].attach(W13['grid'])
+handle_motion(W13, 250, 250)
+update_world(W13)
+for _ in range(8):
+    handle_key(W13, arcade.key.RIGHT)
+handle_motion(W13, 251, 250)
+update_world(W13)
+assert_equal((canvas_stats(W13['grid']).color_counts()['red'], W13['last stroke x']), (2, 62))
+
+## Testing export_png
+# Every cell becomes a square of pixels, with the top row of the grid first
+P4 = PaletteGrid.from_lists([['red', 'white'], ['black', 'blue']])
+export_png(P4, 'test_export.png', 2, PALETTE_VALUES)
+with PIL.Image.open('test_export.png') as image:
+    assert_equal(numpy.array(image).tolist(), [[8, 8, 5, 5], [8, 8, 5, 5], [1, 1, 0, 0], [1, 1, 0, 0]])
+os.remove('test_export.png')
+# Only the painted part of a big canvas is exported, by a thread of its own
+W16 = dict(INITIAL_WORLD, grid=make_grid_color(5000, 5000, 'white', chunked=True))
+W16['grid'].paint_cells(numpy.array([100, 102]), numpy.array([4000, 4001]), 'red')
+export_canvas(W16, 'test_export.png').join()
+with PIL.Image.open('test_export.png') as image:
+    assert_equal((image.size, image.getpixel((0, 0)), image.getpixel((0, 2))), ((6, 4), 0, 1))
+os.remove('test_export.png')
+
+## Testing import_picture_into_view
+# The picture is shrunk to the window and matched to the closest colors
+PIL.Image.new('RGB', (50, 50), (250, 10, 10)).save('test_import.png')
+W6 = {'grid': make_grid_color(100, 100, 'white', chunked=True), 'history': History(), 'view x': 3.0, 'view y': 0.0, 'zoom': 1.0}
+import_picture_into_view(W6, 'test_import.png')
+assert_equal((W6['grid'].get_color(3, 0), W6['grid'].get_color(27, 24), W6['grid'].get_color(28, 24), W6['grid'].get_color(3, 25)), ('red', 'red', 'white', 'white'))
+os.remove('test_import.png')
+# The ready-made table agrees with matching every pixel
+P5 = numpy.array([[250, 250, 250], [5, 5, 5], [250, 160, 10]], dtype=numpy.uint8)
+assert_equal(ColorCube(PALETTE_VALUES).lookup(P5).tolist(), nearest_colors(P5, PALETTE_VALUES).tolist())
+assert_equal(nearest_colors(P5, PALETTE_VALUES).tolist(), [0, 8, 2])
+
+## Testing TextureCache
+# Files are only loaded once, so the same file and the same color give back the same texture
+T2 = TextureCache()
+T2.preload(['bucket.png'])
+B0 = T2.get('bucket.png')
+assert_equal((B0 is T2.get('bucket.png'), T2.get('eraser.png') is T2.get('eraser.png'), T2.square('red') is T2.square('red')), (True, True, True))
+assert_equal((T2.hits, T2.misses, len(T2.textures)), (4, 2, 2))
+assert_equal((T2.report()['hits'], T2.report()['misses']), (4, 2))
+# The old names for the squares still work, and only make the square when they are used
+import csquares
+assert_equal((len(COLORS), COLORS['brown'] is TEXTURES.square('brown'), csquares.RED is TEXTURES.square('red'), 'pink' in COLORS), (11, True, True, False))
+
+## Testing GridRenderer
+# After the first frame only the cells that changed are recolored, and another grid is compared in full
+P8 = make_grid_color(5, 4, 'white', packed=True)
+R5 = GridRenderer(P8)
+R5_CALLS = []
+R5_RECOLOR = R5.recolor
+R5.recolor = lambda x, y, index: R5_CALLS.append((x, y, PALETTE[index])) or R5_RECOLOR(x, y, index)
+P9 = make_grid_color(5, 4, 'white', packed=True)
+P9.set_color(4, 3, 'green')
+P9.take_dirty()
+with StandInArcade() as S6:
+    R5.draw(P8)
+    R5_FIRST = list(R5_CALLS)
+    P8.set_color(1, 2, 'red')
+    P8.set_color(3, 0, 'blue')
+    R5.draw(P8)
+    R5_DIRTY = sorted(R5_CALLS[len(R5_FIRST):])
+    R5.draw(P9)
+assert_equal((R5_FIRST, R5_DIRTY, R5_CALLS[-3:], R5.drawn_grid is P9, S6.calls['SpriteList.draw']),
+             ([], [(1, 2, 'red'), (3, 0, 'blue')], [(3, 0, 'white'), (1, 2, 'white'), (4, 3, 'green')], True, 3))
+assert_equal(R5.sprites[3*5 + 4].color, COLOR_VALUES['green'])
+
+## Testing ChunkRenderer
+# Recoloring only reads the grid, so it makes no chunks and doesn't copy the ones a snapshot shares
+G13 = make_grid_color(200, 200, 'white', chunked=True)
+G13.set_color(1, 1, 'red')
+R4 = ChunkRenderer()
+with StandInArcade():
+    R4.draw(G13, 0, 0, 100, 100)
+    S5 = G13.snapshot()
+    G13.mark_dirty(2, 1)
+    G13.mark_dirty(150, 150)
+    R4.draw(G13, 0, 0, 100, 100)
+assert_equal((list(G13.chunks), G13.chunks[0, 0] is S5.chunks[0, 0], R4.layers[0, 0][0][1*64 + 2].color), ([(0, 0)], True, PALETTE_VALUES[PALETTE_INDEX['white']]))
+
+## Testing PaletteLayer
+# The palette bar is only built again when the palette, the values, the hovering or the tool change
+L0 = PaletteLayer()
+L1 = []
+with StandInArcade():
+    for values, hovering, tool in [([1], None, 'pen'), ([1], None, 'pen'), ([1], 2, 'pen'), ([1], 2, 'pen'),
+                                   ([1], 2, 'fill'), ([1, 2], 2, 'fill'), ([1, 2], 2, 'fill')]:
+        L0.draw(values, hovering, tool)
+        L1.append(L0.shapes)
+    PALETTE_BAR[0] = 'brown'
+    L0.draw([1, 2], 2, 'fill')
+    PALETTE_BAR[0] = 'red'
+assert_equal([L1[index] is L1[index - 1] for index in range(1, len(L1))] + [L0.shapes is L1[-1]], [True, False, True, False, False, True, False])
+
+## Testing FrameTimer
+# Timing is off unless the game is given a timer
+assert_equal(HeadlessRunner(Cisc108GameUntyped, WINDOW_WIDTH, WINDOW_HEIGHT, GAME_TITLE, {}, lambda world: None, lambda world: None).game.timer, None)
+# Every call is recorded under the name of its callback, and a slow update misses the next frame
+F0 = FrameTimer(deadline=0.01)
+R3 = HeadlessRunner(Cisc108GameUntyped, WINDOW_WIDTH, WINDOW_HEIGHT, GAME_TITLE, {}, lambda world: None,
+                    lambda world: time.sleep(0.02), lambda world, key: None, timer=F0)
+R3.run([('update',), ('draw',), ('update',), ('key', 65)])
+assert_equal({name: sum(histogram) for name, histogram in F0.histograms.items()}, {'update_world': 2, 'draw_world': 1, 'handle_key': 1})
+assert_equal((F0.frames, F0.missed_frames, F0.longest['update_world'] >= 0.02), (2, 1, True))
+# The summary adds it all up, and the reports hold the same things
+U0 = F0.summary()
+assert_equal((U0['callbacks']['update_world']['calls'], sum(U0['callbacks']['update_world']['histogram'].values()), U0['frames'], U0['missed frames'], U0['deadline ms']), (2, 2, 2, 1, 10.0))
+F0.dump('test_timing.json')
+with open('test_timing.json') as timing_file:
+    assert_equal(json.load(timing_file) == U0, True)
+F0.dump('test_timing.csv')
+with open('test_timing.csv', newline='') as timing_file:
+    T1 = list(csv.reader(timing_file))
+assert_equal(([row[0] for row in T1], T1[1][1], T1[-1]), (['callback', 'update_world', 'draw_world', 'handle_key', 'frames', 'missed frames'], '2', ['missed frames', '1']))
+os.remove('test_timing.json')
+os.remove('test_timing.csv')
+
+## Testing EventRecorder and HeadlessRunner.replay
+# Replaying a recorded session from the same start ends with the same drawing
+W7 = dict(INITIAL_WORLD, grid=make_grid_color(100, 100, 'white', chunked=True), history=History(), stroke=[])
+R1 = EventRecorder('test_session.rec')
+HeadlessRunner(Cisc108GameUntyped, WINDOW_WIDTH, WINDOW_HEIGHT, GAME_TITLE, W7, draw_world, update_world, handle_key, handle_mouse, handle_motion, handle_release, recorder=R1).run(make_scribble(200, WINDOW_WIDTH, WINDOW_HEIGHT))
+R1.close()
+W8 = dict(INITIAL_WORLD, grid=make_grid_color(100, 100, 'white', chunked=True), history=History(), stroke=[])
+HeadlessRunner(Cisc108GameUntyped, WINDOW_WIDTH, WINDOW_HEIGHT, GAME_TITLE, W8, draw_world, update_world, handle_key, handle_mouse, handle_motion, handle_release).replay('test_session.rec')
+assert_equal(len(W7['grid'].chunks) > 0, True)
+assert_equal(W8['grid'].to_lists() == W7['grid'].to_lists(), True)
+os.remove('test_session.rec')
+# The 'c' key picks its color from the world, so a replay gets the same one, and pressing again picks another
+W13 = dict(INITIAL_WORLD, grid=make_grid_color(100, 100, 'white', chunked=True), color='red')
+W14 = dict(W13)
+handle_key(W13, ord('c'))
+handle_key(W14, ord('c'))
+C3 = W13['color']
+handle_key(W13, ord('c'))
+assert_equal((C3 == W14['color'], C3 == W13['color'], COLOR_VALUES[C3] == COLOR_VALUES[W13['color']]), (True, False, False))
+
+## Testing that the grid logic works without arcade
+# Tools can make and convert grids without loading arcade at all
+assert_equal(subprocess.run([sys.executable, '-c', 'import csquares_grid, csquares_io, sys; print("arcade" in sys.modules)'], capture_output=True, text=True).stdout.strip(), 'False')
+assert_equal(TEXTURES.square('red') is TEXTURES.square('red'), True)
+
+## Testing custom colors
+# Any red, green and blue can be painted, and is found by its '#rrggbb' name
+C1 = custom_color(18, 52, 86)
+assert_equal((C1, PALETTE[color_index(C1)], COLOR_VALUES[C1]), ('#123456', '#123456', (18, 52, 86)))
+assert_equal(color_index(custom_color(18, 52, 86)), color_index(C1))
+P6 = make_grid_color(3, 2, 'white', packed=True)
+P6[1][2] = C1
+assert_equal((P6[1][2], P6.cells.dtype == numpy.uint8), (C1, True))
+# Once there are more than 256 colors, the grids switch to two bytes per cell
+C2 = [custom_color(index, 200, 100) for index in range(256)]
+P6[0][0] = C2[-1]
+assert_equal((P6[0][0], P6[1][2], P6.cells.dtype == numpy.uint16), (C2[-1], C1, True))
+G6 = make_grid_color(100, 100, 'white', chunked=True)
+G6.paint_cells(numpy.array([1, 70]), numpy.array([1, 70]), C2[-1])
+assert_equal((G6[70][70], G6.chunks[0, 0].dtype == numpy.uint8, G6.chunks[1, 1].dtype == numpy.uint16), (C2[-1], False, True))
+# A chunk that is already two bytes is painted in place, unless a snapshot shares it
+K1 = G6.chunks[1, 1]
+G6.set_color(71, 71, C2[-2])
+S4 = G6.snapshot()
+G6.set_color(72, 72, C2[-2])
+assert_equal((K1 is S4.chunks[1, 1], G6.chunks[1, 1] is K1, S4[72][72]), (True, False, 'white'))
+# Saving writes only the colors the grid uses, so the run colors stay one byte
+assert_equal(decode_grid(encode_grid(P6)).to_lists(), P6.to_lists())
+assert_equal(len(encode_grid(P6)), 15 + (1 + 5) + (1 + 7) + (1 + 7) + 4 + 3 * (1 + 4))
+# Exported pictures with this many colors have red, green and blue for every pixel
+export_png(P6, 'test_export.png', 1, PALETTE_VALUES)
+with PIL.Image.open('test_export.png') as image:
+    assert_equal(numpy.array(image)[:, :, :3].tolist(), [[[255, 255, 255], [255, 255, 255], [18, 52, 86]], [[255, 200, 100], [255, 255, 255], [255, 255, 255]]])
+os.remove('test_export.png')
+# A square is only made the first time its color is asked for
+T1 = TextureCache()
+T1.square(C1), T1.square('red'), T1.square(C1)
+assert_equal((list(T1.squares), T1.report()['misses'], T1.report()['hits']), ([C1, 'red'], 2, 1))
+
+## Testing the shared canvas
+# A delta only holds runs of cells, and reads back the same
+D1 = encode_delta(numpy.array([5, 6, 7, 20, 8]), numpy.array([PALETTE_INDEX['red']] * 3 + [PALETTE_INDEX['blue'], PALETTE_INDEX['red']]), 'white')
+assert_equal([value.tolist() if hasattr(value, 'tolist') else value for value in decode_delta(D1)], ['white', [5, 6, 7, 8, 20], [PALETTE_INDEX['red']] * 4 + [PALETTE_INDEX['blue']]])
+assert_equal(len(encode_delta(numpy.arange(100000), numpy.zeros(100000))) < 30, True)
+# Deltas that go past the end of the grid, or use colors they don't name, are turned down
+def delta_error(grid, body):
+    try:
+        apply_delta(grid, body)
+    except ValueError as error:
+        return str(error).split(':')[0]
+G11 = make_grid_color(100, 100, 'white', chunked=True)
+D2 = bytearray(encode_delta(numpy.array([5]), numpy.array([PALETTE_INDEX['red']])))
+assert_equal([delta_error(G11, body) for body in [encode_delta(numpy.array([10**6]), numpy.array([1])),
+                                                  encode_delta(numpy.arange(9990, 10010), numpy.ones(20)),
+                                                  bytes(D2[:-10]), bytes(D2[:-10] + b'\x05\x00' + D2[-8:])]],
+             ['Delta goes past the end of a grid of 10000 cells'] * 2 + ['buffer is smaller than requested size', 'Delta is damaged'])
+assert_equal(delta_error(G11, bytes(D2).replace(b'\x03red', b'\x03rod')), "Delta uses the unknown color 'rod'")
+assert_equal((G11.chunks, G11.generation), ({}, 0))
+# A game joining a server gets its canvas, and its strokes reach the server
+S1 = CanvasServer(make_grid_color(100, 100, 'white', chunked=True), tick_rate=100)
+S1.grid.set_color(50, 50, 'green')
+S1_LOOP = asyncio.new_event_loop()
+threading.Thread(target=S1_LOOP.run_forever, daemon=True).start()
+asyncio.run_coroutine_threadsafe(S1.start('localhost:0'), S1_LOOP).result(10)
+W9 = dict(INITIAL_WORLD, grid=make_grid_color(100, 100, 'white', chunked=True), history=History(), stroke=[], share=SharedCanvas(S1.address()))
+time.sleep(0.2)
+update_world(W9)
+assert_equal((W9['grid'].get_color(50, 50), W9['history'].grid is W9['grid']), ('green', True))
+paint_grid_cells(W9['grid'], numpy.array([1, 2, 3]), numpy.array([4, 4, 4]), dict(W9, color='red'))
+make_grid_white(W9)
+paint_grid_cells(W9['grid'], numpy.array([7]), numpy.array([8]), dict(W9, color='blue'))
+time.sleep(0.2)
+assert_equal((S1.grid.get_color(2, 4), S1.grid.get_color(50, 50), S1.grid.get_color(7, 8)), ('white', 'white', 'blue'))
+# Everything the server changed comes back to the game too
+update_world(W9)
+assert_equal(W9['grid'].to_lists() == S1.grid.to_lists(), True)
+W9['share'].close()
+asyncio.run_coroutine_threadsafe(S1.close(), S1_LOOP).result(10)
+
+## Testing snapshots and the Autosaver
+# A snapshot shares the chunks, but keeps its colors when the grid changes
+G7 = make_grid_color(200, 200, 'white', chunked=True)
+G7.set_color(5, 5, 'red')
+S2 = G7.snapshot()
+assert_equal(S2.chunks[0, 0] is G7.chunks[0, 0], True)
+G7.paint_cells(numpy.array([5, 6]), numpy.array([5, 5]), 'blue')
+G7.fill('green')
+assert_equal((S2.get_color(5, 5), S2.get_color(6, 5), S2.get_color(150, 150), G7.get_color(5, 5)), ('red', 'white', 'white', 'green'))
+# The starting grid isn't saved until it changes, and the file holds the whole grid
+A1 = Autosaver('test_autosave.csq', interval=1000, changes=1)
+assert_equal((A1.update(G7), A1.update(G7)), (False, False))
+time.sleep(0.1)
+assert_equal(os.path.exists('test_autosave.csq'), False)
+G7.set_color(199, 199, 'black')
+assert_equal(A1.update(G7), True)
+G7.set_color(0, 0, 'black')
+A1.close()
+assert_equal((restore('test_autosave.csq').to_lists() == G7.to_lists(), os.path.exists('test_autosave.csq.tmp')), (True, False))
+# Swapping in another grid (a loaded one, say) replaces the autosaved drawing
+A2 = Autosaver('test_autosave.csq', interval=1000, changes=1000)
+assert_equal(A2.update(G7), False)
+G10 = make_grid_color(200, 200, 'purple', chunked=True)
+assert_equal(A2.update(G10), True)
+A2.close()
+assert_equal(restore('test_autosave.csq').get_color(5, 5), 'purple')
+# Ending the game normally removes the autosave, and closing twice is fine
+A3 = Autosaver('test_autosave.csq')
+A3.update(G7)
+A3.close(remove=True)
+A3.close()
+assert_equal(os.path.exists('test_autosave.csq'), False)
+
+## Testing brush_cells
+# Round brushes leave the corners out, and everything is cut to the grid
+assert_equal(brush_stamp('circle', 3).tolist(), [[False, True, False], [True, True, True], [False, True, False]])
+assert_equal([cells.tolist() for cells in brush_cells([[0, 0], [1, 0]], 4, 4, 'square', 3)], [[0, 1, 2, 0, 1, 2], [0, 0, 0, 1, 1, 1]])
+assert_equal(len(brush_cells([[10, 10], [30, 10]], 100, 100, 'circle', 8)[0]), len(brush_cells([[10, 10]], 100, 100, 'circle', 8)[0]) + 20 * 8)
+# The spray only lands some of its dabs, the same way each time at the same spot
+S3 = brush_cells([[50, 50]], 100, 100, 'spray', 16)
+assert_equal((0 < len(S3[0]) < 100, S3[0].tolist() == brush_cells([[50, 50]], 100, 100, 'spray', 16)[0].tolist()), (True, True))
+# The keys pick the brush and step through the sizes
+W10 = dict(INITIAL_WORLD)
+handle_key(W10, ord('2'))
+handle_key(W10, ord(']'))
+handle_key(W10, ord(']'))
+assert_equal((W10['brush'], W10['brush size']), ('circle', 4))
+
+## Testing the shape tools
+# Rectangles and ellipses fit between the two corners
+assert_equal(shape_points('rectangle', 1, 2, 3, 4), [[1, 2], [3, 2], [3, 4], [1, 4], [1, 2]])
+assert_equal(len(shape_cells('rectangle', 1, 1, 4, 3, 10, 10)[0]), 10)
+E1 = shape_cells('ellipse', 0, 0, 8, 4, 20, 20)
+assert_equal((int(E1[0].min()), int(E1[0].max()), int(E1[1].min()), int(E1[1].max())), (0, 8, 0, 4))
+# Moving the mouse only moves the preview, the second click paints the shape as one change
+W11 = dict(INITIAL_WORLD, grid=make_grid_color(100, 100, 'white', chunked=True), history=History(), color='blue')
+W11['history'].attach(W11['grid'])
+handle_key(W11, ord('n'))
+handle_mouse(W11, 10, 200, 'left')
+handle_motion(W11, 250, 200)
+assert_equal((W11['tool'], W11['shape start'], W11['shape end'], len(W11['grid'].chunks)), ('line', [0, 10], [12, 10], 0))
+handle_mouse(W11, 250, 200, 'left')
+assert_equal(([W11['grid'].get_color(x, 10) for x in (0, 12, 13)], W11['shape start']), (['blue', 'blue', 'white'], []))
+W11['history'].undo()
+assert_equal(W11['grid'].get_color(6, 10), 'white')
+# Switching tools starts the next pen stroke fresh, with the bucket too
+W11['draw'], W11['last stroke x'], W11['last stroke y'] = True, 5, 5
+handle_key(W11, ord('n'))
+assert_equal((W11['tool'], W11['last stroke x'], W11['last stroke y']), ('pen', None, None))
+W11['last stroke x'], W11['last stroke y'] = 5, 5
+handle_mouse(W11, 120, 40, 'left')
+assert_equal((W11['tool'], W11['last stroke x'], W11['last stroke y']), ('fill', None, None))
+
+## Testing the canvas stats
+# The counts follow strokes, fills and undo without looking at the whole grid again
+G8 = make_grid_color(300, 200, 'white', chunked=True)
+H2 = History()
+H2.attach(G8)
+C1 = canvas_stats(G8)
+G8.paint_cells(numpy.arange(10, 20), numpy.full(10, 150), 'red')
+G8.set_color(250, 5, 'blue')
+assert_equal((C1.color_counts(), C1.bounds()), ({'white': 59989, 'red': 10, 'blue': 1}, (10, 5, 251, 151)))
+G8.set_color(250, 5, 'white')
+assert_equal((C1.bounds(), round(C1.coverage(), 3)), ((10, 150, 20, 151), 0.017))
+H2.end_step()
+G8.fill('green')
+assert_equal((C1.color_counts(), C1.bounds()), ({'green': 60000}, (0, 0, 300, 200)))
+H2.undo()
+assert_equal((C1.color_counts(), C1.bounds(), canvas_stats(G8) is C1), ({'white': 59990, 'red': 10}, (10, 150, 20, 151), True))
+# A block that hangs off the grid is only counted where it lands
+for G12 in [make_grid_color(10, 10, 'white', chunked=True), make_grid_color(10, 10, 'white', packed=True)]:
+    C4 = canvas_stats(G12)
+    G12.write_region(-2, -3, numpy.full((5, 4), PALETTE_INDEX['red']))
+    assert_equal((C4.color_counts(), C4.bounds(), G12.get_color(1, 1), G12.get_color(2, 1)), ({'white': 96, 'red': 4}, (0, 0, 2, 2), 'red', 'white'))
+    G12.write_region(8, 9, numpy.full((3, 3), PALETTE_INDEX['blue']))
+    assert_equal((C4.color_counts()['blue'], C4.bounds(), G12.get_color(9, 9)), (2, (0, 0, 10, 10), 'blue'))
+# The palette bar text, turned on and off with 'h'
+W12 = dict(INITIAL_WORLD, grid=G8)
+handle_key(W12, ord('h'))
+assert_equal((W12['show stats'], stats_text(G8)), (True, '0.0% painted, 2 colors, 10x1'))